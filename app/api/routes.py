@@ -1,27 +1,50 @@
 """
 API endpoints для сервиса сравнения OCR моделей
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request
+from fastapi.responses import FileResponse, HTMLResponse, Response, StreamingResponse
+from functools import partial
 from pathlib import Path
-import shutil
-import uuid
+from typing import List, Optional, Tuple
+import asyncio
+import json
 import os
+import uuid
 import logging
 
 from app.models.schemas import (
     UploadResponse,
+    BatchUploadResponse,
+    RejectedUpload,
     StatusResponse,
-    ComparisonResponse
+    ComparisonResponse,
+    BatchResponse,
+    BatchStatusResponse,
+    BatchDocumentResult,
+    BatchResultsResponse
 )
 from app.services.comparison import OCRComparisonService
+from app.services.alignment import ALIGNMENT_MODES
+from app.services.diff_engines import ENGINES
+from app.services.html_cache import HTMLCache
+from app.services.job_queue import JobQueue
+from app.services.uploads import (
+    ALLOWED_EXTENSIONS,
+    UploadTooLarge,
+    max_batch_size,
+    max_file_size,
+    save_archive,
+    save_document
+)
 from app.utils.visualizer import HTMLVisualizer
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["OCR Comparison"])
 
-# Будет инициализирован в main.py
+# Будут инициализированы в main.py
 _ocr_service: OCRComparisonService = None
+_job_queue: JobQueue = None
 
 
 def get_ocr_service() -> OCRComparisonService:
@@ -40,8 +63,25 @@ def set_ocr_service(service: OCRComparisonService):
     _ocr_service = service
 
 
+def get_job_queue() -> JobQueue:
+    """Dependency для получения очереди задач"""
+    if _job_queue is None:
+        raise HTTPException(
+            status_code=500,
+            detail="Очередь задач не инициализирована"
+        )
+    return _job_queue
+
+
+def set_job_queue(queue: JobQueue):
+    """Установка глобальной очереди задач"""
+    global _job_queue
+    _job_queue = queue
+
+
 @router.post("/upload", response_model=UploadResponse)
 async def upload_document(
+    request: Request,
     file: UploadFile = File(...),
     service: OCRComparisonService = Depends(get_ocr_service)
 ) -> UploadResponse:
@@ -49,105 +89,376 @@ async def upload_document(
     Загрузка документа для обработки.
     
     Поддерживаемые форматы: PDF, PNG, JPG, JPEG, TIFF
-    Максимальный размер: 10MB
+    Максимальный размер: MAX_FILE_SIZE (по умолчанию 10MB)
     """
     # Проверка расширения файла
-    allowed_extensions = {'.pdf', '.png', '.jpg', '.jpeg', '.tiff'}
-    file_ext = Path(file.filename).suffix.lower()
+    file_ext = Path(file.filename or '').suffix.lower()
     
-    if file_ext not in allowed_extensions:
+    if file_ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
-            detail=f"Неподдерживаемый формат файла. Разрешены: {', '.join(allowed_extensions)}"
+            detail=f"Неподдерживаемый формат файла. Разрешены: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
         )
     
-    # Генерация ID задачи
-    task_id = str(uuid.uuid4())
-    
-    # Сохранение файла
-    upload_dir = Path(os.getenv("UPLOAD_DIR", "./uploads"))
-    upload_dir.mkdir(exist_ok=True)
-    
-    file_path = upload_dir / f"{task_id}_{file.filename}"
+    max_bytes = max_file_size()
+    _check_content_length(request, max_bytes)
     
     try:
-        # Сохраняем файл на диск
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        logger.info(f"Файл {file.filename} загружен как {file_path}")
+        # Пишем частями, не блокируя event loop; размер проверяется на лету
+        saved = await save_document(file, service.documents, max_bytes)
         
-        return UploadResponse(
-            task_id=task_id,
-            filename=file.filename,
-            message="Файл успешно загружен. Используйте /api/process/{task_id} для начала обработки."
-        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
         
     except Exception as e:
         logger.error(f"Ошибка при загрузке файла: {e}")
-        
-        # Удаляем частично загруженный файл
-        if file_path.exists():
-            file_path.unlink()
-        
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка при загрузке файла: {str(e)}"
         )
     finally:
-        file.file.close()
+        await file.close()
+    
+    return UploadResponse(
+        task_id=saved.task_id,
+        filename=saved.filename,
+        message="Файл успешно загружен. Используйте /api/process/{task_id} для начала обработки.",
+        size=saved.size,
+        sha256=saved.sha256
+    )
+
+
+@router.post("/upload/batch", response_model=BatchUploadResponse)
+async def upload_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    service: OCRComparisonService = Depends(get_ocr_service)
+) -> BatchUploadResponse:
+    """
+    Пакетная загрузка: несколько документов и/или ZIP-архивов одним запросом.
+    
+    Каждый документ получает свою задачу. Лимиты: MAX_FILE_SIZE на документ,
+    MAX_BATCH_SIZE на пакет, MAX_BATCH_FILES документов. Повторы одного и
+    того же содержимого (по SHA-256) внутри пакета отклоняются.
+    """
+    uploads, rejected = await _save_uploads(request, files, service)
+    
+    return BatchUploadResponse(uploads=uploads, rejected=rejected)
+
+
+async def _save_uploads(
+    request: Request,
+    files: List[UploadFile],
+    service: OCRComparisonService
+) -> Tuple[List[UploadResponse], List[RejectedUpload]]:
+    """Сохраняет документы и ZIP-архивы пакета с учетом лимитов"""
+    max_bytes = max_file_size()
+    max_total = max_batch_size()
+    max_files = int(os.getenv("MAX_BATCH_FILES", "50"))
+    _check_content_length(request, max_total)
+    
+    saved = []
+    rejected: List[RejectedUpload] = []
+    total = 0
+    
+    try:
+        for upload in files:
+            name = upload.filename or ''
+            file_ext = Path(name).suffix.lower()
+            remaining = max_total - total
+            
+            try:
+                if file_ext == '.zip':
+                    documents, skipped = await save_archive(
+                        upload, service.documents, max_bytes, remaining, max_files - len(saved)
+                    )
+                    rejected.extend(RejectedUpload(filename=n, reason=r) for n, r in skipped)
+                elif file_ext in ALLOWED_EXTENSIONS:
+                    if len(saved) >= max_files:
+                        rejected.append(RejectedUpload(
+                            filename=name,
+                            reason=f"Превышено количество файлов в пакете ({max_files})"
+                        ))
+                        continue
+                    documents = [await save_document(upload, service.documents, min(max_bytes, remaining))]
+                else:
+                    rejected.append(RejectedUpload(filename=name, reason="Неподдерживаемый формат файла"))
+                    continue
+            except UploadTooLarge as e:
+                rejected.append(RejectedUpload(filename=name, reason=str(e)))
+                continue
+            
+            for document in documents:
+                total += document.size
+                saved.append(document)
+    finally:
+        for upload in files:
+            await upload.close()
+    
+    # Одинаковое содержимое внутри пакета обрабатываем один раз
+    uploads = []
+    seen = {}
+    for document in saved:
+        if document.sha256 in seen:
+            await service.documents.adelete(document.task_id)
+            rejected.append(RejectedUpload(
+                filename=document.filename,
+                reason=f"Дубликат {seen[document.sha256]}"
+            ))
+            continue
+        seen[document.sha256] = document.filename
+        uploads.append(UploadResponse(
+            task_id=document.task_id,
+            filename=document.filename,
+            message="Файл успешно загружен",
+            size=document.size,
+            sha256=document.sha256
+        ))
+    
+    logger.info(f"Пакетная загрузка: принято {len(uploads)}, отклонено {len(rejected)}")
+    
+    return uploads, rejected
+
+
+def _check_content_length(request: Request, max_bytes: int) -> None:
+    """Отклоняет заведомо слишком большой запрос до чтения тела"""
+    content_length = request.headers.get("content-length")
+    # Запас на заголовки multipart
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + 64 * 1024:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Размер запроса превышает допустимые {max_bytes} байт"
+        )
 
 
 @router.post("/process/{task_id}", response_model=StatusResponse)
 async def process_document(
     task_id: str,
-    service: OCRComparisonService = Depends(get_ocr_service)
+    engine: Optional[str] = None,
+    mode: Optional[str] = None,
+    priority: int = 0,
+    service: OCRComparisonService = Depends(get_ocr_service),
+    queue: JobQueue = Depends(get_job_queue)
 ) -> StatusResponse:
     """
-    Запуск обработки документа через все OCR модели.
+    Постановка документа в очередь обработки через все OCR модели.
+    
+    Обработку выполняют worker-процессы (python -m app.worker) или
+    встроенный worker API. Используйте /api/status/{task_id} для проверки статуса.
     
-    Обработка выполняется асинхронно.
-    Используйте /api/status/{task_id} для проверки статуса.
+    Args:
+        task_id: ID задачи
+        engine: Движок выравнивания: difflib, myers или anchored
+            (по умолчанию ALIGNMENT_ENGINE)
+        mode: Режим сравнения: char (посимвольно) или word (по токенам,
+            с WER в статистике; быстрее на длинных документах; различия
+            только в пробелах не подсвечиваются) (по умолчанию ALIGNMENT_MODE)
+        priority: Приоритет в очереди (больше - раньше)
     """
-    upload_dir = Path(os.getenv("UPLOAD_DIR", "./uploads"))
+    _check_engine(engine)
+    _check_mode(mode)
     
-    # Ищем файл по task_id
-    files = list(upload_dir.glob(f"{task_id}_*"))
+    # Ищем файл по индексу документов
+    document = await service.documents.alookup(task_id)
     
-    if not files:
+    if document is None:
         raise HTTPException(
             status_code=404,
             detail=f"Файл для задачи {task_id} не найден"
         )
     
-    file_path = files[0]
-    filename = file_path.name.replace(f"{task_id}_", "")
-    
-    # Запускаем обработку в фоне
-    # В продакшене лучше использовать Celery или похожий task queue
-    import asyncio
+    filename = document.filename
     
-    async def background_process():
-        try:
-            await service.process_document(
-                str(file_path),
-                filename,
-                task_id
-            )
-        except Exception as e:
-            logger.error(f"Ошибка обработки {task_id}: {e}")
+    payload = {
+        'file_path': str(document.path.resolve()),
+        'filename': filename,
+        'alignment_engine': engine,
+        'alignment_mode': mode
+    }
     
-    # Создаем задачу (не ждем завершения)
-    asyncio.create_task(background_process())
+    # Задача записывается в хранилище в транзакции постановки: worker не
+    # начнет ее раньше, а повторный запрос не затрет выполняющуюся
+    enqueued = await asyncio.to_thread(
+        queue.enqueue,
+        task_id,
+        payload,
+        priority,
+        on_enqueue=partial(service.task_store.create, task_id, filename, status='pending')
+    )
+    if not enqueued:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Задача {task_id} уже в очереди или обрабатывается"
+        )
+    await asyncio.to_thread(service.documents.touch, task_id)
     
     return StatusResponse(
         task_id=task_id,
-        status="processing",
+        status="pending",
         progress=0,
-        message="Обработка запущена"
+        message="Задача поставлена в очередь"
+    )
+
+
+def _check_engine(engine: Optional[str]) -> None:
+    """Проверяет название движка выравнивания"""
+    if engine is not None and engine not in ENGINES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестный движок выравнивания. Доступны: {', '.join(ENGINES)}"
+        )
+
+
+def _check_mode(mode: Optional[str]) -> None:
+    """Проверяет режим сравнения"""
+    if mode is not None and mode not in ALIGNMENT_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестный режим сравнения. Доступны: {', '.join(ALIGNMENT_MODES)}"
+        )
+
+
+@router.post("/batch", response_model=BatchResponse)
+async def create_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    engine: Optional[str] = None,
+    mode: Optional[str] = None,
+    priority: int = 0,
+    service: OCRComparisonService = Depends(get_ocr_service),
+    queue: JobQueue = Depends(get_job_queue)
+) -> BatchResponse:
+    """
+    Пакет документов: загрузка (документы и/или ZIP-архивы) и постановка
+    всех документов в очередь одним запросом.
+    
+    Документы пакета обрабатываются вперемешку с другими пакетами:
+    очередь выдает задачи пакетов по очереди (не больше
+    JOB_BATCH_MAX_IN_FLIGHT одновременно), а страницы распределяются
+    между документами каждого провайдера по кругу.
+    Используйте /api/batch/{batch_id} для сводного статуса.
+    
+    Args:
+        engine: Движок выравнивания для всех документов пакета
+        mode: Режим сравнения для всех документов пакета (char или word)
+        priority: Приоритет в очереди (больше - раньше)
+    """
+    _check_engine(engine)
+    _check_mode(mode)
+    
+    uploads, rejected = await _save_uploads(request, files, service)
+    
+    if not uploads:
+        raise HTTPException(
+            status_code=400,
+            detail="Ни один файл пакета не принят: " + "; ".join(
+                f"{item.filename}: {item.reason}" for item in rejected
+            )
+        )
+    
+    batch_id = str(uuid.uuid4())
+    task_ids = [upload.task_id for upload in uploads]
+    await asyncio.to_thread(service.task_store.create_batch, batch_id, task_ids)
+    
+    for upload in uploads:
+        document = await service.documents.alookup(upload.task_id)
+        await asyncio.to_thread(
+            queue.enqueue,
+            upload.task_id,
+            {
+                'file_path': str(document.path.resolve()),
+                'filename': upload.filename,
+                'alignment_engine': engine,
+                'alignment_mode': mode,
+                'batch_id': batch_id
+            },
+            priority,
+            batch_id,
+            on_enqueue=partial(service.task_store.create, upload.task_id, upload.filename, status='pending')
+        )
+    
+    logger.info(f"Пакет {batch_id}: {len(task_ids)} документов поставлено в очередь")
+    
+    return BatchResponse(batch_id=batch_id, uploads=uploads, rejected=rejected)
+
+
+@router.get("/batch/{batch_id}", response_model=BatchStatusResponse)
+async def get_batch_status(
+    batch_id: str,
+    service: OCRComparisonService = Depends(get_ocr_service)
+) -> BatchStatusResponse:
+    """
+    Сводный статус пакета: количество документов по статусам,
+    средний прогресс и статус каждого документа.
+    """
+    batch = await asyncio.to_thread(service.task_store.get_batch, batch_id)
+    
+    if batch is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Пакет {batch_id} не найден"
+        )
+    
+    documents = []
+    counts = {}
+    for task_id in batch['task_ids']:
+        task_info = await asyncio.to_thread(service.get_task_status, task_id)
+        if task_info['status'] == 'not_found':
+            continue
+        document = _status_response(task_id, task_info)
+        documents.append(document)
+        counts[document.status] = counts.get(document.status, 0) + 1
+    
+    finished = counts.get('completed', 0) + counts.get('failed', 0)
+    
+    return BatchStatusResponse(
+        batch_id=batch_id,
+        status='completed' if finished == len(documents) else 'processing',
+        progress=sum(document.progress for document in documents) // len(documents) if documents else 100,
+        total=len(documents),
+        counts=counts,
+        documents=documents
     )
 
 
+@router.get("/batch/{batch_id}/results", response_model=BatchResultsResponse)
+async def get_batch_results(
+    batch_id: str,
+    service: OCRComparisonService = Depends(get_ocr_service)
+) -> BatchResultsResponse:
+    """
+    Результаты пакета: статистика по провайдерам для каждого документа.
+    Полный результат документа - /api/results/{task_id}.
+    """
+    batch = await asyncio.to_thread(service.task_store.get_batch, batch_id)
+    
+    if batch is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Пакет {batch_id} не найден"
+        )
+    
+    documents = []
+    for task_id in batch['task_ids']:
+        task = await asyncio.to_thread(service.task_store.get, task_id)
+        if task is None:
+            continue
+        
+        statistics = None
+        if task['status'] == 'completed':
+            statistics = await service.task_store.aget_statistics(task_id)
+        
+        documents.append(BatchDocumentResult(
+            task_id=task_id,
+            filename=task['filename'],
+            status=task['status'],
+            error=task['error'],
+            statistics=statistics or []
+        ))
+    
+    return BatchResultsResponse(batch_id=batch_id, documents=documents)
+
+
 @router.get("/status/{task_id}", response_model=StatusResponse)
 async def get_status(
     task_id: str,
@@ -155,8 +466,11 @@ async def get_status(
 ) -> StatusResponse:
     """
     Получить статус обработки документа.
+    
+    Прогресс считается по готовым страницам всех провайдеров.
+    Для получения страниц по мере распознавания используйте /api/events/{task_id}.
     """
-    task_info = service.get_task_status(task_id)
+    task_info = await asyncio.to_thread(service.get_task_status, task_id)
     
     if task_info['status'] == 'not_found':
         raise HTTPException(
@@ -164,22 +478,114 @@ async def get_status(
             detail=f"Задача {task_id} не найдена"
         )
     
-    # Определяем прогресс
-    progress_map = {
-        'pending': 0,
-        'processing': 50,
-        'completed': 100,
-        'failed': 0
-    }
+    return _status_response(task_id, task_info)
+
+
+def _status_response(task_id: str, task_info: dict) -> StatusResponse:
+    """Статус задачи из OCRComparisonService.get_task_status"""
+    progress = task_info.get('progress') or {}
+    
+    if task_info['status'] == 'completed':
+        percent = 100
+    elif task_info['status'] == 'pending':
+        percent = 0
+    else:
+        percent = progress.get('percent', 0)
     
     return StatusResponse(
         task_id=task_id,
         status=task_info['status'],
-        progress=progress_map.get(task_info['status'], 0),
-        message=task_info.get('message')
+        progress=percent,
+        message=task_info.get('message'),
+        pages_done=progress.get('done'),
+        pages_total=progress.get('total')
+    )
+
+
+@router.get("/events/{task_id}")
+async def stream_events(
+    task_id: str,
+    request: Request,
+    service: OCRComparisonService = Depends(get_ocr_service)
+):
+    """
+    Поток событий обработки (Server-Sent Events).
+    
+    События: plan, page (текст страницы провайдера сразу после
+    распознавания), provider, stage и последним - status
+    (completed/failed). Переподключение продолжает с Last-Event-ID.
+    """
+    store = service.task_store
+    
+    if await asyncio.to_thread(store.get, task_id) is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Задача {task_id} не найдена"
+        )
+    
+    try:
+        last_seq = int(request.headers.get("last-event-id", "0"))
+    except ValueError:
+        last_seq = 0
+    
+    poll_interval = float(os.getenv("EVENTS_POLL_INTERVAL", "0.5"))
+    
+    async def event_stream():
+        seq = last_seq
+        idle = 0.0
+        
+        while True:
+            events = await asyncio.to_thread(store.get_events, task_id, seq)
+            
+            for event in events:
+                seq = event['seq']
+                yield _sse(event['kind'], event['data'], seq)
+            
+            if events:
+                idle = 0.0
+                continue
+            
+            task = await asyncio.to_thread(store.get, task_id)
+            if task is None or task['status'] in ('completed', 'failed'):
+                # Дочитываем события, записанные перед сменой статуса
+                for event in await asyncio.to_thread(store.get_events, task_id, seq, 10000):
+                    seq = event['seq']
+                    yield _sse(event['kind'], event['data'], seq)
+                
+                yield _sse('status', {
+                    'status': task['status'] if task else 'not_found',
+                    'error': task.get('error') if task else None
+                })
+                return
+            
+            if await request.is_disconnected():
+                return
+            
+            # Комментарий держит соединение через прокси
+            idle += poll_interval
+            if idle >= 15:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            
+            await asyncio.sleep(poll_interval)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 
+def _sse(event: str, data: dict, seq: Optional[int] = None) -> str:
+    """Форматирует одно SSE-сообщение"""
+    lines = []
+    if seq is not None:
+        lines.append(f"id: {seq}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
 @router.get("/results/{task_id}", response_model=ComparisonResponse)
 async def get_results(
     task_id: str,
@@ -193,7 +599,7 @@ async def get_results(
         task_id: ID задачи
         include_html: Включить HTML визуализацию (по умолчанию True)
     """
-    task_info = service.get_task_status(task_id)
+    task_info = await asyncio.to_thread(service.get_task_status, task_id)
     
     if task_info['status'] == 'not_found':
         raise HTTPException(
@@ -207,8 +613,8 @@ async def get_results(
             detail=f"Обработка еще не завершена. Статус: {task_info['status']}"
         )
     
-    # Получаем результат из кэша задачи
-    result = service.tasks[task_id].get('result')
+    # Загружаем результат из хранилища задач (блобы распаковываются здесь)
+    result = await service.task_store.aget_result(task_id)
     
     if not result:
         raise HTTPException(
@@ -216,14 +622,15 @@ async def get_results(
             detail="Результаты не найдены"
         )
     
-    # Добавляем HTML визуализацию если нужно
-    if include_html and not result.html_visualization:
+    # HTML визуализация - из кэша на диске (рендерится при первом запросе)
+    if include_html:
         try:
-            html = HTMLVisualizer.generate_html(
-                result.comparison,
-                result.filename
+            result.html_visualization = await asyncio.to_thread(
+                service.html_cache.read,
+                task_id,
+                HTMLCache.key(task_id, task_info['started_at']),
+                HTMLVisualizer.iter_html(result.comparison, result.filename)
             )
-            result.html_visualization = html
         except Exception as e:
             logger.error(f"Ошибка генерации HTML: {e}")
     
@@ -233,15 +640,17 @@ async def get_results(
 @router.get("/compare/{task_id}/html")
 async def get_html_visualization(
     task_id: str,
+    request: Request,
     service: OCRComparisonService = Depends(get_ocr_service)
 ):
     """
     Получить HTML визуализацию сравнения.
-    Возвращает готовую HTML страницу для отображения в браузере.
-    """
-    from fastapi.responses import HTMLResponse
+    Возвращает HTML страницу для отображения в браузере.
     
-    task_info = service.get_task_status(task_id)
+    Страница отдается потоком по мере рендеринга и сохраняется на диск;
+    повторные запросы получают файл, а с If-None-Match - 304 по ETag.
+    """
+    task_info = await asyncio.to_thread(service.get_task_status, task_id)
     
     if task_info['status'] != 'completed':
         return HTMLResponse(
@@ -249,7 +658,17 @@ async def get_html_visualization(
             status_code=400
         )
     
-    result = service.tasks[task_id].get('result')
+    key = HTMLCache.key(task_id, task_info['started_at'])
+    headers = {'ETag': service.html_cache.etag(key), 'Cache-Control': 'no-cache'}
+    
+    if service.html_cache.matches(request.headers.get('if-none-match'), key):
+        return Response(status_code=304, headers=headers)
+    
+    path = await asyncio.to_thread(service.html_cache.get, task_id, key)
+    if path is not None:
+        return FileResponse(path, media_type="text/html; charset=utf-8", headers=headers)
+    
+    result = await service.task_store.aget_result(task_id)
     
     if not result:
         return HTMLResponse(
@@ -257,37 +676,37 @@ async def get_html_visualization(
             status_code=404
         )
     
-    # Генерируем HTML
-    html = HTMLVisualizer.generate_html(
-        result.comparison,
-        result.filename
+    # Синхронный генератор: рендер и запись на диск идут в пуле потоков
+    return StreamingResponse(
+        service.html_cache.render(
+            task_id,
+            key,
+            HTMLVisualizer.iter_html(result.comparison, result.filename)
+        ),
+        media_type="text/html; charset=utf-8",
+        headers=headers
     )
-    
-    return HTMLResponse(content=html)
 
 
 @router.delete("/task/{task_id}")
 async def delete_task(
     task_id: str,
-    service: OCRComparisonService = Depends(get_ocr_service)
+    service: OCRComparisonService = Depends(get_ocr_service),
+    queue: JobQueue = Depends(get_job_queue)
 ):
     """
     Удалить задачу и связанные файлы.
     """
-    # Удаляем файл
-    upload_dir = Path(os.getenv("UPLOAD_DIR", "./uploads"))
-    files = list(upload_dir.glob(f"{task_id}_*"))
-    
-    for file_path in files:
-        try:
-            file_path.unlink()
-            logger.info(f"Удален файл: {file_path}")
-        except Exception as e:
-            logger.error(f"Ошибка удаления файла {file_path}: {e}")
+    # Удаляем документ и его артефакты
+    try:
+        if await service.documents.adelete(task_id):
+            logger.info(f"Удалены файлы задачи {task_id}")
+    except Exception as e:
+        logger.error(f"Ошибка удаления файлов задачи {task_id}: {e}")
     
-    # Удаляем из кэша задач
-    if task_id in service.tasks:
-        del service.tasks[task_id]
+    # Удаляем из очереди и хранилища задач
+    await asyncio.to_thread(queue.cancel, task_id)
+    await asyncio.to_thread(service.task_store.delete, task_id)
     
     return {"message": f"Задача {task_id} удалена"}
 
@@ -0,0 +1,69 @@
+"""
+Сборка OCR провайдеров и сервиса сравнения по переменным окружения.
+Общая для процесса API (main.py) и worker-процессов очереди (app/worker.py).
+"""
+import logging
+import os
+from typing import List
+
+from app.models.base_provider import BaseOCRProvider
+from app.models.paddle_ocr import PaddleOCRProvider
+from app.models.marker_ocr import TesseractOCRProvider  # Tesseract вместо Marker
+from app.models.mineru_ocr import EasyOCRProvider  # EasyOCR вместо MinerU
+from app.services.comparison import OCRComparisonService
+from app.services.document_store import DocumentStore
+from app.services.result_cache import OCRResultCache
+from app.services.task_store import TaskStore
+
+logger = logging.getLogger(__name__)
+
+
+def create_providers() -> List[BaseOCRProvider]:
+    """
+    Создает включенные OCR провайдеры (модели еще не загружаются).
+    
+    Returns:
+        List[BaseOCRProvider]: Провайдеры
+    
+    Raises:
+        RuntimeError: Если ни один провайдер не доступен
+    """
+    providers = []
+    
+    # Проверяем какие провайдеры включены
+    if os.getenv("ENABLE_PADDLE", "true").lower() == "true":
+        try:
+            providers.append(PaddleOCRProvider())
+            logger.info("✓ PaddleOCR включен")
+        except Exception as e:
+            logger.warning(f"✗ PaddleOCR не доступен: {e}")
+    
+    if os.getenv("ENABLE_TESSERACT", "true").lower() == "true":
+        try:
+            providers.append(TesseractOCRProvider())
+            logger.info("✓ Tesseract OCR включен")
+        except Exception as e:
+            logger.warning(f"✗ Tesseract OCR не доступен: {e}")
+    
+    if os.getenv("ENABLE_EASYOCR", "true").lower() == "true":
+        try:
+            providers.append(EasyOCRProvider())
+            logger.info("✓ EasyOCR включен")
+        except Exception as e:
+            logger.warning(f"✗ EasyOCR не доступен: {e}")
+    
+    if not providers:
+        logger.error("❌ Ни один OCR провайдер не доступен!")
+        raise RuntimeError("Требуется хотя бы один OCR провайдер")
+    
+    return providers
+
+
+def create_service() -> OCRComparisonService:
+    """Создает сервис сравнения с провайдерами, кэшем, хранилищами задач и документов"""
+    return OCRComparisonService(
+        create_providers(),
+        result_cache=OCRResultCache.from_env(),
+        task_store=TaskStore.from_env(),
+        documents=DocumentStore.from_env()
+    )
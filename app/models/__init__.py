@@ -7,10 +7,18 @@ from .schemas import (
     DiffSegment,
     ComparisonResult,
     OCRStatistics,
+    PreprocessingStats,
     ComparisonResponse,
     UploadResponse,
-    StatusResponse
+    RejectedUpload,
+    BatchUploadResponse,
+    StatusResponse,
+    BatchResponse,
+    BatchStatusResponse,
+    BatchDocumentResult,
+    BatchResultsResponse
 )
+from .segments import SegmentStore
 
 __all__ = [
     "RawOCRResult",
@@ -18,7 +26,15 @@ __all__ = [
     "DiffSegment",
     "ComparisonResult",
     "OCRStatistics",
+    "PreprocessingStats",
     "ComparisonResponse",
     "UploadResponse",
-    "StatusResponse"
+    "RejectedUpload",
+    "BatchUploadResponse",
+    "StatusResponse",
+    "BatchResponse",
+    "BatchStatusResponse",
+    "BatchDocumentResult",
+    "BatchResultsResponse",
+    "SegmentStore"
 ]
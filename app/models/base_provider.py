@@ -2,12 +2,36 @@
 Базовый абстрактный класс для всех OCR-провайдеров
 """
 from abc import ABC, abstractmethod
-from typing import Tuple
+from concurrent.futures import Executor
+from contextvars import ContextVar
+from functools import partial
+from importlib import metadata
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+import asyncio
+import os
 import time
 import logging
 
+from PIL import Image
+
+from .batching import MicroBatcher
+from .execution import ExecutionPolicy, create_executor
+
 logger = logging.getLogger(__name__)
 
+# Обработчик готовых страниц текущего вызова: (номер страницы с 0, текст).
+# Устанавливается OCRComparisonService для отчета о прогрессе; gather_pages
+# вызывает его по мере распознавания, не дожидаясь остальных страниц
+page_callback: ContextVar[Optional[Callable[[int, str], None]]] = ContextVar(
+    "page_callback", default=None
+)
+
+# Группа текущего документа для планировщика страниц: (пакет, документ).
+# Устанавливается OCRComparisonService, используется gather_pages
+page_group: ContextVar[Optional[Tuple[str, str]]] = ContextVar(
+    "page_group", default=None
+)
+
 
 class BaseOCRProvider(ABC):
     """
@@ -15,16 +39,71 @@ class BaseOCRProvider(ABC):
     Все конкретные реализации должны наследоваться от этого класса.
     """
     
+    # Провайдер умеет распознавать уже растеризованные страницы
+    # (см. recognize_pages). Иначе получает путь к исходному файлу.
+    supports_pages: bool = False
+    
+    # Где выполняется блокирующий код (см. app/models/execution.py).
+    # Переопределяется через {env_prefix}_EXECUTOR и {env_prefix}_WORKERS.
+    execution_policy: ExecutionPolicy = ExecutionPolicy.THREAD
+    max_workers: int = 1
+    env_prefix: str = ""
+    
+    # Блокирующие вызовы - функции модульного уровня с простыми аргументами.
+    # Только такой провайдер допускает process-политику: связанный метод
+    # сериализуется вместе с провайдером и его моделью на каждый вызов
+    process_safe: bool = False
+    
+    # Пакет движка: его версия входит в ключ кэша результатов
+    engine_package: str = ""
+    
+    # Сколько страниц одного документа распознается одновременно,
+    # чтобы большой документ не занимал весь исполнитель
+    page_concurrency: int = int(os.getenv("OCR_PAGE_CONCURRENCY", "4"))
+    
+    # Пакетный инференс (см. recognize_batch и app/models/batching.py):
+    # страницы параллельных задач собираются в пакет до max_batch_size
+    # штук или batch_wait секунд. Переопределяется через
+    # {env_prefix}_BATCH_SIZE и {env_prefix}_BATCH_WAIT_MS.
+    supports_batching: bool = False
+    max_batch_size: int = 1
+    batch_wait: float = 0.02
+    
     def __init__(self, provider_name: str):
         """
         Инициализация провайдера
         
         Args:
             provider_name: Название провайдера для идентификации
+            
+        Raises:
+            ValueError: process-политика у провайдера без process_safe
         """
         self.provider_name = provider_name
         self.is_initialized = False
-        logger.info(f"Создан провайдер: {provider_name}")
+        self.in_worker = False  # True внутри worker-процесса
+        self.worker_pool = None  # ProviderWorkerPool, назначается OCRComparisonService
+        self.page_scheduler = None  # FairScheduler, назначается OCRComparisonService
+        self._executor: Optional[Executor] = None
+        self._batcher: Optional[MicroBatcher] = None
+        
+        if self.env_prefix:
+            self.execution_policy = ExecutionPolicy(
+                os.getenv(f"{self.env_prefix}_EXECUTOR", self.execution_policy.value).lower()
+            )
+            self.max_workers = int(os.getenv(f"{self.env_prefix}_WORKERS", self.max_workers))
+            self.max_batch_size = int(os.getenv(f"{self.env_prefix}_BATCH_SIZE", self.max_batch_size))
+            self.batch_wait = float(
+                os.getenv(f"{self.env_prefix}_BATCH_WAIT_MS", self.batch_wait * 1000)
+            ) / 1000
+        
+        if self.execution_policy is ExecutionPolicy.PROCESS and not self.process_safe:
+            raise ValueError(
+                f"{provider_name}: политика process недоступна (вызовы движка используют "
+                f"модель провайдера), используйте worker"
+            )
+        
+        logger.info(f"Создан провайдер: {provider_name} ({self.execution_policy.value})")
     
     @abstractmethod
     async def initialize(self) -> None:
@@ -51,25 +130,299 @@ class BaseOCRProvider(ABC):
         """
         pass
     
-    async def process(self, file_path: str) -> Tuple[str, float]:
+    async def start(self) -> None:
+        """
+        Подготовка провайдера к работе с учетом политики выполнения.
+        Для worker-политики модели загружаются только в worker-процессах,
+        процесс API не импортирует библиотеки движка.
+        """
+        if self.is_initialized:
+            return
+        
+        if self.uses_worker_pool:
+            if self.worker_pool is None:
+                raise RuntimeError(f"{self.provider_name}: пул worker-процессов не назначен")
+            await self.worker_pool.start()
+        else:
+            await self.initialize()
+        
+        self.is_initialized = True
+    
+    @property
+    def uses_worker_pool(self) -> bool:
+        """Распознавание выполняется в пуле worker-процессов"""
+        return self.execution_policy is ExecutionPolicy.WORKER and not self.in_worker
+    
+    def _get_executor(self) -> Executor:
+        """Ленивое создание исполнителя согласно execution_policy"""
+        if self._executor is None:
+            self._executor = create_executor(self, self.execution_policy, self.max_workers)
+        return self._executor
+    
+    async def run_blocking(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Выполняет блокирующий вызов движка OCR вне event loop.
+        
+        Args:
+            func: Блокирующая функция (для process-политики - сериализуемая)
+            *args, **kwargs: Аргументы функции
+            
+        Returns:
+            Any: Результат функции
+        """
+        if self.in_worker:
+            # Уже в выделенном процессе - event loop принадлежит только нам
+            return func(*args, **kwargs)
+        
+        if self.execution_policy is ExecutionPolicy.PROCESS and getattr(func, '__self__', None) is self:
+            raise TypeError(
+                f"{self.provider_name}: метод провайдера нельзя передать в пул процессов"
+            )
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), partial(func, *args, **kwargs))
+
+    async def rasterize(self, file_path: str) -> List[Image.Image]:
+        """
+        Страницы документа для распознавания файла целиком (extract_text).
+
+        Та же растеризация и предобработка, что у PageCache в конвейере
+        сравнения (DPI по странице или OCR_RASTER_DPI, серый, наклон,
+        бинаризация) - результаты провайдера не зависят от пути вызова.
+
+        Args:
+            file_path: Путь к PDF или изображению
+
+        Returns:
+            List[Image.Image]: Предобработанные страницы
+        """
+        # Ленивый импорт: app.services.preprocessing сам импортирует app.models
+        from app.services.preprocessing import PagePreprocessor
+
+        pages, _ = await self.run_blocking(PagePreprocessor.from_env().prepare, str(file_path))
+        return pages
+
+    @staticmethod
+    def page_image(page: Any) -> Image.Image:
+        """
+        Страница как PIL-изображение.
+        
+        Провайдеры принимают страницы в любом из видов: PIL.Image,
+        numpy-массив (H×W или H×W×C, RGB) или SharedPage (разделяемая
+        память worker-процессов).
+        
+        Args:
+            page: Страница
+            
+        Returns:
+            Image.Image: Изображение
+        """
+        if isinstance(page, Image.Image):
+            return page
+        if hasattr(page, 'to_image'):
+            return page.to_image()
+        return Image.fromarray(page)
+    
+    @staticmethod
+    def page_array(page: Any, bgr: bool = False, color: bool = False):
+        """
+        Страница как numpy-массив uint8 без промежуточных файлов.
+        
+        Args:
+            page: Страница (PIL.Image, numpy-массив или SharedPage)
+            bgr: Порядок каналов BGR (OpenCV, Paddle) вместо RGB
+            color: Всегда три канала (оттенки серого дублируются)
+            
+        Returns:
+            np.ndarray: Массив H×W или H×W×3
+        """
+        import numpy as np
+        
+        if hasattr(page, 'to_array'):
+            array = page.to_array()
+        else:
+            if isinstance(page, Image.Image) and page.mode not in ('L', 'RGB'):
+                page = page.convert('RGB')
+            array = np.asarray(page)
+        
+        if color and array.ndim == 2:
+            array = np.stack([array] * 3, axis=-1)
+        if bgr and array.ndim == 3:
+            array = np.ascontiguousarray(array[..., ::-1])
+        return array
+    
+    @property
+    def batching_enabled(self) -> bool:
+        """Страницы распознаются пакетами (в worker-процессе пакеты уже собраны)"""
+        return self.supports_batching and self.max_batch_size > 1 and not self.in_worker
+    
+    @property
+    def batcher(self) -> Optional[MicroBatcher]:
+        """Батчер провайдера (создается при первом обращении)"""
+        if not self.batching_enabled:
+            return None
+        if self._batcher is None:
+            self._batcher = MicroBatcher(
+                self.provider_name,
+                self._run_batch,
+                self.max_batch_size,
+                self.batch_wait,
+                self.worker_pool.size if self.uses_worker_pool else self.max_workers
+            )
+        return self._batcher
+    
+    async def recognize_page_batched(self, page: Any) -> str:
+        """
+        Распознает страницу в составе пакета со страницами других задач.
+        
+        Args:
+            page: Страница (PIL или SharedPage для worker-политики)
+            
+        Returns:
+            str: Текст страницы
+        """
+        return await self.batcher.submit(page)
+    
+    async def _run_batch(self, pages: List[Any]) -> List[str]:
+        """Один пакетный вызов: в worker-процессе или в исполнителе"""
+        if self.uses_worker_pool:
+            return await self.worker_pool.recognize_batch(pages)
+        return await self.run_blocking(self.recognize_batch, pages)
+    
+    def recognize_batch(self, images: List[Any]) -> List[str]:
+        """
+        Блокирующее пакетное распознавание страниц одним вызовом модели
+        (для провайдеров с supports_batching).
+        
+        Args:
+            images: Страницы (PIL.Image, numpy-массивы или SharedPage)
+            
+        Returns:
+            List[str]: Текст каждой страницы (в том же порядке)
+        """
+        raise NotImplementedError(
+            f"{self.provider_name}: Пакетное распознавание не поддерживается"
+        )
+    
+    async def gather_pages(
+        self,
+        pages: List[Any],
+        recognize_page: Callable[[Any], Awaitable[str]]
+    ) -> List[str]:
+        """
+        Распознает страницы параллельно, не более page_concurrency
+        одновременно, и возвращает результаты в порядке страниц.
+        Если назначен page_scheduler, каждая страница дополнительно ждет
+        общего для всех документов слота провайдера.
+        
+        Args:
+            pages: Страницы документа
+            recognize_page: Корутина распознавания одной страницы
+            
+        Returns:
+            List[str]: Текст каждой страницы
+        """
+        semaphore = asyncio.Semaphore(max(1, self.page_concurrency))
+        on_page = page_callback.get()
+        scheduler = self.page_scheduler
+        group = page_group.get()
+        
+        async def run(page_num: int, page: Any) -> str:
+            async with semaphore:
+                if scheduler is None:
+                    text = await recognize_page(page)
+                else:
+                    async with scheduler.slot(group):
+                        text = await recognize_page(page)
+            logger.debug(f"{self.provider_name}: Страница {page_num}: {len(text)} символов")
+            if on_page is not None:
+                on_page(page_num - 1, text)
+            return text
+        
+        return list(await asyncio.gather(
+            *(run(page_num, page) for page_num, page in enumerate(pages, 1))
+        ))
+    
+    async def extract(
+        self,
+        file_path: str,
+        pages: Optional[List[Image.Image]] = None
+    ) -> str:
+        """
+        Распознает документ: по страницам, если они переданы и поддерживаются,
+        иначе по пути к файлу.
+        
+        Args:
+            file_path: Путь к файлу
+            pages: Растеризованные страницы
+            
+        Returns:
+            str: Распознанный текст
+        """
+        if pages is not None and self.supports_pages:
+            return self.join_pages(await self.recognize_pages(pages))
+        return await self.extract_text(file_path)
+    
+    async def recognize_pages(self, pages: List[Any]) -> List[str]:
+        """
+        Распознает уже растеризованные страницы документа.
+        Страницы рендерятся один раз на документ и разделяются
+        между всеми провайдерами (см. PageCache).
+        
+        Args:
+            pages: Страницы в порядке следования: PIL.Image, numpy-массивы
+                или SharedPage (см. page_image/page_array)
+            
+        Returns:
+            List[str]: Текст каждой страницы (в том же порядке)
+        """
+        raise NotImplementedError(
+            f"{self.provider_name}: Постраничное распознавание не поддерживается"
+        )
+    
+    def join_pages(self, page_texts: List[str]) -> str:
+        """
+        Склеивает постраничные результаты в текст документа.
+        
+        Args:
+            page_texts: Текст каждой страницы
+            
+        Returns:
+            str: Текст документа
+        """
+        return '\n\n'.join(text.strip() for text in page_texts if text.strip())
+    
+    async def process(
+        self,
+        file_path: str,
+        pages: Optional[List[Image.Image]] = None
+    ) -> Tuple[str, float]:
         """
         Обрабатывает файл и возвращает результат с метриками.
-        Обертка над extract_text с замером времени.
+        Обертка над extract с замером времени и учетом политики выполнения.
         
         Args:
             file_path: Путь к файлу
+            pages: Растеризованные страницы (если провайдер их поддерживает);
+                для worker-политики - страницы в разделяемой памяти
             
         Returns:
             Tuple[str, float]: (распознанный текст, время обработки в секундах)
         """
+        if pages is not None and self.supports_pages:
+            page_texts, processing_time = await self.process_pages(pages, file_path)
+            return self.join_pages(page_texts), processing_time
+        
         if not self.is_initialized:
-            await self.initialize()
-            self.is_initialized = True
+            await self.start()
         
         start_time = time.time()
         try:
             logger.info(f"{self.provider_name}: Начало обработки {file_path}")
-            text = await self.extract_text(file_path)
+            if self.uses_worker_pool:
+                text = await self.worker_pool.run(file_path)
+            else:
+                text = await self.extract_text(file_path)
             processing_time = time.time() - start_time
             
             logger.info(
@@ -87,12 +440,88 @@ class BaseOCRProvider(ABC):
             )
             raise
     
+    async def process_pages(
+        self,
+        pages: List[Any],
+        file_path: str = ""
+    ) -> Tuple[List[str], float]:
+        """
+        Распознает страницы и возвращает постраничный результат с метриками.
+        
+        Args:
+            pages: Растеризованные страницы; для worker-политики -
+                страницы в разделяемой памяти
+            file_path: Путь к исходному файлу (для логов)
+            
+        Returns:
+            Tuple[List[str], float]: (текст каждой страницы, время обработки в секундах)
+        """
+        if not self.is_initialized:
+            await self.start()
+        
+        start_time = time.time()
+        try:
+            logger.info(f"{self.provider_name}: Начало обработки {len(pages)} страниц {file_path}")
+            if self.uses_worker_pool:
+                # Страницы распределяются по worker-процессам с загруженными моделями,
+                # при пакетном режиме - пакетами вместе со страницами других задач
+                page_texts = await self.gather_pages(
+                    pages,
+                    self.recognize_page_batched if self.batching_enabled else self.worker_pool.recognize_page
+                )
+            else:
+                page_texts = await self.recognize_pages(pages)
+            processing_time = time.time() - start_time
+            
+            logger.info(
+                f"{self.provider_name}: Обработка завершена. "
+                f"Страниц: {len(page_texts)}, Время: {processing_time:.2f}с"
+            )
+            
+            return page_texts, processing_time
+            
+        except Exception as e:
+            processing_time = time.time() - start_time
+            logger.error(
+                f"{self.provider_name}: Ошибка при обработке {file_path}: {str(e)}",
+                exc_info=True
+            )
+            raise
+    
+    def get_version(self) -> str:
+        """
+        Версия движка OCR (входит в ключ кэша результатов).
+        Берется из метаданных пакета, сам движок не импортируется.
+        
+        Returns:
+            str: Версия пакета engine_package или 'unknown'
+        """
+        if not self.engine_package:
+            return "unknown"
+        try:
+            return metadata.version(self.engine_package)
+        except metadata.PackageNotFoundError:
+            return "unknown"
+    
+    def get_cache_config(self) -> dict:
+        """
+        Настройки провайдера, влияющие на результат распознавания
+        (языки, режимы сегментации и т.д.). Входят в ключ кэша.
+        
+        Returns:
+            dict: Сериализуемые в JSON настройки
+        """
+        return {}
+    
     def cleanup(self) -> None:
         """
         Освобождение ресурсов провайдера.
         Вызывается при завершении работы приложения.
         """
         logger.info(f"{self.provider_name}: Очистка ресурсов")
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
         self.is_initialized = False
     
     def get_supported_formats(self) -> list[str]:
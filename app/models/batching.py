@@ -0,0 +1,141 @@
+"""
+Динамическое объединение страниц в пакеты для инференса.
+
+Страницы приходят из разных задач по одной; батчер копит их, пока не
+наберется max_size страниц или не пройдет max_wait секунд с первой
+ожидающей, и выполняет один пакетный вызов модели. Пока все max_in_flight
+пакетов заняты (например, каждый worker-процесс уже считает свой),
+страницы продолжают копиться, поэтому под нагрузкой пакеты растут сами.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Пакетирование вызовов одного провайдера в пределах event loop.
+
+    run_batch получает список элементов и возвращает список результатов
+    той же длины и в том же порядке.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_size: int,
+        max_wait: float = 0.02,
+        max_in_flight: int = 1
+    ):
+        """
+        Args:
+            name: Название провайдера (для логов и статистики)
+            run_batch: Корутина пакетного вызова
+            max_size: Максимальный размер пакета
+            max_wait: Сколько ждать добора пакета (секунды)
+            max_in_flight: Сколько пакетов выполняется одновременно
+        """
+        self.name = name
+        self.run_batch = run_batch
+        self.max_size = max(1, max_size)
+        self.max_wait = max_wait
+        self.max_in_flight = max(1, max_in_flight)
+
+        # Размер пакета -> количество пакетов
+        self.histogram: Dict[int, int] = {}
+
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._in_flight = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Добавляет элемент в очередной пакет и ждет его результата.
+
+        Args:
+            item: Элемент (страница)
+
+        Returns:
+            Any: Результат для этого элемента
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if self._in_flight < self.max_in_flight:
+            if len(self._pending) >= self.max_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Отправляет накопленные элементы пакетом (если есть свободный слот)"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if self._in_flight >= self.max_in_flight:
+            return
+
+        # Отмененные ожидающие в пакет не попадают
+        self._pending = [(item, future) for item, future in self._pending if not future.done()]
+        if not self._pending:
+            return
+
+        batch = self._pending[:self.max_size]
+        self._pending = self._pending[self.max_size:]
+
+        self._in_flight += 1
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        if self._pending and self._in_flight < self.max_in_flight:
+            if len(self._pending) >= self.max_size:
+                self._flush()
+            else:
+                self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        """Выполняет пакет и раздает результаты"""
+        size = len(batch)
+        self.histogram[size] = self.histogram.get(size, 0) + 1
+
+        try:
+            results = await self.run_batch([item for item, _ in batch])
+            if len(results) != size:
+                raise RuntimeError(
+                    f"{self.name}: пакет из {size} страниц вернул {len(results)} результатов"
+                )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._in_flight -= 1
+            # Страницы, накопленные за время пакета, уже ждали достаточно
+            if self._pending:
+                self._flush()
+
+    def stats(self) -> dict:
+        """Гистограмма размеров пакетов для /info"""
+        batches = sum(self.histogram.values())
+        items = sum(size * count for size, count in self.histogram.items())
+        return {
+            'max_size': self.max_size,
+            'max_wait_ms': round(self.max_wait * 1000, 3),
+            'batches': batches,
+            'pages': items,
+            'mean_size': round(items / batches, 2) if batches else 0.0,
+            'histogram': {str(size): self.histogram[size] for size in sorted(self.histogram)}
+        }
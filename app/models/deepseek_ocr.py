@@ -2,8 +2,11 @@
 DeepSeek OCR провайдер
 """
 from .base_provider import BaseOCRProvider
+from .execution import ExecutionPolicy
 import logging
 from pathlib import Path
+from typing import Any, List
+from PIL import Image
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +18,17 @@ class DeepSeekOCRProvider(BaseOCRProvider):
     Оптимизирован для высокоточного распознавания текста.
     """
     
+    supports_pages = True
+    
+    # Одна модель на GPU: инференс последовательно в отдельном потоке
+    execution_policy = ExecutionPolicy.THREAD
+    max_workers = 1
+    env_prefix = "DEEPSEEK"
+    engine_package = "vllm"
+    
+    # Ограничение числа страниц при собственной растеризации PDF
+    MAX_PAGES = 5
+    
     def __init__(self):
         super().__init__("DeepSeek")
         self.llm = None
@@ -52,6 +66,10 @@ class DeepSeekOCRProvider(BaseOCRProvider):
             logger.error(f"{self.provider_name}: Ошибка инициализации: {e}")
             raise
     
+    def get_cache_config(self) -> dict:
+        """Модель и параметры генерации влияют на результат"""
+        return {'model': "deepseek-ai/DeepSeek-OCR", 'max_tokens': 4096}
+    
     async def extract_text(self, file_path: str) -> str:
         """
         Извлекает текст из изображения/PDF используя DeepSeek OCR
@@ -62,16 +80,13 @@ class DeepSeekOCRProvider(BaseOCRProvider):
         Returns:
             str: Распознанный текст
         """
-        from PIL import Image
-        import fitz  # PyMuPDF для PDF
-        
         path = Path(file_path)
         
         try:
             # Обрабатываем PDF или изображение
             if path.suffix.lower() == '.pdf':
                 # Конвертируем PDF в изображения
-                images = self._pdf_to_images(file_path)
+                images = await self.run_blocking(self._pdf_to_images, file_path)
                 if not images:
                     logger.warning(f"{self.provider_name}: PDF не содержит изображений")
                     return ""
@@ -82,37 +97,52 @@ class DeepSeekOCRProvider(BaseOCRProvider):
                 # Загружаем изображение
                 image = Image.open(file_path).convert('RGB')
             
-            # Подготавливаем входные данные
-            inputs = self.processor(images=image, return_tensors="pt")
-            
-            # Генерируем текст с помощью модели
-            from vllm import SamplingParams
-            
-            sampling_params = SamplingParams(
-                temperature=0.0,  # Детерминированный вывод
-                max_tokens=4096,
-                stop=["</s>"]
-            )
-            
-            # Выполняем инференс
-            outputs = self.llm.generate(
-                prompt_token_ids=[inputs.input_ids[0].tolist()],
-                sampling_params=sampling_params
-            )
-            
-            # Извлекаем текст из результата
-            generated_text = outputs[0].outputs[0].text
+            generated_text = await self.run_blocking(self._recognize, image)
             
-            if not generated_text.strip():
+            if not generated_text:
                 logger.warning(f"{self.provider_name}: Пустой результат для {file_path}")
                 return ""
             
-            return generated_text.strip()
+            return generated_text
             
         except Exception as e:
             logger.error(f"{self.provider_name}: Ошибка обработки: {e}")
             raise
     
+    async def recognize_pages(self, pages: List[Any]) -> List[str]:
+        """Распознает растеризованные страницы"""
+        try:
+            return await self.gather_pages(
+                pages,
+                lambda page: self.run_blocking(self._recognize, page)
+            )
+        except Exception as e:
+            logger.error(f"{self.provider_name}: Ошибка обработки: {e}")
+            raise
+    
+    def _recognize(self, image: Any) -> str:
+        """Инференс модели на одном изображении (PIL.Image, numpy-массив или SharedPage)"""
+        # Подготавливаем входные данные
+        inputs = self.processor(images=self.page_image(image).convert('RGB'), return_tensors="pt")
+        
+        # Генерируем текст с помощью модели
+        from vllm import SamplingParams
+        
+        sampling_params = SamplingParams(
+            temperature=0.0,  # Детерминированный вывод
+            max_tokens=4096,
+            stop=["</s>"]
+        )
+        
+        # Выполняем инференс
+        outputs = self.llm.generate(
+            prompt_token_ids=[inputs.input_ids[0].tolist()],
+            sampling_params=sampling_params
+        )
+        
+        # Извлекаем текст из результата
+        return outputs[0].outputs[0].text.strip()
+    
     def _pdf_to_images(self, pdf_path: str) -> list:
         """Конвертирует PDF страницы в изображения"""
         import fitz
@@ -122,7 +152,7 @@ class DeepSeekOCRProvider(BaseOCRProvider):
         images = []
         doc = fitz.open(pdf_path)
         
-        for page_num in range(min(5, len(doc))):  # Макс 5 страниц
+        for page_num in range(min(self.MAX_PAGES, len(doc))):
             page = doc[page_num]
             pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x увеличение качества
             img_data = pix.tobytes("png")
@@ -141,4 +171,5 @@ class DeepSeekOCRProvider(BaseOCRProvider):
             del self.processor
             self.processor = None
         
+        super().cleanup()
         logger.info(f"{self.provider_name}: Ресурсы освобождены")
@@ -0,0 +1,53 @@
+"""
+Политики выполнения блокирующего кода OCR провайдеров.
+
+Движки OCR (pytesseract, easyocr, paddle) блокируют поток, поэтому
+их вызовы выносятся из event loop в исполнитель, выбранный провайдером:
+
+- thread:  пул потоков (движок отпускает GIL или запускает внешний процесс)
+- process: пул процессов (вызываемые объекты должны сериализоваться pickle;
+           только для провайдеров с process_safe, см. BaseOCRProvider)
+- worker:  пул долгоживущих процессов с собственными экземплярами
+           провайдера, модели загружаются в них один раз
+           (см. app/services/worker_pool.py)
+"""
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from enum import Enum
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionPolicy(str, Enum):
+    """Где выполняется блокирующий код провайдера"""
+    THREAD = "thread"
+    PROCESS = "process"
+    WORKER = "worker"
+
+
+def create_executor(provider, policy: ExecutionPolicy, max_workers: int) -> Executor:
+    """
+    Создает исполнитель для провайдера согласно политике.
+    Worker-политика обслуживается ProviderWorkerPool, а не исполнителем.
+
+    Args:
+        provider: OCR провайдер
+        policy: Политика выполнения
+        max_workers: Размер пула
+
+    Returns:
+        Executor: Пул потоков или процессов
+    """
+    if policy is ExecutionPolicy.THREAD:
+        return ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f"ocr-{provider.provider_name}"
+        )
+
+    if policy is ExecutionPolicy.PROCESS:
+        # spawn: не наследуем состояние event loop и уже загруженные библиотеки
+        context = multiprocessing.get_context("spawn")
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+    raise ValueError(f"{provider.provider_name}: для политики {policy.value} исполнитель не создается")
@@ -1,15 +1,70 @@
 """
 Tesseract OCR провайдер
+
+Два бэкенда (TESSERACT_BACKEND):
+- tesserocr: TessBaseAPI внутри процесса; у каждого потока пула свой
+  инициализированный handle, языковые данные загружаются один раз на
+  поток, страница передается буфером пикселей без временных файлов
+- pytesseract: запуск утилиты tesseract на каждую страницу (запасной
+  вариант, если tesserocr не установлен)
 """
 from .base_provider import BaseOCRProvider
+from .execution import ExecutionPolicy
+import importlib.util
 import logging
+import os
+import threading
 from pathlib import Path
-from typing import List
+from typing import Any, List
 from PIL import Image
 import io
 
 logger = logging.getLogger(__name__)
 
+# Handle'ы TessBaseAPI текущего потока: (языки, psm) -> handle.
+# Живут, пока жив поток пула (освобождаются вместе с ним)
+_thread_apis = threading.local()
+
+
+def _thread_api(lang: str, psm: int):
+    """TessBaseAPI текущего потока (создается при первом вызове)"""
+    apis = getattr(_thread_apis, 'apis', None)
+    if apis is None:
+        apis = _thread_apis.apis = {}
+    
+    api = apis.get((lang, psm))
+    if api is None:
+        import tesserocr
+        api = tesserocr.PyTessBaseAPI(lang=lang, psm=psm)
+        apis[(lang, psm)] = api
+        logger.info(f"Tesseract: языки {lang} загружены в поток {threading.current_thread().name}")
+    return api
+
+
+def recognize_buffer(image: Image.Image, lang: str, psm: int) -> str:
+    """
+    Распознает страницу через TessBaseAPI потока (блокирующая операция).
+    Функция модульного уровня - сериализуется для process-политики.
+    
+    Args:
+        image: Страница (L или RGB)
+        lang: Языки Tesseract
+        psm: Режим сегментации страницы
+        
+    Returns:
+        str: Распознанный текст
+    """
+    if image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB')
+    
+    api = _thread_api(lang, psm)
+    channels = len(image.mode)
+    api.SetImageBytes(image.tobytes(), image.width, image.height, channels, image.width * channels)
+    try:
+        return api.GetUTF8Text()
+    finally:
+        api.Clear()
+
 
 class TesseractOCRProvider(BaseOCRProvider):
     """
@@ -18,28 +73,51 @@ class TesseractOCRProvider(BaseOCRProvider):
     Поддерживает 100+ языков, работает на CPU.
     """
     
+    supports_pages = True
+    
+    # tesserocr отпускает GIL на время распознавания,
+    # pytesseract запускает внешний процесс tesseract
+    execution_policy = ExecutionPolicy.THREAD
+    max_workers = os.cpu_count() or 4
+    env_prefix = "TESSERACT"
+    process_safe = True  # recognize_buffer и pytesseract - функции модулей
+    engine_package = "pytesseract"
+    
+    # Multi-language: английский + русский + китайский упрощенный
+    LANG = 'eng+rus+chi_sim'
+    PSM = 6  # Assume uniform text block
+    CONFIG = f'--psm {PSM}'
+    
     def __init__(self):
         super().__init__("Tesseract")
         self.pytesseract = None
-        self.pdf2image = None
+        self.tesserocr = None
+        
+        # Бэкенд выбирается без импорта движка: в процессе API worker-провайдера
+        # от него зависит ключ кэша, а сам движок загружается в worker'ах
+        self.backend = os.getenv("TESSERACT_BACKEND", "auto").lower()
+        if self.backend == "auto":
+            self.backend = "tesserocr" if importlib.util.find_spec("tesserocr") else "pytesseract"
+        self.engine_package = self.backend
     
     async def initialize(self) -> None:
         """Инициализация Tesseract"""
         # Проверяем, не загружен ли уже
-        if self.pytesseract is not None:
+        if self.pytesseract is not None or self.tesserocr is not None:
             logger.debug(f"{self.provider_name}: Уже инициализирован, пропускаем")
             return
         
+        if self.backend == "tesserocr" and self._init_tesserocr():
+            return
+        
         try:
             import pytesseract
-            from pdf2image import convert_from_path
             
             self.pytesseract = pytesseract
-            self.pdf2image = convert_from_path
             
             # Проверяем доступность tesseract
             version = pytesseract.get_tesseract_version()
-            logger.info(f"{self.provider_name}: Tesseract v{version} готов")
+            logger.info(f"{self.provider_name}: Tesseract v{version} готов (pytesseract)")
             
         except ImportError as e:
             logger.error(f"{self.provider_name}: pytesseract не установлен")
@@ -50,6 +128,39 @@ class TesseractOCRProvider(BaseOCRProvider):
             logger.error(f"{self.provider_name}: Ошибка инициализации: {e}")
             raise
     
+    def _init_tesserocr(self) -> bool:
+        """
+        Подключает tesserocr. Handle'ы TessBaseAPI создаются лениво,
+        по одному в каждом потоке пула.
+        
+        Returns:
+            bool: False, если tesserocr не установлен (используется pytesseract)
+        """
+        try:
+            import tesserocr
+        except ImportError:
+            logger.warning(f"{self.provider_name}: tesserocr не установлен, используется pytesseract")
+            self.backend = self.engine_package = "pytesseract"
+            return False
+        
+        tessdata, languages = tesserocr.get_languages()
+        missing = [lang for lang in self.LANG.split('+') if lang not in languages]
+        if missing:
+            raise RuntimeError(
+                f"{self.provider_name}: нет языковых данных {', '.join(missing)} в {tessdata}"
+            )
+        
+        self.tesserocr = tesserocr
+        logger.info(
+            f"{self.provider_name}: Tesseract v{tesserocr.tesseract_version().split()[1]} "
+            f"готов (tesserocr, до {self.max_workers} handle'ов)"
+        )
+        return True
+    
+    def get_cache_config(self) -> dict:
+        """Языки и режим сегментации влияют на результат"""
+        return {'lang': self.LANG, 'config': self.CONFIG, 'backend': self.backend}
+    
     async def extract_text(self, file_path: str) -> str:
         """
         Извлекает текст из PDF/изображений используя Tesseract
@@ -77,30 +188,11 @@ class TesseractOCRProvider(BaseOCRProvider):
     async def _extract_from_pdf(self, pdf_path: Path) -> str:
         """Извлекает текст из PDF конвертируя в изображения"""
         try:
-            # Конвертируем PDF в изображения (250 DPI для качества)
-            images = self.pdf2image(
-                str(pdf_path),
-                dpi=250,
-                fmt='png'
-            )
+            images = await self.rasterize(pdf_path)
             
             logger.info(f"{self.provider_name}: Конвертировано {len(images)} страниц")
             
-            # OCR для каждой страницы
-            texts = []
-            for page_num, image in enumerate(images, 1):
-                # Multi-language: английский + русский + китайский упрощенный
-                text = self.pytesseract.image_to_string(
-                    image,
-                    lang='eng+rus+chi_sim',  # Добавлен китайский
-                    config='--psm 6'  # Assume uniform text block
-                )
-                
-                if text.strip():
-                    texts.append(text.strip())
-                    logger.debug(f"{self.provider_name}: Страница {page_num}: {len(text)} символов")
-            
-            full_text = '\n\n'.join(texts)
+            full_text = self.join_pages(await self.recognize_pages(images))
             
             if not full_text.strip():
                 logger.warning(f"{self.provider_name}: Пустой результат для {pdf_path}")
@@ -113,16 +205,32 @@ class TesseractOCRProvider(BaseOCRProvider):
             logger.error(f"{self.provider_name}: Ошибка PDF OCR: {e}")
             raise
     
+    async def recognize_pages(self, pages: List[Any]) -> List[str]:
+        """OCR растеризованных страниц (параллельно, в порядке страниц)"""
+        async def recognize_page(page: Any) -> str:
+            text = await self._recognize(self.page_image(page))
+            return text.strip()
+        
+        return await self.gather_pages(pages, recognize_page)
+    
+    async def _recognize(self, image: Image.Image) -> str:
+        """Распознает изображение выбранным бэкендом в исполнителе провайдера"""
+        if self.tesserocr is not None:
+            return await self.run_blocking(recognize_buffer, image, self.LANG, self.PSM)
+        
+        return await self.run_blocking(
+            self.pytesseract.image_to_string,
+            image,
+            lang=self.LANG,
+            config=self.CONFIG
+        )
+    
     async def _extract_from_image(self, image_path: Path) -> str:
         """Извлекает текст из изображения"""
         try:
             image = Image.open(image_path)
             
-            text = self.pytesseract.image_to_string(
-                image,
-                lang='eng+rus+chi_sim',  # Добавлен китайский
-                config='--psm 6'
-            )
+            text = await self._recognize(image)
             
             if not text.strip():
                 logger.warning(f"{self.provider_name}: Пустой результат для {image_path}")
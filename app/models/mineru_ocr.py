@@ -1,15 +1,31 @@
 """
 EasyOCR провайдер
+
+Режимы распознавания (EASYOCR_SHARED_DETECTION):
+- true (по умолчанию): детекция текста (CRAFT) выполняется один раз,
+  найденные области распознает ru+en reader, а области с низкой
+  уверенностью или без кириллицы/латиницы/цифр в результате дополнительно
+  распознает ch_sim+en reader
+- false: полный readtext обоими reader'ами (две детекции на страницу)
 """
 from .base_provider import BaseOCRProvider
+from .execution import ExecutionPolicy
 import logging
+import os
+import re
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Tuple
 from PIL import Image
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Кириллица, латиница и цифры: такие фрагменты ru+en reader распознает сам
+_RU_EN_SCRIPT_RE = re.compile(r'[0-9A-Za-z\u0400-\u04FF]')
+
+# Иероглифы (CJK Unified Ideographs и расширение A)
+_CJK_SCRIPT_RE = re.compile(r'[\u3400-\u4DBF\u4E00-\u9FFF]')
+
 
 class EasyOCRProvider(BaseOCRProvider):
     """
@@ -18,11 +34,31 @@ class EasyOCRProvider(BaseOCRProvider):
     Работает на CPU и GPU (при наличии CUDA).
     """
     
+    supports_pages = True
+    
+    # Ридеры держат GIL во время инференса: пул worker-процессов,
+    # в каждом свои загруженные модели (EASYOCR_WORKERS)
+    execution_policy = ExecutionPolicy.WORKER
+    max_workers = 1
+    env_prefix = "EASYOCR"
+    engine_package = "easyocr"
+    
+    # Страницы параллельных задач распознаются пакетами через readtext_batched
+    supports_batching = True
+    max_batch_size = 8
+    
+    # Минимальная уверенность распознанного фрагмента
+    MIN_CONFIDENCE = 0.3
+    
     def __init__(self):
         super().__init__("EasyOCR")
         self.reader_ch = None  # Китайский + английский
         self.reader_ru = None  # Русский + английский
-        self.pdf2image = None
+        
+        # Общая детекция для обоих reader'ов и порог, ниже которого
+        # область перераспознается ch_sim+en reader'ом
+        self.shared_detection = os.getenv("EASYOCR_SHARED_DETECTION", "true").lower() == "true"
+        self.route_confidence = float(os.getenv("EASYOCR_ROUTE_CONFIDENCE", "0.5"))
     
     async def initialize(self) -> None:
         """Инициализация EasyOCR"""
@@ -33,9 +69,6 @@ class EasyOCRProvider(BaseOCRProvider):
         
         try:
             import easyocr
-            from pdf2image import convert_from_path
-            
-            self.pdf2image = convert_from_path
             
             # EasyOCR требует особых комбинаций языков
             # Китайский упрощенный совместим только с английским
@@ -43,7 +76,9 @@ class EasyOCRProvider(BaseOCRProvider):
             self.reader_ch = easyocr.Reader(
                 ['ch_sim', 'en'],  # Китайский + английский
                 gpu=False,
-                verbose=False
+                verbose=False,
+                # При общей детекции ch reader только распознает области
+                detector=not self.shared_detection
             )
             self.reader_ru = easyocr.Reader(
                 ['ru', 'en'],  # Русский + английский
@@ -51,7 +86,10 @@ class EasyOCRProvider(BaseOCRProvider):
                 verbose=False
             )
             
-            logger.info(f"{self.provider_name}: EasyOCR готов (ch+en+ru dual-reader, CPU)")
+            logger.info(
+                f"{self.provider_name}: EasyOCR готов (ch+en+ru dual-reader, CPU, "
+                f"{'общая детекция' if self.shared_detection else 'раздельная детекция'})"
+            )
             
         except ImportError as e:
             logger.error(f"{self.provider_name}: EasyOCR не установлен")
@@ -62,6 +100,18 @@ class EasyOCRProvider(BaseOCRProvider):
             logger.error(f"{self.provider_name}: Ошибка инициализации: {e}")
             raise
     
+    def get_cache_config(self) -> dict:
+        """Наборы языков ридеров, режим детекции и пороги влияют на результат"""
+        config = {
+            'readers': [['ch_sim', 'en'], ['ru', 'en']],
+            'min_confidence': self.MIN_CONFIDENCE
+        }
+        if self.shared_detection:
+            config['shared_detection'] = True
+            config['route_confidence'] = self.route_confidence
+            config['cjk_min_strokes'] = _CJK_MIN_STROKES
+        return config
+    
     async def extract_text(self, file_path: str) -> str:
         """
         Извлекает текст из PDF/изображений используя EasyOCR
@@ -89,48 +139,11 @@ class EasyOCRProvider(BaseOCRProvider):
     async def _extract_from_pdf(self, pdf_path: Path) -> str:
         """Извлекает текст из PDF конвертируя в изображения"""
         try:
-            # Конвертируем PDF в изображения (250 DPI)
-            images = self.pdf2image(
-                str(pdf_path),
-                dpi=250,
-                fmt='png'
-            )
+            images = await self.rasterize(pdf_path)
             
             logger.info(f"{self.provider_name}: Конвертировано {len(images)} страниц")
             
-            # OCR для каждой страницы
-            texts = []
-            for page_num, image in enumerate(images, 1):
-                # Конвертируем PIL Image в numpy array
-                img_array = np.array(image)
-                
-                # Используем оба reader'а для максимального покрытия языков
-                # 1. Китайский + английский
-                results_ch = self.reader_ch.readtext(img_array)
-                # 2. Русский + английский
-                results_ru = self.reader_ru.readtext(img_array)
-                
-                # Объединяем результаты (удаляем дубликаты английского)
-                all_texts = []
-                
-                # Добавляем китайский + английский
-                for detection in results_ch:
-                    bbox, text, confidence = detection
-                    if confidence > 0.3:
-                        all_texts.append(text)
-                
-                # Добавляем только русский (английский уже есть)
-                for detection in results_ru:
-                    bbox, text, confidence = detection
-                    if confidence > 0.3 and not text.isascii():  # Только не-ASCII (русский)
-                        all_texts.append(text)
-                
-                if all_texts:
-                    page_text = ' '.join(all_texts)
-                    texts.append(page_text)
-                    logger.debug(f"{self.provider_name}: Страница {page_num}: {len(page_text)} символов")
-            
-            full_text = '\n\n'.join(texts)
+            full_text = self.join_pages(await self.recognize_pages(images))
             
             if not full_text.strip():
                 logger.warning(f"{self.provider_name}: Пустой результат для {pdf_path}")
@@ -143,27 +156,20 @@ class EasyOCRProvider(BaseOCRProvider):
             logger.error(f"{self.provider_name}: Ошибка PDF OCR: {e}")
             raise
     
+    async def recognize_pages(self, pages: List[Any]) -> List[str]:
+        """OCR растеризованных страниц (параллельно, в порядке страниц)"""
+        async def recognize_page(page: Any) -> str:
+            return await self.run_blocking(self._recognize_page, page)
+        
+        return await self.gather_pages(
+            pages,
+            self.recognize_page_batched if self.batching_enabled else recognize_page
+        )
+    
     async def _extract_from_image(self, image_path: Path) -> str:
         """Извлекает текст из изображения"""
         try:
-            # Используем оба reader'а
-            results_ch = self.reader_ch.readtext(str(image_path))
-            results_ru = self.reader_ru.readtext(str(image_path))
-            
-            # Объединяем результаты
-            all_texts = []
-            
-            for detection in results_ch:
-                bbox, text, confidence = detection
-                if confidence > 0.3:
-                    all_texts.append(text)
-            
-            for detection in results_ru:
-                bbox, text, confidence = detection
-                if confidence > 0.3 and not text.isascii():
-                    all_texts.append(text)
-            
-            full_text = ' '.join(all_texts)
+            full_text = await self.run_blocking(self._recognize, str(image_path))
             
             if not full_text.strip():
                 logger.warning(f"{self.provider_name}: Пустой результат для {image_path}")
@@ -175,3 +181,239 @@ class EasyOCRProvider(BaseOCRProvider):
         except Exception as e:
             logger.error(f"{self.provider_name}: Ошибка image OCR: {e}")
             raise
+    
+    def _recognize(self, image) -> str:
+        """
+        Распознает одну страницу обоими reader'ами и объединяет результат
+        (при общей детекции - одна детекция на страницу).
+        
+        Args:
+            image: numpy array или путь к изображению
+            
+        Returns:
+            str: Текст страницы
+        """
+        if self.shared_detection:
+            from easyocr.utils import reformat_input
+            
+            img, img_grey = reformat_input(image)
+            horizontal_list, free_list = self.reader_ru.detect(img, reformat=False)
+            return self._recognize_regions(img_grey, horizontal_list[0], free_list[0])
+        
+        # Используем оба reader'а для максимального покрытия языков
+        # 1. Китайский + английский
+        results_ch = self.reader_ch.readtext(image)
+        # 2. Русский + английский
+        results_ru = self.reader_ru.readtext(image)
+        
+        return self._merge(results_ch, results_ru)
+    
+    def _recognize_page(self, page: Any) -> str:
+        """Страница в памяти (PIL.Image, numpy-массив, SharedPage) как numpy array"""
+        return self._recognize(self.page_array(page))
+    
+    def recognize_batch(self, images: List[Any]) -> List[str]:
+        """
+        Распознает пакет страниц.
+        
+        При общей детекции CRAFT запускается один раз на группу страниц,
+        иначе - readtext_batched обоих reader'ов. Пакетный вызов требует
+        изображений одного размера, поэтому страницы группируются по
+        размеру (без масштабирования, чтобы не менять результат);
+        одиночные страницы распознаются по одной.
+        
+        Args:
+            images: Страницы (PIL.Image, numpy-массивы или SharedPage)
+            
+        Returns:
+            List[str]: Текст каждой страницы
+        """
+        arrays = [self.page_array(image) for image in images]
+        texts = [''] * len(arrays)
+        
+        groups: Dict[tuple, List[int]] = {}
+        for i, array in enumerate(arrays):
+            groups.setdefault(array.shape, []).append(i)
+        
+        for indices in groups.values():
+            batch = [arrays[i] for i in indices]
+            if self.shared_detection:
+                for i, text in zip(indices, self._recognize_shared_batch(batch)):
+                    texts[i] = text
+                continue
+            if len(batch) == 1:
+                results_ch = [self.reader_ch.readtext(batch[0])]
+                results_ru = [self.reader_ru.readtext(batch[0])]
+            else:
+                results_ch = self.reader_ch.readtext_batched(batch)
+                results_ru = self.reader_ru.readtext_batched(batch)
+            
+            for i, page_ch, page_ru in zip(indices, results_ch, results_ru):
+                texts[i] = self._merge(page_ch, page_ru)
+        
+        return texts
+    
+    def _recognize_shared_batch(self, batch: List[np.ndarray]) -> List[str]:
+        """
+        Общая детекция для пакета страниц одного размера (один вызов
+        CRAFT на пакет), затем распознавание областей каждой страницы.
+        
+        Args:
+            batch: Страницы одного размера
+            
+        Returns:
+            List[str]: Текст каждой страницы
+        """
+        if len(batch) == 1:
+            return [self._recognize(batch[0])]
+        
+        from easyocr.utils import reformat_input_batched
+        
+        img, img_grey = reformat_input_batched(batch)
+        horizontal_lists, free_lists = self.reader_ru.detect(img, reformat=False)
+        if img_grey.ndim == 2:
+            img_grey = img_grey[np.newaxis]
+        
+        return [
+            self._recognize_regions(grey, horizontal_list, free_list)
+            for grey, horizontal_list, free_list in zip(img_grey, horizontal_lists, free_lists)
+        ]
+    
+    def _recognize_regions(self, img_grey: np.ndarray, horizontal_list: list, free_list: list) -> str:
+        """
+        Распознает найденные области: все - ru+en reader'ом, а области
+        с иероглифами - еще и ch_sim+en reader'ом.
+        
+        Область считается иероглифической, если ru+en reader не уверен в
+        ней или не нашел кириллицы/латиницы/цифр и при этом ее изображение
+        похоже на иероглифы (_looks_cjk). Вариант ch_sim+en заменяет ru+en,
+        только если в нем есть иероглифы и он увереннее.
+        
+        Args:
+            img_grey: Страница в оттенках серого
+            horizontal_list: Прямоугольные области [x_min, x_max, y_min, y_max]
+            free_list: Наклонные области (4 точки)
+            
+        Returns:
+            str: Текст страницы в порядке областей
+        """
+        if not horizontal_list and not free_list:
+            return ''
+        
+        results = self.reader_ru.recognize(img_grey, horizontal_list, free_list, reformat=False)
+        
+        routed = [
+            bbox for bbox, text, confidence in results
+            if (confidence < self.route_confidence or not _RU_EN_SCRIPT_RE.search(text))
+            and _looks_cjk(_crop(img_grey, bbox))
+        ]
+        
+        best = {}
+        if routed:
+            routed_horizontal, routed_free = _split_boxes(routed)
+            for bbox, text, confidence in self.reader_ch.recognize(
+                img_grey, routed_horizontal, routed_free, reformat=False
+            ):
+                best[_box_key(bbox)] = (text, confidence)
+        
+        texts = []
+        for bbox, text, confidence in results:
+            alternative = best.get(_box_key(bbox))
+            if (
+                alternative is not None
+                and alternative[1] > confidence
+                and _CJK_SCRIPT_RE.search(alternative[0])
+            ):
+                text, confidence = alternative
+            if confidence > self.MIN_CONFIDENCE:
+                texts.append(text)
+        
+        return ' '.join(texts)
+    
+    def _merge(self, results_ch: list, results_ru: list) -> str:
+        """
+        Объединяет результаты reader'ов одной страницы.
+        
+        Args:
+            results_ch: Детекции ch_sim+en reader'а
+            results_ru: Детекции ru+en reader'а
+            
+        Returns:
+            str: Текст страницы
+        """
+        # Объединяем результаты (удаляем дубликаты английского)
+        all_texts = []
+        
+        # Добавляем китайский + английский
+        for detection in results_ch:
+            bbox, text, confidence = detection
+            if confidence > self.MIN_CONFIDENCE:
+                all_texts.append(text)
+        
+        # Добавляем только русский (английский уже есть)
+        for detection in results_ru:
+            bbox, text, confidence = detection
+            if confidence > self.MIN_CONFIDENCE and not text.isascii():  # Только не-ASCII (русский)
+                all_texts.append(text)
+        
+        return ' '.join(all_texts)
+
+
+def _box_key(bbox) -> Tuple[Tuple[int, int], ...]:
+    """Ключ области по ее углам (результаты recognize идут не в порядке входа)"""
+    return tuple((int(x), int(y)) for x, y in bbox)
+
+
+def _split_boxes(bboxes: list) -> Tuple[list, list]:
+    """
+    Углы областей из результатов recognize обратно во входной формат:
+    прямоугольники - [x_min, x_max, y_min, y_max], остальные - 4 точки.
+    """
+    horizontal_list, free_list = [], []
+    for bbox in bboxes:
+        (x1, y1), (x2, y2), (x3, y3), (x4, y4) = [(int(x), int(y)) for x, y in bbox]
+        if y1 == y2 and x2 == x3 and y3 == y4 and x1 == x4:
+            horizontal_list.append([x1, x3, y1, y3])
+        else:
+            free_list.append([[x1, y1], [x2, y2], [x3, y3], [x4, y4]])
+    return horizontal_list, free_list
+
+
+def _crop(img_grey: np.ndarray, bbox) -> np.ndarray:
+    """Описанный прямоугольник области на странице"""
+    xs = [int(x) for x, _ in bbox]
+    ys = [int(y) for _, y in bbox]
+    return img_grey[max(min(ys), 0):max(ys), max(min(xs), 0):max(xs)]
+
+
+# Среднее число штрихов, пересекаемых вертикалью через символ: у латиницы
+# и кириллицы 1-3 (в среднем меньше 2), у иероглифов - 3 и больше
+_CJK_MIN_STROKES = 2.5
+
+
+def _looks_cjk(region: np.ndarray) -> bool:
+    """
+    Эвристика письменности по изображению области: иероглифы плотнее
+    по вертикали - столбец символа пересекает больше горизонтальных
+    штрихов, чем у букв.
+    
+    Args:
+        region: Область в оттенках серого (темный текст на светлом фоне)
+        
+    Returns:
+        bool: Область похожа на строку иероглифов
+    """
+    if region.size == 0:
+        return False
+    
+    low, high = int(region.min()), int(region.max())
+    if high - low < 32:
+        return False  # Нет контраста - нечего распознавать
+    
+    ink = region < (low + high) / 2
+    # Начала штрихов: темный пиксель под светлым (или у верхнего края)
+    starts = ink[0].astype(np.int32) + (ink[1:] & ~ink[:-1]).sum(axis=0)
+    inked = starts[starts > 0]
+    if inked.size == 0:
+        return False
+    return float(inked.mean()) >= _CJK_MIN_STROKES
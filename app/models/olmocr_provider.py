@@ -16,6 +16,9 @@ class OLMoCRProvider(BaseOCRProvider):
     ВНИМАНИЕ: Требует GPU с 15GB+ VRAM или использование внешнего API.
     """
     
+    env_prefix = "OLMOCR"
+    engine_package = "olmocr"
+    
     def __init__(self):
         super().__init__("OLMoCR")
         self.use_api = False
@@ -80,7 +83,8 @@ class OLMoCRProvider(BaseOCRProvider):
                     '--pdfs', pdf_path
                 ]
                 
-                result = subprocess.run(
+                result = await self.run_blocking(
+                    subprocess.run,
                     cmd,
                     capture_output=True,
                     text=True,
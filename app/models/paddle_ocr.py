@@ -14,8 +14,11 @@ PP-Structure провайдер для структурного анализа 
 - PPOCR_USE_CHART=true|false (по умолчанию: false)
 """
 from .base_provider import BaseOCRProvider
+from .execution import ExecutionPolicy
 import logging
 from pathlib import Path
+from typing import Any, List, Union
+from PIL import Image
 import os
 
 logger = logging.getLogger(__name__)
@@ -34,6 +37,19 @@ class PaddleOCRProvider(BaseOCRProvider):
     Реализация: TableRecognitionPipelineV2 (стабильная альтернатива для CPU)
     """
     
+    supports_pages = True
+    
+    # Pipeline держит GIL во время инференса: пул worker-процессов,
+    # в каждом свой загруженный pipeline (PADDLE_WORKERS)
+    execution_policy = ExecutionPolicy.WORKER
+    max_workers = 1
+    env_prefix = "PADDLE"
+    engine_package = "paddleocr"
+    
+    # Страницы параллельных задач передаются в predict() одним списком
+    supports_batching = True
+    max_batch_size = 4
+    
     def __init__(self):
         super().__init__("PP-StructureV3")
         self.pipeline = None
@@ -94,6 +110,13 @@ class PaddleOCRProvider(BaseOCRProvider):
             logger.error(f"{self.provider_name}: Ошибка инициализации PP-Structure: {e}")
             raise
     
+    def get_cache_config(self) -> dict:
+        """Переключатели формул/графиков влияют на результат"""
+        return {
+            'use_formula': os.getenv("PPOCR_USE_FORMULA", "false").lower() == "true",
+            'use_chart': os.getenv("PPOCR_USE_CHART", "false").lower() == "true"
+        }
+    
     async def extract_text(self, file_path: str) -> str:
         """
         Извлекает текст с сохранением структуры используя PP-Structure
@@ -116,41 +139,25 @@ class PaddleOCRProvider(BaseOCRProvider):
         else:
             return await self._process_image(file_path)
     
-    async def _process_image(self, image_path: str) -> str:
-        """Обработка одного изображения с PP-Structure pipeline"""
+    async def _process_image(self, source: Union[str, Any]) -> str:
+        """
+        Обработка одного изображения с PP-Structure pipeline.
+        
+        Args:
+            source: Путь к файлу или страница в памяти (PIL.Image,
+                numpy-массив, SharedPage) - передается в pipeline массивом,
+                без временных файлов
+        """
         try:
             # TableRecognitionPipelineV2.predict() возвращает список результатов
-            results = self.pipeline.predict(image_path)
+            results = await self.run_blocking(self._predict, source)
             
             if not results or len(results) == 0:
-                logger.warning(f"{self.provider_name}: Пустой результат для {image_path}")
+                logger.warning(f"{self.provider_name}: Пустой результат для {source if isinstance(source, str) else 'страницы'}")
                 return ""
             
             # Берём первый результат (для одного изображения)
-            page_result = results[0]
-            text_parts = []
-            
-            # 1) Извлекаем общий OCR текст (весь распознанный текст на странице)
-            if 'overall_ocr_res' in page_result:
-                ocr_res = page_result['overall_ocr_res']
-                if 'rec_texts' in ocr_res and ocr_res['rec_texts']:
-                    # Собираем все распознанные строки текста
-                    text_lines = [text for text in ocr_res['rec_texts'] if text.strip()]
-                    if text_lines:
-                        text_parts.append('\n'.join(text_lines))
-            
-            # 2) Извлекаем таблицы (если есть)
-            if 'table_res_list' in page_result and page_result['table_res_list']:
-                for table in page_result['table_res_list']:
-                    # Таблица в HTML формате
-                    if 'pred_html' in table and table['pred_html']:
-                        text_parts.append(f"\n\n[Таблица]\n{table['pred_html']}\n")
-                    
-                    # Текст вокруг таблицы
-                    if 'neighbor_texts' in table and table['neighbor_texts']:
-                        text_parts.append(table['neighbor_texts'])
-            
-            result_text = '\n\n'.join(text_parts)
+            result_text = self._parse_result(results[0])
             logger.debug(f"{self.provider_name}: Извлечено {len(result_text)} символов")
             return result_text
             
@@ -158,38 +165,103 @@ class PaddleOCRProvider(BaseOCRProvider):
             logger.error(f"{self.provider_name}: Ошибка обработки изображения: {e}")
             raise
     
+    def _predict(self, source: Union[str, Any]):
+        """Блокирующий вызов pipeline для файла или страницы в памяти"""
+        if not isinstance(source, str):
+            # Pipeline читает файлы через OpenCV, поэтому массивы ждет в BGR
+            source = self.page_array(source, bgr=True, color=True)
+        return self.pipeline.predict(source)
+    
+    def _parse_result(self, page_result) -> str:
+        """
+        Текст страницы из результата pipeline: общий OCR текст и таблицы.
+        
+        Args:
+            page_result: Результат predict() для одного изображения
+            
+        Returns:
+            str: Текст страницы
+        """
+        text_parts = []
+        
+        # 1) Извлекаем общий OCR текст (весь распознанный текст на странице)
+        if 'overall_ocr_res' in page_result:
+            ocr_res = page_result['overall_ocr_res']
+            if 'rec_texts' in ocr_res and ocr_res['rec_texts']:
+                # Собираем все распознанные строки текста
+                text_lines = [text for text in ocr_res['rec_texts'] if text.strip()]
+                if text_lines:
+                    text_parts.append('\n'.join(text_lines))
+        
+        # 2) Извлекаем таблицы (если есть)
+        if 'table_res_list' in page_result and page_result['table_res_list']:
+            for table in page_result['table_res_list']:
+                # Таблица в HTML формате
+                if 'pred_html' in table and table['pred_html']:
+                    text_parts.append(f"\n\n[Таблица]\n{table['pred_html']}\n")
+                
+                # Текст вокруг таблицы
+                if 'neighbor_texts' in table and table['neighbor_texts']:
+                    text_parts.append(table['neighbor_texts'])
+        
+        return '\n\n'.join(text_parts)
+    
     async def _process_pdf(self, pdf_path: str) -> str:
         """Обработка PDF документа"""
         try:
-            from pdf2image import convert_from_path
-            
-            # Конвертируем PDF в изображения (dpi=250 оптимально)
-            images = convert_from_path(pdf_path, dpi=250)
+            images = await self.rasterize(pdf_path)
             logger.info(f"{self.provider_name}: Конвертировано {len(images)} страниц")
             
-            all_text = []
-            for i, image in enumerate(images, 1):
-                # Сохраняем временно изображение
-                import tempfile
-                with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-                    image.save(tmp.name, 'PNG')
-                    page_text = await self._process_image(tmp.name)
-                    
-                    if page_text:
-                        all_text.append(f"## Страница {i}\n\n{page_text}")
-                    
-                    logger.debug(f"{self.provider_name}: Страница {i}: {len(page_text)} символов")
-                
-                # Удаляем временный файл
-                Path(tmp.name).unlink(missing_ok=True)
-            
-            result = '\n\n'.join(all_text)
+            result = self.join_pages(await self.recognize_pages(images))
             logger.info(f"{self.provider_name}: Всего {len(result)} символов")
             return result
             
-        except ImportError:
-            logger.error(f"{self.provider_name}: pdf2image не установлен")
-            raise ImportError("Установите pdf2image: pip install pdf2image")
         except Exception as e:
             logger.error(f"{self.provider_name}: Ошибка обработки PDF: {e}")
             raise
+    
+    async def recognize_pages(self, pages: List[Any]) -> List[str]:
+        """Обработка растеризованных страниц (параллельно, в порядке страниц)"""
+        if self.pipeline is None:
+            raise RuntimeError(f"{self.provider_name}: Модель не инициализирована")
+        
+        return await self.gather_pages(
+            pages,
+            self.recognize_page_batched if self.batching_enabled else self._process_page
+        )
+    
+    def recognize_batch(self, images: List[Any]) -> List[str]:
+        """
+        Распознает пакет страниц одним вызовом predict() со списком массивов.
+        
+        Args:
+            images: Страницы (PIL.Image, numpy-массивы или SharedPage)
+            
+        Returns:
+            List[str]: Текст каждой страницы
+        """
+        if self.pipeline is None:
+            raise RuntimeError(f"{self.provider_name}: Модель не инициализирована")
+        
+        results = list(self.pipeline.predict([
+            self.page_array(image, bgr=True, color=True) for image in images
+        ]))
+        
+        if len(results) != len(images):
+            raise RuntimeError(
+                f"{self.provider_name}: predict вернул {len(results)} результатов для {len(images)} страниц"
+            )
+        
+        return [self._parse_result(page_result) for page_result in results]
+    
+    async def _process_page(self, page: Any) -> str:
+        """Обработка одной страницы: пиксели передаются в pipeline напрямую"""
+        return await self._process_image(page)
+    
+    def join_pages(self, page_texts: List[str]) -> str:
+        """Склеивает страницы с заголовками "## Страница N" """
+        return '\n\n'.join(
+            f"## Страница {i}\n\n{page_text}"
+            for i, page_text in enumerate(page_texts, 1)
+            if page_text
+        )
@@ -1,8 +1,8 @@
 """
 Pydantic модели для API запросов и ответов
 """
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Literal
+from pydantic import BaseModel, Field, PrivateAttr, field_serializer
+from typing import Any, Iterator, List, Optional, Dict, Literal
 from datetime import datetime
 
 
@@ -50,13 +50,63 @@ class DiffSegment(BaseModel):
 
 
 class ComparisonResult(BaseModel):
-    """Результат сравнения для одного провайдера"""
+    """
+    Результат сравнения для одного провайдера.
+    
+    Внутри сервиса сегменты лежат в компактном SegmentStore (см. segments.py);
+    DiffSegment создаются только при сериализации или через iter_segments().
+    """
     provider_name: str = Field(..., description="Название провайдера")
-    segments: List[DiffSegment] = Field(..., description="Список сегментов с разметкой")
+    segments: List[DiffSegment] = Field(default_factory=list, description="Список сегментов с разметкой")
     total_characters: int = Field(..., description="Общее количество символов")
-    match_count: int = Field(..., description="Количество совпадающих символов")
-    diff_count: int = Field(..., description="Количество различающихся символов")
+    match_count: int = Field(..., description="Количество совпадающих символов (в пословном режиме - токенов)")
+    diff_count: int = Field(..., description="Количество различающихся символов (в пословном режиме - токенов)")
     accuracy_percent: float = Field(..., description="Процент точности относительно консенсуса")
+    word_error_rate: Optional[float] = Field(None, description="Процент пословных ошибок (WER)")
+    
+    # SegmentStore (тип не указан, чтобы не было циклического импорта)
+    _store: Any = PrivateAttr(default=None)
+    # ErrorCounts (см. metrics.py); есть только у свежего результата
+    _errors: Any = PrivateAttr(default=None)
+    
+    @classmethod
+    def from_store(cls, store, errors=None, **fields) -> "ComparisonResult":
+        """Создает результат поверх компактного хранилища сегментов"""
+        result = cls(provider_name=store.provider_name, **fields)
+        result._store = store
+        result._errors = errors
+        return result
+    
+    @property
+    def store(self):
+        """SegmentStore результата или None"""
+        return self._store
+    
+    @property
+    def errors(self):
+        """Счетчики ошибок (ErrorCounts) или None"""
+        return self._errors
+    
+    @property
+    def metrics(self):
+        """Метрики CER/WER (TextMetrics) или None"""
+        return self._errors.metrics() if self._errors is not None else None
+    
+    @property
+    def segment_count(self) -> int:
+        return len(self._store) if self._store is not None else len(self.segments)
+    
+    def iter_segments(self) -> Iterator[DiffSegment]:
+        """Сегменты по одному, без материализации всего списка"""
+        if self._store is not None:
+            return iter(self._store)
+        return iter(self.segments)
+    
+    @field_serializer('segments', mode='wrap')
+    def _serialize_segments(self, segments, handler):
+        if self._store is not None:
+            return self._store.to_dicts()
+        return handler(segments)
 
 
 class OCRStatistics(BaseModel):
@@ -66,6 +116,31 @@ class OCRStatistics(BaseModel):
     differences: int
     accuracy: float = Field(..., description="Процент точности")
     processing_time: float = Field(..., description="Время обработки в секундах")
+    wer: Optional[float] = Field(None, description="Процент пословных ошибок (WER)")
+    cer: Optional[float] = Field(None, description="Процент символьных ошибок (CER)")
+    edit_distance: Optional[int] = Field(None, description="Расстояние правок (Левенштейн) до референса")
+    normalized_edit_distance: Optional[float] = Field(
+        None,
+        description="Расстояние правок / длина большего текста (0..1)"
+    )
+    substitutions: Optional[int] = Field(None, description="Замененных символов")
+    deletions: Optional[int] = Field(None, description="Пропущенных символов референса")
+    insertions: Optional[int] = Field(None, description="Лишних (вставленных) символов")
+    class_error_rates: Optional[Dict[str, float]] = Field(
+        None,
+        description="Процент ошибок по классам символов: digits, cyrillic, latin, cjk, other"
+    )
+
+
+class PreprocessingStats(BaseModel):
+    """Предобработка страниц документа: выбранный DPI и экономия пикселей"""
+    dpi: List[Optional[int]] = Field(..., description="DPI рендеринга каждой страницы (None - исходное изображение)")
+    skew: List[float] = Field(..., description="Исправленный наклон каждой страницы в градусах")
+    pixels: int = Field(..., description="Пикселей после предобработки")
+    baseline_pixels: int = Field(..., description="Пикселей при фиксированном OCR_RASTER_DPI")
+    pixel_savings_percent: float = Field(..., description="Экономия пикселей относительно фиксированного DPI")
+    bytes: int = Field(..., description="Байт растров после предобработки")
+    baseline_bytes: int = Field(..., description="Байт RGB-растров при фиксированном DPI")
 
 
 class ComparisonResponse(BaseModel):
@@ -96,6 +171,12 @@ class ComparisonResponse(BaseModel):
         description="Статистика по каждой модели"
     )
     
+    # Предобработка страниц (None - документ не растеризовался)
+    preprocessing: Optional[PreprocessingStats] = Field(
+        None,
+        description="DPI, наклон и экономия пикселей по страницам"
+    )
+    
     # HTML визуализация (опционально)
     html_visualization: Optional[str] = Field(
         None,
@@ -121,6 +202,20 @@ class UploadResponse(BaseModel):
     task_id: str = Field(..., description="ID задачи для отслеживания")
     filename: str = Field(..., description="Имя файла")
     message: str = Field(..., description="Статусное сообщение")
+    size: Optional[int] = Field(None, description="Размер файла в байтах")
+    sha256: Optional[str] = Field(None, description="SHA-256 содержимого файла")
+
+
+class RejectedUpload(BaseModel):
+    """Файл пакета, который не был принят"""
+    filename: str = Field(..., description="Имя файла (для ZIP - путь внутри архива)")
+    reason: str = Field(..., description="Причина отказа")
+
+
+class BatchUploadResponse(BaseModel):
+    """Ответ при пакетной загрузке (несколько файлов и/или ZIP-архивы)"""
+    uploads: List[UploadResponse] = Field(..., description="Принятые документы, по задаче на каждый")
+    rejected: List[RejectedUpload] = Field(default_factory=list, description="Отклоненные файлы")
 
 
 class StatusResponse(BaseModel):
@@ -129,3 +224,37 @@ class StatusResponse(BaseModel):
     status: Literal["pending", "processing", "completed", "failed"]
     progress: int = Field(..., ge=0, le=100, description="Прогресс обработки в процентах")
     message: Optional[str] = None
+    pages_done: Optional[int] = Field(None, description="Готово страниц (суммарно по всем провайдерам)")
+    pages_total: Optional[int] = Field(None, description="Всего страниц (суммарно по всем провайдерам)")
+
+
+class BatchResponse(BaseModel):
+    """Ответ при создании пакета документов"""
+    batch_id: str = Field(..., description="ID пакета")
+    uploads: List[UploadResponse] = Field(..., description="Документы пакета, по задаче на каждый")
+    rejected: List[RejectedUpload] = Field(default_factory=list, description="Отклоненные файлы")
+
+
+class BatchStatusResponse(BaseModel):
+    """Сводный статус пакета документов"""
+    batch_id: str
+    status: Literal["processing", "completed"]
+    progress: int = Field(..., ge=0, le=100, description="Средний прогресс документов в процентах")
+    total: int = Field(..., description="Документов в пакете")
+    counts: Dict[str, int] = Field(..., description="Количество документов по статусам")
+    documents: List[StatusResponse] = Field(..., description="Статус каждого документа")
+
+
+class BatchDocumentResult(BaseModel):
+    """Результат одного документа пакета"""
+    task_id: str
+    filename: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+    statistics: List[OCRStatistics] = Field(default_factory=list, description="Статистика по провайдерам")
+
+
+class BatchResultsResponse(BaseModel):
+    """Результаты пакета: статистика каждого готового документа"""
+    batch_id: str
+    documents: List[BatchDocumentResult]
@@ -0,0 +1,159 @@
+"""
+Компактное хранилище сегментов сравнения.
+
+Вместо Pydantic-модели DiffSegment со своим словарем providers_data на
+каждый опкод хранятся параллельные массивы (тип опкода и смещения) и
+ссылки на исходные строки, без копий подстрок. DiffSegment создаются
+только на границе API: при итерации или сериализации в JSON.
+"""
+from array import array
+from typing import Dict, Iterator, List, Tuple
+
+from .schemas import DiffSegment
+
+EQUAL, REPLACE, DELETE, INSERT = range(4)
+
+_TAG_CODES = {'equal': EQUAL, 'replace': REPLACE, 'delete': DELETE, 'insert': INSERT}
+_SEGMENT_TYPES = ('match', 'major_diff', 'minor_diff', 'minor_diff')
+
+
+class SegmentStore:
+    """
+    Сегменты одного провайдера относительно референса.
+
+    Позиции сегментов совпадают со смещениями в референсе, поэтому
+    start_position/end_position не хранятся отдельно.
+    """
+
+    __slots__ = ('reference', 'comparison', 'provider_name', 'tags', 'ref_offsets', 'cmp_offsets')
+
+    def __init__(self, reference: str, comparison: str, provider_name: str):
+        """
+        Args:
+            reference: Референсный текст
+            comparison: Текст провайдера
+            provider_name: Название провайдера
+        """
+        self.reference = reference
+        self.comparison = comparison
+        self.provider_name = provider_name
+        self.tags = array('b')
+        # Пары (начало, конец) подряд: [i1, i2, i1, i2, ...]
+        self.ref_offsets = array('q')
+        self.cmp_offsets = array('q')
+
+    @classmethod
+    def from_opcodes(
+        cls,
+        reference: str,
+        comparison: str,
+        provider_name: str,
+        opcodes: List[Tuple[str, int, int, int, int]]
+    ) -> "SegmentStore":
+        """
+        Создает хранилище по опкодам в формате difflib.
+
+        Args:
+            reference: Референсный текст
+            comparison: Текст провайдера
+            provider_name: Название провайдера
+            opcodes: Опкоды выравнивания
+
+        Returns:
+            SegmentStore: Хранилище сегментов
+        """
+        store = cls(reference, comparison, provider_name)
+        for tag, i1, i2, j1, j2 in opcodes:
+            store.tags.append(_TAG_CODES[tag])
+            store.ref_offsets.extend((i1, i2))
+            store.cmp_offsets.extend((j1, j2))
+        return store
+
+    def to_bytes(self) -> bytes:
+        """Опкоды одним блоком байт: типы, затем смещения референса и текста"""
+        return self.tags.tobytes() + self.ref_offsets.tobytes() + self.cmp_offsets.tobytes()
+
+    @classmethod
+    def from_bytes(
+        cls,
+        reference: str,
+        comparison: str,
+        provider_name: str,
+        data: bytes,
+        count: int
+    ) -> "SegmentStore":
+        """
+        Восстанавливает хранилище из блока to_bytes().
+
+        Args:
+            reference: Референсный текст
+            comparison: Текст провайдера
+            provider_name: Название провайдера
+            data: Блок байт (может быть длиннее: лишнее игнорируется)
+            count: Количество опкодов
+
+        Returns:
+            SegmentStore: Хранилище сегментов
+        """
+        store = cls(reference, comparison, provider_name)
+        width = store.ref_offsets.itemsize * 2 * count
+        store.tags.frombytes(data[:count])
+        store.ref_offsets.frombytes(data[count:count + width])
+        store.cmp_offsets.frombytes(data[count + width:count + 2 * width])
+        return store
+
+    @staticmethod
+    def byte_size(count: int) -> int:
+        """Длина блока to_bytes() для count опкодов"""
+        return count * (array('b').itemsize + 4 * array('q').itemsize)
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def counts(self) -> Tuple[int, int]:
+        """
+        Символы референса в совпадениях и в различиях.
+
+        Returns:
+            Tuple[int, int]: (совпадения, различия)
+        """
+        match_count = diff_count = 0
+        offsets = self.ref_offsets
+
+        for k, tag in enumerate(self.tags):
+            length = offsets[2 * k + 1] - offsets[2 * k]
+            if tag == EQUAL:
+                match_count += length
+            else:
+                diff_count += length
+
+        return match_count, diff_count
+
+    def segment_dict(self, k: int) -> Dict:
+        """Сегмент k в виде словаря с полями DiffSegment"""
+        i1, i2 = self.ref_offsets[2 * k], self.ref_offsets[2 * k + 1]
+        j1, j2 = self.cmp_offsets[2 * k], self.cmp_offsets[2 * k + 1]
+        text = self.reference[i1:i2]
+
+        return {
+            'text': text,
+            'segment_type': _SEGMENT_TYPES[self.tags[k]],
+            'start_position': i1,
+            'end_position': i2,
+            'providers_data': {
+                'reference': text,
+                self.provider_name: self.comparison[j1:j2]
+            }
+        }
+
+    def segment(self, k: int) -> DiffSegment:
+        """Сегмент k как DiffSegment (без повторной валидации)"""
+        return DiffSegment.model_construct(**self.segment_dict(k))
+
+    def __iter__(self) -> Iterator[DiffSegment]:
+        for k in range(len(self.tags)):
+            yield self.segment(k)
+
+    def to_dicts(self) -> List[Dict]:
+        """Все сегменты в виде словарей (для сериализации в JSON)"""
+        return [self.segment_dict(k) for k in range(len(self.tags))]
@@ -1,56 +1,62 @@
 """
 Сервис для посимвольного выравнивания и сравнения текстов от разных OCR моделей
 """
-import difflib
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional
 from collections import Counter
 import logging
+import os
 
 from app.models.schemas import RawOCRResult, DiffSegment, ComparisonResult
+from app.models.segments import SegmentStore
+from app.services.diff_engines import Opcode, count_matches, get_opcodes, line_opcodes
+from app.services.metrics import count_errors
+from app.services.msa import MultipleAlignment
+from app.services.tokens import Vocabulary, char_opcodes, token_opcodes, word_errors
 
 logger = logging.getLogger(__name__)
 
+# Режимы сравнения: посимвольный и пословный (по токенам, см. tokens.py)
+ALIGNMENT_MODES = ('char', 'word')
+DEFAULT_MODE = os.getenv("ALIGNMENT_MODE", "char")
+
 
 class TextAlignmentService:
     """
     Сервис для выравнивания и сравнения текстов от разных OCR провайдеров.
-    Использует алгоритм Longest Common Subsequence (LCS) из difflib.
+    Движок выравнивания выбирается per-request (см. diff_engines.py):
+    difflib, myers или anchored (по умолчанию ALIGNMENT_ENGINE).
+    Референс - консенсус множественного выравнивания (см. msa.py)
+    или эталонный текст, если он известен (текстовый слой PDF).
+    Режим char сравнивает символы, word - токены (слова, числа,
+    CJK-символы). Метрики CER/WER в обоих режимах - см. metrics.py.
     """
     
     @staticmethod
-    def find_consensus_text(results: List[RawOCRResult]) -> str:
+    def find_consensus_text(
+        results: List[RawOCRResult],
+        engine: Optional[str] = None
+    ) -> str:
         """
-        Находит консенсусный текст (наиболее частую версию).
+        Находит консенсусный текст голосованием по множественному выравниванию.
         Используется как референс для сравнения.
         
         Args:
             results: Список результатов от OCR провайдеров
+            engine: Движок попарного выравнивания
             
         Returns:
-            str: Консенсусный текст (самый длинный или наиболее частый)
+            str: Консенсусный текст (символ большинства в каждой колонке)
         """
-        if not results:
-            return ""
-        
-        # Простая эвристика: берем самый длинный текст как референс
-        # (обычно более полный)
-        texts = [r.text for r in results if r.text]
-        
-        if not texts:
-            return ""
+        texts = [r.text for r in results if r.error is None and r.text]
         
-        # Сортируем по длине и берем самый длинный
-        reference = max(texts, key=len)
-        
-        logger.debug(f"Выбран референсный текст длиной {len(reference)} символов")
-        
-        return reference
+        return MultipleAlignment(texts, engine).consensus
     
     @staticmethod
     def align_texts(
         reference: str,
         comparison: str,
-        provider_name: str
+        provider_name: str,
+        engine: Optional[str] = None
     ) -> List[DiffSegment]:
         """
         Выравнивает два текста и создает сегменты с разметкой различий.
@@ -59,84 +65,38 @@ class TextAlignmentService:
             reference: Референсный текст
             comparison: Текст для сравнения
             provider_name: Название провайдера
+            engine: Движок выравнивания (difflib, myers, anchored)
             
         Returns:
             List[DiffSegment]: Список сегментов с информацией о различиях
         """
-        segments = []
-        
-        # Используем SequenceMatcher для посимвольного сравнения
-        matcher = difflib.SequenceMatcher(None, reference, comparison)
-        
-        position = 0
-        
-        # Получаем операции выравнивания
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-            if tag == 'equal':
-                # Совпадающий сегмент
-                text = reference[i1:i2]
-                segments.append(DiffSegment(
-                    text=text,
-                    segment_type='match',
-                    start_position=position,
-                    end_position=position + len(text),
-                    providers_data={
-                        'reference': text,
-                        provider_name: comparison[j1:j2]
-                    }
-                ))
-                position += len(text)
-                
-            elif tag == 'replace':
-                # Замена символов - различие
-                ref_text = reference[i1:i2]
-                comp_text = comparison[j1:j2]
-                
-                segments.append(DiffSegment(
-                    text=ref_text,
-                    segment_type='major_diff',
-                    start_position=position,
-                    end_position=position + len(ref_text),
-                    providers_data={
-                        'reference': ref_text,
-                        provider_name: comp_text
-                    }
-                ))
-                position += len(ref_text)
-                
-            elif tag == 'delete':
-                # Символы есть в reference, но нет в comparison
-                ref_text = reference[i1:i2]
-                
-                segments.append(DiffSegment(
-                    text=ref_text,
-                    segment_type='minor_diff',
-                    start_position=position,
-                    end_position=position + len(ref_text),
-                    providers_data={
-                        'reference': ref_text,
-                        provider_name: ''
-                    }
-                ))
-                position += len(ref_text)
-                
-            elif tag == 'insert':
-                # Символы есть в comparison, но нет в reference
-                # Пропускаем или отмечаем как вставку
-                comp_text = comparison[j1:j2]
-                
-                segments.append(DiffSegment(
-                    text='',
-                    segment_type='minor_diff',
-                    start_position=position,
-                    end_position=position,
-                    providers_data={
-                        'reference': '',
-                        provider_name: comp_text
-                    }
-                ))
+        return TextAlignmentService.segments_from_opcodes(
+            reference,
+            comparison,
+            provider_name,
+            get_opcodes(reference, comparison, engine)
+        )
+    
+    @staticmethod
+    def segments_from_opcodes(
+        reference: str,
+        comparison: str,
+        provider_name: str,
+        opcodes: List[Opcode]
+    ) -> List[DiffSegment]:
+        """
+        Создает сегменты с разметкой различий по готовым опкодам.
         
-        return segments
+        Args:
+            reference: Референсный текст
+            comparison: Текст для сравнения
+            provider_name: Название провайдера
+            opcodes: Опкоды выравнивания в формате difflib
+            
+        Returns:
+            List[DiffSegment]: Список сегментов с информацией о различиях
+        """
+        return list(SegmentStore.from_opcodes(reference, comparison, provider_name, opcodes))
     
     @staticmethod
     def merge_multiple_alignments(
@@ -147,45 +107,74 @@ class TextAlignmentService:
         Объединяет выравнивания от всех провайдеров.
         Создает общие сегменты с данными от каждого провайдера.
         
+        Каждый текст делится на строки один раз и выравнивается с
+        референсом построчным patience diff. Сегмент - группа строк
+        референса вместе с соответствующими ей строками каждого
+        провайдера: группа не разрывает замену ни у одного провайдера,
+        а строки, вставленные провайдером, образуют отдельный сегмент
+        с пустым референсом. Время линейно по числу строк при типичных
+        для OCR расхождениях.
+        
         Args:
             reference: Референсный текст
             all_results: Результаты от всех провайдеров
             
         Returns:
             List[DiffSegment]: Объединенные сегменты
+            (start_position/end_position - номера строк референса)
         """
-        # Сначала создаем базовые сегменты на основе референсного текста
-        # Затем для каждого провайдера добавляем его версию
-        
-        merged_segments = []
-        
-        # Для простоты: разбиваем на строки и сравниваем построчно
         ref_lines = reference.split('\n')
+        n = len(ref_lines)
         
-        for line_idx, ref_line in enumerate(ref_lines):
-            # Собираем версии этой строки от всех провайдеров
-            providers_data = {'reference': ref_line}
-            
-            # Определяем тип сегмента
-            all_equal = True
+        # Границы групп: края опкодов всех провайдеров, кроме точек
+        # внутри замен (строки замены не соответствуют друг другу по одной)
+        cuts = [False] * (n + 1)
+        cuts[0] = cuts[n] = True
+        inside_replace = [False] * (n + 1)
+        
+        # Позиция в строках провайдера для границы референса:
+        # до вставленных в этой точке строк и после них
+        providers = []
+        for result in all_results:
+            lines = result.text.split('\n')
+            before: List[Optional[int]] = [None] * (n + 1)
+            after: List[Optional[int]] = [None] * (n + 1)
             
-            for result in all_results:
-                text_lines = result.text.split('\n')
+            for tag, i1, i2, j1, j2 in line_opcodes(ref_lines, lines):
+                cuts[i1] = cuts[i2] = True
+                if tag == 'insert':
+                    if before[i1] is None:
+                        before[i1] = j1
+                    after[i1] = j2
+                    continue
                 
-                if line_idx < len(text_lines):
-                    comp_line = text_lines[line_idx]
+                if tag == 'replace':
+                    for x in range(i1 + 1, i2):
+                        inside_replace[x] = True
+                    points = ((i1, j1), (i2, j2))
+                elif tag == 'equal':
+                    points = ((x, j1 + x - i1) for x in range(i1, i2 + 1))
                 else:
-                    comp_line = ''
-                
-                providers_data[result.provider_name] = comp_line
+                    points = ((x, j1) for x in range(i1, i2 + 1))
                 
-                if comp_line != ref_line:
-                    all_equal = False
+                for x, j in points:
+                    if before[x] is None:
+                        before[x] = j
+                    after[x] = j
+            
+            providers.append((result.provider_name, lines, before, after))
+        
+        boundaries = [x for x in range(n + 1) if cuts[x] and not inside_replace[x]]
+        merged_segments = []
+        
+        def add_segment(s: int, e: int, ref_text: str, spans) -> None:
+            providers_data = {'reference': ref_text}
+            for (name, lines, _, _), (j1, j2) in zip(providers, spans):
+                providers_data[name] = '\n'.join(lines[j1:j2])
             
             # Определяем тип различия
             unique_versions = len(set(providers_data.values()))
-            
-            if all_equal or unique_versions == 1:
+            if unique_versions == 1:
                 segment_type = 'match'
             elif unique_versions <= 2:
                 segment_type = 'minor_diff'
@@ -193,56 +182,45 @@ class TextAlignmentService:
                 segment_type = 'major_diff'
             
             merged_segments.append(DiffSegment(
-                text=ref_line,
+                text=ref_text,
                 segment_type=segment_type,
-                start_position=line_idx,
-                end_position=line_idx + 1,
+                start_position=s,
+                end_position=e,
                 providers_data=providers_data
             ))
         
-        return merged_segments
-    
-    @staticmethod
-    def calculate_accuracy(
-        segments: List[DiffSegment],
-        total_chars: int
-    ) -> Tuple[int, int, float]:
-        """
-        Вычисляет метрики точности.
-        
-        Args:
-            segments: Список сегментов
-            total_chars: Общее количество символов
+        for index, s in enumerate(boundaries):
+            # Строки, вставленные провайдерами перед строкой s референса
+            if any(before[s] != after[s] for _, _, before, after in providers):
+                add_segment(s, s, '', [(before[s], after[s]) for _, _, before, after in providers])
             
-        Returns:
-            Tuple[int, int, float]: (совпадения, различия, процент точности)
-        """
-        match_count = 0
-        diff_count = 0
-        
-        for segment in segments:
-            if segment.segment_type == 'match':
-                match_count += len(segment.text)
-            else:
-                diff_count += len(segment.text)
-        
-        if total_chars == 0:
-            accuracy = 0.0
-        else:
-            accuracy = (match_count / total_chars) * 100
+            if index + 1 < len(boundaries):
+                e = boundaries[index + 1]
+                add_segment(
+                    s, e,
+                    '\n'.join(ref_lines[s:e]),
+                    [(after[s], before[e]) for _, _, before, after in providers]
+                )
         
-        return match_count, diff_count, accuracy
+        return merged_segments
     
     @classmethod
     def create_comparison_results(
         cls,
-        raw_results: List[RawOCRResult]
+        raw_results: List[RawOCRResult],
+        engine: Optional[str] = None,
+        reference: Optional[str] = None,
+        mode: Optional[str] = None
     ) -> List[ComparisonResult]:
         """
         Создает полные результаты сравнения для всех провайдеров.
         
         Args:
             raw_results: Сырые результаты от OCR провайдеров
+            engine: Движок выравнивания (по умолчанию ALIGNMENT_ENGINE)
+            reference: Эталонный текст (например, текстовый слой PDF);
+                None - референсом служит консенсус
+            mode: Режим сравнения char или word (по умолчанию ALIGNMENT_MODE)
             
         Returns:
             List[ComparisonResult]: Результаты с сегментами и метриками
@@ -250,42 +228,161 @@ class TextAlignmentService:
         if not raw_results:
             return []
         
-        # Находим консенсусный текст (самый длинный)
-        reference = cls.find_consensus_text(raw_results)
+        mode = mode or DEFAULT_MODE
+        if mode == 'word':
+            return cls.create_word_comparison_results(raw_results, engine, reference)
+        if mode != 'char':
+            raise ValueError(
+                f"Неизвестный режим сравнения: {mode}. Доступны: {', '.join(ALIGNMENT_MODES)}"
+            )
+        
+        if reference is not None:
+            # С эталоном каждый текст выравнивается с ним попарно
+            voters = []
+        else:
+            # Одно общее выравнивание всех успешных текстов; консенсус - референс
+            voters = [
+                index for index, result in enumerate(raw_results)
+                if result.error is None and result.text
+            ]
+            alignment = MultipleAlignment([raw_results[k].text for k in voters], engine)
+            reference = alignment.consensus
+        row_of = {index: row for row, index in enumerate(voters)}
+        
+        # WER - по отдельному выравниванию токенов с референсом
+        vocabulary = Vocabulary()
+        ref_tokens = vocabulary.tokenize(reference)
         
         # Создаем результаты для каждого провайдера ОТДЕЛЬНО
         comparison_results = []
         
-        for result in raw_results:
-            # ВАЖНО: создаем УНИКАЛЬНЫЕ segments для каждого провайдера
-            provider_segments = cls.align_texts(
-                reference=reference,
-                comparison=result.text,
-                provider_name=result.provider_name
+        for index, result in enumerate(raw_results):
+            # Опкоды участников берем из общего выравнивания;
+            # упавшие провайдеры в голосовании не участвуют
+            if index in row_of:
+                opcodes = alignment.opcodes(row_of[index])
+            else:
+                opcodes = get_opcodes(reference, result.text, engine)
+            
+            # Сегменты провайдера - компактное хранилище поверх исходных строк
+            store = SegmentStore.from_opcodes(
+                reference,
+                result.text,
+                result.provider_name,
+                opcodes
             )
             
-            # Вычисляем метрики на основе СОБСТВЕННЫХ сегментов провайдера
             total_chars = len(result.text)
-            match_count, diff_count, accuracy = cls.calculate_accuracy(
-                provider_segments,
-                len(reference)  # Используем длину референса для корректного расчета
-            )
+            match_count, diff_count = store.counts()
+            
+            word_opcodes = token_opcodes(ref_tokens.ids, vocabulary.tokenize(result.text).ids, engine)
+            errors = count_errors(store, word_errors(word_opcodes), len(ref_tokens))
+            metrics = errors.metrics()
             
-            comparison_results.append(ComparisonResult(
-                provider_name=result.provider_name,
-                segments=provider_segments,  # УНИКАЛЬНЫЕ сегменты
+            # Точность - по длине референса и вставкам провайдера
+            accuracy = errors.accuracy(match_count)
+            
+            comparison_results.append(ComparisonResult.from_store(
+                store,
+                errors=errors,
                 total_characters=total_chars,  # РЕАЛЬНОЕ количество символов
                 match_count=match_count,
                 diff_count=diff_count,
-                accuracy_percent=accuracy
+                accuracy_percent=accuracy,
+                word_error_rate=metrics.wer
             ))
             
             logger.debug(
                 f"{result.provider_name}: {total_chars} символов, "
                 f"{match_count} совпадений, {diff_count} различий, "
-                f"{accuracy:.2f}% точность"
+                f"{accuracy:.2f}% точность, CER {metrics.cer:.2f}%, WER {metrics.wer:.2f}%"
             )
         
         logger.info(f"Создано {len(comparison_results)} результатов сравнения")
         
         return comparison_results
+    
+    @staticmethod
+    def create_word_comparison_results(
+        raw_results: List[RawOCRResult],
+        engine: Optional[str] = None,
+        reference: Optional[str] = None
+    ) -> List[ComparisonResult]:
+        """
+        Пословное сравнение: тексты разбиваются на токены, токены
+        интернируются в массивы int32, и выравниваются коды токенов.
+        
+        Последовательности в несколько раз короче посимвольных, поэтому
+        на длинных документах режим заметно быстрее. Консенсус собирается
+        из токенов большинства (через пробел), сегменты указывают на
+        символы исходных текстов. match_count/diff_count считаются в
+        токенах референса, WER - (замены + удаления + вставки) / токены
+        референса, точность - совпадения / (совпадения + ошибки токенов).
+        Пробелы не сравниваются: сегмент match может отличаться от
+        референса пробелами и переводами строк (см. char_opcodes).
+        
+        Args:
+            raw_results: Сырые результаты от OCR провайдеров
+            engine: Движок выравнивания токенов
+            reference: Эталонный текст; None - референсом служит консенсус
+            
+        Returns:
+            List[ComparisonResult]: Результаты с сегментами, метриками и WER
+        """
+        vocabulary = Vocabulary()
+        tokenized = [vocabulary.tokenize(result.text) for result in raw_results]
+        
+        if reference is not None:
+            voters = []
+            ref_tokens = vocabulary.tokenize(reference)
+        else:
+            voters = [
+                index for index, result in enumerate(raw_results)
+                if result.error is None and len(tokenized[index])
+            ]
+            alignment = MultipleAlignment([tokenized[k].ids.tolist() for k in voters], engine)
+            ref_tokens = vocabulary.detokenize(alignment.consensus)
+        row_of = {index: row for row, index in enumerate(voters)}
+        ref_count = len(ref_tokens)
+        
+        comparison_results = []
+        
+        for index, result in enumerate(raw_results):
+            if index in row_of:
+                opcodes = alignment.opcodes(row_of[index])
+            else:
+                opcodes = token_opcodes(ref_tokens.ids, tokenized[index].ids, engine)
+            
+            store = SegmentStore.from_opcodes(
+                ref_tokens.text,
+                result.text,
+                result.provider_name,
+                char_opcodes(opcodes, ref_tokens, tokenized[index])
+            )
+            
+            errors = count_errors(store, word_errors(opcodes), ref_count, whole_text=False)
+            metrics = errors.metrics()
+            match_count = count_matches(opcodes)
+            accuracy = errors.accuracy(match_count, words=True)
+            
+            comparison_results.append(ComparisonResult.from_store(
+                store,
+                errors=errors,
+                total_characters=len(result.text),
+                match_count=match_count,
+                diff_count=ref_count - match_count,
+                accuracy_percent=accuracy,
+                word_error_rate=metrics.wer
+            ))
+            
+            logger.debug(
+                f"{result.provider_name}: {len(tokenized[index])} токенов, "
+                f"{match_count} совпадений, WER {metrics.wer:.2f}%"
+            )
+        
+        logger.info(
+            f"Создано {len(comparison_results)} результатов пословного сравнения "
+            f"({ref_count} токенов референса, словарь {len(vocabulary)})"
+        )
+        
+        return comparison_results
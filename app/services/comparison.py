@@ -3,7 +3,8 @@
 """
 import asyncio
 import logging
-from typing import List, Dict
+import os
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 import uuid
 
@@ -13,8 +14,26 @@ from app.models.schemas import (
     ComparisonResponse,
     ComparisonResult
 )
-from app.models.base_provider import BaseOCRProvider
+from app.models.base_provider import BaseOCRProvider, page_callback, page_group
 from app.services.alignment import TextAlignmentService
+from app.services.document_store import DocumentStore
+from app.services.html_cache import HTMLCache
+from app.services.page_alignment import (
+    PAGE_ALIGNMENT_ENABLED,
+    PageAligner,
+    align_document,
+    create_alignment_pool
+)
+from app.services.preprocessing import PagePreprocessor
+from app.services.rasterizer import PageCache
+from app.services.result_cache import OCRResultCache, hash_file
+from app.services.shared_pages import SharedPage
+from app.services.progress import TaskProgress
+from app.services.scheduler import FairScheduler
+from app.services.task_store import TaskStore
+from app.services.text_layer import TEXT_LAYER_PROVIDER, TextLayer, TextLayerClassifier
+from app.services.worker_pool import ProviderWorkerPool
+from PIL import Image
 
 logger = logging.getLogger(__name__)
 
@@ -24,16 +43,59 @@ class OCRComparisonService:
     Основной сервис для управления процессом сравнения OCR моделей.
     """
     
-    def __init__(self, providers: List[BaseOCRProvider]):
+    def __init__(
+        self,
+        providers: List[BaseOCRProvider],
+        result_cache: Optional[OCRResultCache] = None,
+        task_store: Optional[TaskStore] = None,
+        documents: Optional[DocumentStore] = None
+    ):
         """
         Инициализация сервиса
         
         Args:
             providers: Список OCR провайдеров для использования
+            result_cache: Кэш результатов OCR (None - без кэширования)
+            task_store: Хранилище задач (по умолчанию - из переменных окружения)
+            documents: Хранилище документов и артефактов (по умолчанию - из переменных окружения)
         """
         self.providers = providers
         self.alignment_service = TextAlignmentService()
-        self.tasks: Dict[str, dict] = {}  # Хранилище задач
+        self.alignment_pool = create_alignment_pool()  # Выравнивание страниц вне event loop
+        self.preprocessor = PagePreprocessor.from_env()  # DPI по странице, серый, наклон, бинаризация
+        self.page_cache = PageCache(preprocessor=self.preprocessor)  # Общие растеризованные страницы
+        self.result_cache = result_cache
+        self.task_store = task_store or TaskStore.from_env()  # Хранилище задач и результатов
+        self.documents = documents or DocumentStore.from_env()  # Загруженные файлы и артефакты
+        self.html_cache = HTMLCache(self.documents)  # HTML визуализации на диске
+        self.save_page_artifacts = os.getenv("SAVE_PAGE_ARTIFACTS", "false").lower() == "true"
+        self.text_layer = TextLayerClassifier.from_env()  # Быстрый путь для PDF с текстовым слоем
+        
+        # Пулы worker-процессов для провайдеров с worker-политикой:
+        # модели загружаются в них, а не в процессе API
+        self.worker_pools: Dict[str, ProviderWorkerPool] = {}
+        for provider in providers:
+            if provider.uses_worker_pool:
+                pool = ProviderWorkerPool(provider, provider.max_workers)
+                provider.worker_pool = pool
+                self.worker_pools[provider.provider_name] = pool
+        
+        # Общие слоты страниц каждого провайдера: при нескольких документах
+        # в работе страницы выдаются по кругу между пакетами и документами.
+        # Слотов хватает, чтобы каждый процесс получал полный пакет страниц
+        self.schedulers: Dict[str, FairScheduler] = {}
+        if os.getenv("PAGE_SCHEDULER_ENABLED", "true").lower() == "true":
+            slots = int(os.getenv("PAGE_SCHEDULER_SLOTS", "0"))
+            batch_cap = int(os.getenv("PAGE_SCHEDULER_BATCH_CAP", "0"))
+            for provider in providers:
+                batch_size = provider.max_batch_size if provider.batching_enabled else 1
+                scheduler = FairScheduler(
+                    provider.provider_name,
+                    slots or max(provider.page_concurrency, provider.max_workers * batch_size),
+                    batch_cap
+                )
+                provider.page_scheduler = scheduler
+                self.schedulers[provider.provider_name] = scheduler
         
         logger.info(f"OCRComparisonService инициализирован с {len(providers)} провайдерами")
     
@@ -41,8 +103,10 @@ class OCRComparisonService:
         """Инициализация всех провайдеров"""
         logger.info("Инициализация OCR провайдеров...")
         
+        # start() учитывает политику выполнения: worker-провайдеры
+        # загружают модели в своих процессах, а не в процессе API
         init_tasks = [
-            provider.initialize() 
+            provider.start()
             for provider in self.providers
         ]
         
@@ -54,11 +118,33 @@ class OCRComparisonService:
             else:
                 logger.info(f"✓ {provider.provider_name} инициализирован")
     
+    def shutdown(self) -> None:
+        """Освобождение ресурсов провайдеров и остановка worker-процессов"""
+        for provider in self.providers:
+            try:
+                provider.cleanup()
+            except Exception as e:
+                logger.error(f"Ошибка очистки {provider.provider_name}: {e}")
+        
+        for pool in self.worker_pools.values():
+            pool.shutdown()
+        
+        self.alignment_pool.shutdown(cancel_futures=True)
+        
+        if self.result_cache is not None:
+            self.result_cache.close()
+        
+        self.task_store.close()
+        self.documents.close()
+    
     async def process_document(
         self,
         file_path: str,
         filename: str,
-        task_id: str = None
+        task_id: str = None,
+        alignment_engine: Optional[str] = None,
+        batch_id: Optional[str] = None,
+        alignment_mode: Optional[str] = None
     ) -> ComparisonResponse:
         """
         Обрабатывает документ через все OCR модели и создает сравнение.
@@ -67,6 +153,9 @@ class OCRComparisonService:
             file_path: Путь к файлу
             filename: Имя файла
             task_id: ID задачи (опционально)
+            alignment_engine: Движок выравнивания (по умолчанию ALIGNMENT_ENGINE)
+            batch_id: Пакет документа (для справедливого распределения страниц)
+            alignment_mode: Режим сравнения char или word (по умолчанию ALIGNMENT_MODE)
             
         Returns:
             ComparisonResponse: Полный результат сравнения
@@ -77,37 +166,100 @@ class OCRComparisonService:
         logger.info(f"Обработка документа {filename} (task_id: {task_id})")
         
         # Обновляем статус задачи
-        self.tasks[task_id] = {
-            'status': 'processing',
-            'filename': filename,
-            'started_at': datetime.now()
-        }
+        started_at = datetime.now()
+        await asyncio.to_thread(self.task_store.create, task_id, filename, started_at)
+        
+        pages = None
+        aligner = None
+        progress = None
+        group_token = page_group.set((batch_id or task_id, task_id))
         
         try:
-            # Шаг 1: Параллельная обработка через все OCR
-            raw_results = await self._run_all_ocr(file_path)
+            # Шаг 1: Текстовый слой PDF - страницы с ним не распознаются
+            text_layer = await asyncio.to_thread(self.text_layer.extract, file_path)
+            known = self._known_pages(text_layer)
+            if known is not None:
+                logger.info(
+                    f"{filename}: текстовый слой у {len(known)}/{len(text_layer.pages)} страниц, "
+                    f"распознаются {len(text_layer.scanned)}"
+                )
+            
+            # Шаг 2: Растеризация страниц (один раз для всех провайдеров);
+            # полностью цифровой PDF не растеризуется вовсе
+            if known is not None and text_layer.complete:
+                pages = None
+            else:
+                pages = await self._rasterize(file_path)
             
-            # Шаг 2: Сравнение и выравнивание
-            comparison_results = self.alignment_service.create_comparison_results(raw_results)
+            # Эталоном и отдельным "провайдером" слой служит, только если он
+            # есть у всех страниц: частичный слой не голосует в консенсусе, его
+            # страницы попадают в тексты провайдеров и в референс постранично
+            if text_layer is not None and not text_layer.complete:
+                text_layer = None
+            reference = text_layer.text if text_layer is not None else None
+            
+            # Шаг 3: Параллельная обработка через все OCR
+            progress = TaskProgress(
+                self.task_store,
+                task_id,
+                self._progress_units(pages, text_layer, known),
+                len(pages) if pages is not None else None
+            )
             
-            # Шаг 3: Генерация статистики
+            # Страницы выравниваются в пуле процессов по мере готовности
+            aligner = self._page_aligner(pages, text_layer, known, alignment_engine, alignment_mode)
+            if aligner is not None:
+                progress.listeners.append(aligner)
+            progress.start()
+            
+            shared_pages = self._share_pages(file_path, pages)
+            page_hashes = await self._hash_pages(file_path, pages)
+            raw_results = await self._run_all_ocr(
+                file_path, pages, shared_pages, page_hashes, progress, text_layer, known
+            )
+            await self._save_artifacts(task_id, raw_results, pages)
+            
+            # Шаг 4: Сравнение и выравнивание; текстовый слой цифрового
+            # PDF - эталон вместо консенсуса
+            progress.stage('alignment', "Выравнивание текстов...", 92)
+            if aligner is not None:
+                comparison_results = await aligner.finish(raw_results)
+            else:
+                comparison_results = await align_document(
+                    self.alignment_pool,
+                    raw_results,
+                    engine=alignment_engine,
+                    reference=reference,
+                    mode=alignment_mode
+                )
+            
+            # Шаг 5: Генерация статистики
             statistics = self._generate_statistics(raw_results, comparison_results)
             
-            # Шаг 4: Формирование ответа
+            # Шаг 6: Формирование ответа
             response = ComparisonResponse(
                 task_id=task_id,
                 filename=filename,
                 status='completed',
-                created_at=self.tasks[task_id]['started_at'],
+                created_at=started_at,
                 raw_results=raw_results,
                 comparison=comparison_results,
                 statistics=statistics,
+                preprocessing=self.page_cache.report(file_path) if pages is not None else None,
                 html_visualization=None  # Будет добавлено позже
             )
             
-            # Обновляем статус
-            self.tasks[task_id]['status'] = 'completed'
-            self.tasks[task_id]['result'] = response
+            # Сохраняем результат (сжатые блобы) и обновляем статус; журнал
+            # дописывается до смены статуса - SSE дочитывает его после нее
+            progress.stage('saving', "Сохранение результатов...", 98)
+            await progress.drain()
+            await self.task_store.aput_result(response)
+            await asyncio.to_thread(self.task_store.set_progress, task_id, {
+                'percent': 100,
+                'done': progress.total,
+                'total': progress.total,
+                'message': "Обработка завершена"
+            })
             
             logger.info(f"Обработка {task_id} завершена успешно")
             
@@ -116,27 +268,246 @@ class OCRComparisonService:
         except Exception as e:
             logger.error(f"Ошибка обработки {task_id}: {e}", exc_info=True)
             
-            self.tasks[task_id]['status'] = 'failed'
-            self.tasks[task_id]['error'] = str(e)
+            if progress is not None:
+                await progress.drain()
+            await asyncio.to_thread(self.task_store.set_status, task_id, 'failed', str(e))
             
             raise
+        
+        finally:
+            page_group.reset(group_token)
+            if aligner is not None:
+                aligner.cancel()
+            if pages is not None:
+                self.page_cache.release(file_path)
+    
+    def _known_pages(self, text_layer: Optional[TextLayer]) -> Optional[Dict[int, str]]:
+        """
+        Страницы, которые не нужно распознавать: текст берется из слоя PDF.
+        
+        Args:
+            text_layer: Текстовый слой документа
+            
+        Returns:
+            Optional[Dict[int, str]]: Номер страницы -> текст или None,
+            если распознаются все страницы
+        """
+        if text_layer is None or not self.text_layer.skip_ocr:
+            return None
+        
+        return {i: text_layer.pages[i] for i in text_layer.digital}
+    
+    def _ocr_providers(
+        self,
+        text_layer: Optional[TextLayer],
+        known: Optional[Dict[int, str]]
+    ) -> List[BaseOCRProvider]:
+        """Провайдеры, которым есть что распознавать (цифровой PDF целиком - никому)"""
+        digital = known is not None and text_layer is not None and text_layer.complete
+        return [] if digital else self.providers
+    
+    def _page_aligner(
+        self,
+        pages: Optional[List[Image.Image]],
+        text_layer: Optional[TextLayer],
+        known: Optional[Dict[int, str]],
+        engine: Optional[str],
+        mode: Optional[str]
+    ) -> Optional[PageAligner]:
+        """
+        Постраничное выравнивание документа, если тексты всех провайдеров
+        делятся на страницы (иначе документ выравнивается целиком).
+        
+        Документ с частичным текстовым слоем выравнивается по страницам
+        всегда: страницы слоя одинаковы у всех постраничных провайдеров и
+        в метрики не входят, а провайдеры без постраничного режима
+        выравниваются с собранным референсом целиком.
+        
+        Args:
+            pages: Растеризованные страницы
+            text_layer: Текстовый слой всех страниц (эталон) или None
+            known: Страницы с текстом из слоя, которые не распознаются
+            engine: Движок выравнивания
+            mode: Режим сравнения
+            
+        Returns:
+            Optional[PageAligner]: Слушатель прогресса или None
+        """
+        ocr_providers = self._ocr_providers(text_layer, known)
+        providers = [provider for provider in ocr_providers if provider.supports_pages]
+        if not pages or not providers:
+            return None
+        # Без частичного слоя - только если по страницам работают все провайдеры
+        if not known and (not PAGE_ALIGNMENT_ENABLED or len(providers) < len(ocr_providers)):
+            return None
+        
+        joiners = {provider.provider_name: provider.join_pages for provider in providers}
+        prefilled = {name: known or {} for name in joiners}
+        if text_layer is not None:
+            joiners[TEXT_LAYER_PROVIDER] = TextLayer.join
+            prefilled[TEXT_LAYER_PROVIDER] = dict(enumerate(text_layer.pages))
+        
+        return PageAligner(
+            self.alignment_pool,
+            joiners,
+            len(pages),
+            known=prefilled,
+            unscored=known,
+            reference_provider=TEXT_LAYER_PROVIDER if text_layer is not None else None,
+            engine=engine,
+            mode=mode
+        )
+    
+    def _progress_units(
+        self,
+        pages: Optional[List[Image.Image]],
+        text_layer: Optional[TextLayer],
+        known: Optional[Dict[int, str]]
+    ) -> Dict[str, int]:
+        """
+        Единицы работы провайдеров: страницы, которые действительно
+        распознаются или берутся из кэша, либо документ целиком.
+        """
+        units = {}
+        for provider in self._ocr_providers(text_layer, known):
+            if pages is not None and provider.supports_pages:
+                units[provider.provider_name] = len(pages) - len(known or ())
+            else:
+                units[provider.provider_name] = 1
+        
+        if text_layer is not None:
+            units[TEXT_LAYER_PROVIDER] = 1
+        return units
+    
+    async def _save_artifacts(
+        self,
+        task_id: str,
+        raw_results: List[RawOCRResult],
+        pages: Optional[List[Image.Image]]
+    ) -> None:
+        """
+        Сохраняет производные артефакты в каталог задачи: тексты
+        провайдеров и (при SAVE_PAGE_ARTIFACTS=true) растры страниц.
+        Ошибка записи не прерывает обработку.
+        
+        Args:
+            task_id: ID задачи
+            raw_results: Результаты провайдеров
+            pages: Растеризованные страницы
+        """
+        def write() -> None:
+            for result in raw_results:
+                if result.error is None:
+                    self.documents.write_artifact(
+                        task_id, result.text, 'providers', f"{result.provider_name}.txt"
+                    )
+            
+            if self.save_page_artifacts and pages is not None:
+                for i, page in enumerate(pages, 1):
+                    page.save(self.documents.artifact_path(task_id, 'pages', f"page_{i:04d}.png"))
+        
+        try:
+            await asyncio.to_thread(write)
+        except Exception as e:
+            logger.warning(f"Задача {task_id}: не удалось сохранить артефакты: {e}")
+    
+    async def _rasterize(self, file_path: str) -> Optional[List[Image.Image]]:
+        """
+        Растеризует документ, если хотя бы один провайдер работает со страницами.
+        
+        Args:
+            file_path: Путь к файлу
+            
+        Returns:
+            Optional[List[Image.Image]]: Страницы или None, если растеризация не нужна
+        """
+        if not any(provider.supports_pages for provider in self.providers):
+            return None
+        
+        return await self.page_cache.acquire(file_path)
+    
+    def _share_pages(
+        self,
+        file_path: str,
+        pages: Optional[List[Image.Image]]
+    ) -> Optional[List[SharedPage]]:
+        """
+        Выкладывает страницы в разделяемую память, если их будут
+        обрабатывать worker-процессы.
+        
+        Args:
+            file_path: Путь к файлу
+            pages: Растеризованные страницы
+            
+        Returns:
+            Optional[List[SharedPage]]: Страницы для worker-процессов или None
+        """
+        if pages is None or not self.worker_pools:
+            return None
+        
+        return self.page_cache.share(file_path)
     
-    async def _run_all_ocr(self, file_path: str) -> List[RawOCRResult]:
+    async def _hash_pages(
+        self,
+        file_path: str,
+        pages: Optional[List[Image.Image]]
+    ) -> Optional[List[str]]:
+        """
+        Хэши страниц для постраничного кэша результатов.
+        
+        Args:
+            file_path: Путь к файлу
+            pages: Растеризованные страницы
+            
+        Returns:
+            Optional[List[str]]: Хэши или None, если кэш отключен
+        """
+        if pages is None or self.result_cache is None:
+            return None
+        
+        return await self.page_cache.page_hashes(file_path)
+    
+    async def _run_all_ocr(
+        self,
+        file_path: str,
+        pages: Optional[List[Image.Image]] = None,
+        shared_pages: Optional[List[SharedPage]] = None,
+        page_hashes: Optional[List[str]] = None,
+        progress: Optional[TaskProgress] = None,
+        text_layer: Optional[TextLayer] = None,
+        known: Optional[Dict[int, str]] = None
+    ) -> List[RawOCRResult]:
         """
         Запускает все OCR провайдеры параллельно.
         
         Args:
             file_path: Путь к файлу
+            pages: Общие растеризованные страницы документа
+            shared_pages: Те же страницы в разделяемой памяти (для worker-процессов)
+            page_hashes: Хэши страниц для кэша результатов
+            progress: Прогресс задачи (события по готовым страницам)
+            text_layer: Текстовый слой всех страниц PDF (добавляется в
+                результаты как отдельный эталонный "провайдер") или None
+            known: Страницы с текстом из слоя, которые не распознаются
             
         Returns:
             List[RawOCRResult]: Результаты от всех провайдеров
         """
-        logger.info(f"Запуск {len(self.providers)} OCR провайдеров...")
+        providers = self._ocr_providers(text_layer, known)
+        logger.info(f"Запуск {len(providers)} OCR провайдеров...")
         
-        # Создаем задачи для всех провайдеров
+        # Создаем задачи для всех провайдеров; задачи worker-провайдеров
+        # уходят в их пулы процессов
         tasks = [
-            self._run_single_ocr(provider, file_path)
-            for provider in self.providers
+            self._run_single_ocr(
+                provider,
+                file_path,
+                shared_pages if provider.uses_worker_pool else pages,
+                page_hashes,
+                progress,
+                known
+            )
+            for provider in providers
         ]
         
         # Выполняем параллельно с обработкой исключений
@@ -145,7 +516,7 @@ class OCRComparisonService:
         # Обрабатываем результаты
         raw_results = []
         
-        for provider, result in zip(self.providers, results):
+        for provider, result in zip(providers, results):
             if isinstance(result, Exception):
                 # Если провайдер упал, добавляем результат с ошибкой
                 logger.error(f"{provider.provider_name} завершился с ошибкой: {result}")
@@ -159,16 +530,31 @@ class OCRComparisonService:
             else:
                 raw_results.append(result)
         
+        if text_layer is not None:
+            raw_results.append(RawOCRResult(
+                provider_name=TEXT_LAYER_PROVIDER,
+                text=text_layer.text,
+                processing_time=text_layer.extraction_time,
+                error=None
+            ))
+            if progress is not None:
+                progress.page_done(TEXT_LAYER_PROVIDER, None, text_layer.text)
+                progress.provider_done(TEXT_LAYER_PROVIDER, text_layer.extraction_time)
+        
         # Фильтруем успешные результаты
         successful = [r for r in raw_results if r.error is None]
-        logger.info(f"Успешно обработано: {len(successful)}/{len(self.providers)}")
+        logger.info(f"Успешно обработано: {len(successful)}/{len(raw_results)}")
         
         return raw_results
     
     async def _run_single_ocr(
         self,
         provider: BaseOCRProvider,
-        file_path: str
+        file_path: str,
+        pages: Optional[list] = None,
+        page_hashes: Optional[List[str]] = None,
+        progress: Optional[TaskProgress] = None,
+        known: Optional[Dict[int, str]] = None
     ) -> RawOCRResult:
         """
         Запускает один OCR провайдер.
@@ -176,12 +562,24 @@ class OCRComparisonService:
         Args:
             provider: OCR провайдер
             file_path: Путь к файлу
+            pages: Общие страницы документа (PIL или SharedPage для worker-провайдеров)
+            page_hashes: Хэши страниц для кэша результатов
+            progress: Прогресс задачи
+            known: Страницы с текстом из слоя PDF (не распознаются)
             
         Returns:
             RawOCRResult: Результат обработки
         """
         try:
-            text, processing_time = await provider.process(file_path)
+            if pages is not None and provider.supports_pages:
+                text, processing_time = await self._process_pages_cached(
+                    provider, file_path, pages, page_hashes, progress, known
+                )
+            else:
+                text, processing_time = await self._process_file_cached(provider, file_path, progress)
+            
+            if progress is not None:
+                progress.provider_done(provider.provider_name, processing_time)
             
             return RawOCRResult(
                 provider_name=provider.provider_name,
@@ -193,6 +591,9 @@ class OCRComparisonService:
         except Exception as e:
             logger.error(f"Ошибка в {provider.provider_name}: {e}")
             
+            if progress is not None:
+                progress.provider_done(provider.provider_name, 0.0, error=str(e))
+            
             return RawOCRResult(
                 provider_name=provider.provider_name,
                 text="",
@@ -200,6 +601,127 @@ class OCRComparisonService:
                 error=str(e)
             )
     
+    async def _process_pages_cached(
+        self,
+        provider: BaseOCRProvider,
+        file_path: str,
+        pages: list,
+        page_hashes: Optional[List[str]],
+        progress: Optional[TaskProgress] = None,
+        known: Optional[Dict[int, str]] = None
+    ) -> Tuple[str, float]:
+        """
+        Постраничное распознавание с кэшем: провайдер получает
+        только страницы, которых нет в кэше и в текстовом слое PDF.
+        Страницы слоя входят в текст провайдера как есть (в метриках
+        провайдера они не учитываются, см. PageAligner).
+        О каждой готовой странице сообщается в progress сразу,
+        не дожидаясь остальных.
+        
+        Args:
+            provider: OCR провайдер
+            file_path: Путь к файлу
+            pages: Страницы документа
+            page_hashes: Хэши страниц (None - без кэша)
+            progress: Прогресс задачи
+            known: Страницы с текстом из слоя PDF
+            
+        Returns:
+            Tuple[str, float]: (текст документа, время обработки в секундах)
+        """
+        use_cache = self.result_cache is not None and page_hashes is not None
+        keys: Dict[int, str] = {}
+        page_texts: List[Optional[str]] = [None] * len(pages)
+        
+        for i, text in (known or {}).items():
+            page_texts[i] = text
+        
+        if use_cache:
+            lookup = [i for i, text in enumerate(page_texts) if text is None]
+            keys = {
+                i: OCRResultCache.make_key(page_hashes[i], provider, self.page_cache.dpi)
+                for i in lookup
+            }
+            cached = await self.result_cache.aget_many([keys[i] for i in lookup])
+            
+            for i, text in zip(lookup, cached):
+                page_texts[i] = text
+                if text is not None and progress is not None:
+                    progress.page_done(provider.provider_name, i, text, cached=True)
+            
+            logger.info(
+                f"{provider.provider_name}: из кэша "
+                f"{sum(text is not None for text in cached)}/{len(lookup)} страниц"
+            )
+        
+        missing = [i for i, text in enumerate(page_texts) if text is None]
+        
+        processing_time = 0.0
+        if missing:
+            reported = set()
+            
+            def on_page(index: int, text: str) -> None:
+                reported.add(index)
+                if progress is not None:
+                    progress.page_done(provider.provider_name, missing[index], text)
+            
+            token = page_callback.set(on_page)
+            try:
+                texts, processing_time = await provider.process_pages(
+                    [pages[i] for i in missing], file_path
+                )
+            finally:
+                page_callback.reset(token)
+            
+            for index, (i, text) in enumerate(zip(missing, texts)):
+                page_texts[i] = text
+                # Провайдеры без gather_pages сообщают о страницах только в конце
+                if index not in reported and progress is not None:
+                    progress.page_done(provider.provider_name, i, text)
+            
+            if use_cache:
+                await self.result_cache.aput_many({keys[i]: page_texts[i] for i in missing})
+        
+        return provider.join_pages(page_texts), processing_time
+    
+    async def _process_file_cached(
+        self,
+        provider: BaseOCRProvider,
+        file_path: str,
+        progress: Optional[TaskProgress] = None
+    ) -> Tuple[str, float]:
+        """
+        Распознавание исходного файла с кэшем по хэшу его содержимого.
+        
+        Args:
+            provider: OCR провайдер
+            file_path: Путь к файлу
+            progress: Прогресс задачи
+            
+        Returns:
+            Tuple[str, float]: (текст документа, время обработки в секундах)
+        """
+        cached = None
+        key = None
+        
+        if self.result_cache is not None:
+            file_hash = await asyncio.to_thread(hash_file, file_path)
+            key = OCRResultCache.make_key(file_hash, provider)
+            cached = (await self.result_cache.aget_many([key]))[0]
+        
+        if cached is not None:
+            logger.info(f"{provider.provider_name}: результат из кэша")
+            text, processing_time = cached, 0.0
+        else:
+            text, processing_time = await provider.process(file_path)
+            if key is not None:
+                await self.result_cache.aput_many({key: text})
+        
+        if progress is not None:
+            progress.page_done(provider.provider_name, None, text, cached=cached is not None)
+        
+        return text, processing_time
+    
     def _generate_statistics(
         self,
         raw_results: List[RawOCRResult],
@@ -227,12 +749,26 @@ class OCRComparisonService:
             comp = comparison_map.get(raw.provider_name)
             
             if comp:
+                metrics = comp.metrics
+                extra = {}
+                if metrics is not None:
+                    extra = {
+                        'cer': metrics.cer,
+                        'edit_distance': metrics.edit_distance,
+                        'normalized_edit_distance': metrics.normalized_edit_distance,
+                        'substitutions': metrics.substitutions,
+                        'deletions': metrics.deletions,
+                        'insertions': metrics.insertions,
+                        'class_error_rates': metrics.class_error_rates
+                    }
                 statistics.append(OCRStatistics(
                     provider_name=raw.provider_name,
                     total_chars=comp.total_characters,
                     differences=comp.diff_count,
                     accuracy=comp.accuracy_percent,
-                    processing_time=raw.processing_time
+                    processing_time=raw.processing_time,
+                    wer=comp.word_error_rate,
+                    **extra
                 ))
             else:
                 # Если нет результата сравнения (ошибка)
@@ -256,7 +792,7 @@ class OCRComparisonService:
         Returns:
             dict: Информация о статусе
         """
-        task = self.tasks.get(task_id)
+        task = self.task_store.get(task_id)
         
         if not task:
             return {
@@ -269,5 +805,7 @@ class OCRComparisonService:
             'task_id': task_id,
             'status': task['status'],
             'filename': task.get('filename'),
-            'started_at': task.get('started_at')
+            'started_at': task.get('created_at'),
+            'progress': task.get('progress') or {},
+            'message': task.get('error') or (task.get('progress') or {}).get('message')
         }
@@ -0,0 +1,512 @@
+"""
+Движки посимвольного выравнивания текстов.
+
+Все движки возвращают опкоды в формате difflib.SequenceMatcher.get_opcodes():
+(tag, i1, i2, j1, j2), tag in {'equal', 'replace', 'delete', 'insert'}.
+
+- difflib:  SequenceMatcher (квадратичный в худшем случае, autojunk
+            портит выравнивание длинных текстов с повторяющимися символами)
+- myers:    алгоритм Майерса O((N+M)·D) с линейной памятью
+            (разбиение по "среднему змею", Hirschberg-подобная рекурсия)
+- anchored: сначала якоря - уникальные совпадающие строки, затем
+            уникальные слова (patience diff), а Майерс работает только
+            внутри окон между якорями; для последовательностей токенов
+            якоря - уникальные токены (patience diff)
+
+line_opcodes() - построчный patience diff для сопоставления групп строк.
+"""
+import difflib
+import os
+import re
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+Opcode = Tuple[str, int, int, int, int]
+Block = Tuple[int, int, int]  # (i, j, size) - совпадающий блок
+
+ENGINES = ('difflib', 'myers', 'anchored')
+DEFAULT_ENGINE = os.getenv("ALIGNMENT_ENGINE", "anchored")
+
+# Предел стоимости D для окна в anchored-режиме: дальше окно делится
+# эвристически (как в GNU diff), чтобы время оставалось ограниченным
+ANCHORED_MAX_COST = 2048
+
+_LINE_RE = re.compile(r'[^\n]*\n|[^\n]+')
+_WORD_RE = re.compile(r'\S+')
+
+
+def get_opcodes(a: Sequence, b: Sequence, engine: Optional[str] = None) -> List[Opcode]:
+    """
+    Выравнивает две последовательности выбранным движком.
+
+    Args:
+        a: Референсная последовательность (строка или список токенов)
+        b: Сравниваемая последовательность
+        engine: Имя движка (по умолчанию ALIGNMENT_ENGINE)
+
+    Returns:
+        List[Opcode]: Опкоды в формате difflib
+    """
+    engine = engine or DEFAULT_ENGINE
+
+    if engine == 'difflib':
+        return difflib.SequenceMatcher(None, a, b).get_opcodes()
+    if engine == 'myers':
+        return opcodes_from_blocks(myers_blocks(a, b), len(a), len(b))
+    if engine == 'anchored':
+        if isinstance(a, str) and isinstance(b, str):
+            blocks = anchored_blocks(a, b)
+        else:
+            # Токены: якоря - уникальные совпадающие токены
+            blocks = patience_blocks(a, b)
+        return opcodes_from_blocks(blocks, len(a), len(b))
+
+    raise ValueError(f"Неизвестный движок выравнивания: {engine}. Доступны: {', '.join(ENGINES)}")
+
+
+def opcodes_from_blocks(blocks: List[Block], n: int, m: int) -> List[Opcode]:
+    """
+    Превращает отсортированные совпадающие блоки в опкоды.
+
+    Args:
+        blocks: Непересекающиеся совпадающие блоки по возрастанию
+        n: Длина первой последовательности
+        m: Длина второй последовательности
+
+    Returns:
+        List[Opcode]: Опкоды в формате difflib
+    """
+    opcodes = []
+    i = j = 0
+
+    for ai, bj, size in _merge_blocks(blocks) + [(n, m, 0)]:
+        if i < ai and j < bj:
+            opcodes.append(('replace', i, ai, j, bj))
+        elif i < ai:
+            opcodes.append(('delete', i, ai, j, j))
+        elif j < bj:
+            opcodes.append(('insert', i, i, j, bj))
+
+        if size:
+            opcodes.append(('equal', ai, ai + size, bj, bj + size))
+        i, j = ai + size, bj + size
+
+    return opcodes
+
+
+def _merge_blocks(blocks: List[Block]) -> List[Block]:
+    """Склеивает смежные блоки и отбрасывает пустые"""
+    merged: List[Block] = []
+    for i, j, size in blocks:
+        if not size:
+            continue
+        if merged:
+            pi, pj, psize = merged[-1]
+            if pi + psize == i and pj + psize == j:
+                merged[-1] = (pi, pj, psize + size)
+                continue
+        merged.append((i, j, size))
+    return merged
+
+
+# ---------------------------------------------------------------------------
+# Майерс с линейной памятью
+# ---------------------------------------------------------------------------
+
+def myers_blocks(
+    a: Sequence,
+    b: Sequence,
+    a0: int = 0,
+    a1: Optional[int] = None,
+    b0: int = 0,
+    b1: Optional[int] = None,
+    max_cost: Optional[int] = None
+) -> List[Block]:
+    """
+    Совпадающие блоки кратчайшего редакционного предписания (Майерс).
+
+    Рекурсия заменена явным стеком, память O(N+M).
+
+    Args:
+        a, b: Последовательности
+        a0, a1, b0, b1: Окно выравнивания
+        max_cost: Предел D для одного разбиения (None - точный алгоритм)
+
+    Returns:
+        List[Block]: Совпадающие блоки по возрастанию
+    """
+    a1 = len(a) if a1 is None else a1
+    b1 = len(b) if b1 is None else b1
+
+    blocks: List[Block] = []
+    stack = [(a0, a1, b0, b1)]
+
+    while stack:
+        x0, x1, y0, y1 = stack.pop()
+
+        # Общий префикс
+        start = x0
+        while x0 < x1 and y0 < y1 and a[x0] == b[y0]:
+            x0 += 1
+            y0 += 1
+        if x0 > start:
+            blocks.append((start, y0 - (x0 - start), x0 - start))
+
+        # Общий суффикс
+        end = x1
+        while x1 > x0 and y1 > y0 and a[x1 - 1] == b[y1 - 1]:
+            x1 -= 1
+            y1 -= 1
+        if end > x1:
+            blocks.append((x1, y1, end - x1))
+
+        if x0 == x1 or y0 == y1:
+            continue
+
+        sx, sy, ex, ey = _middle_snake(a, x0, x1, b, y0, y1, max_cost)
+        if ex > sx:
+            blocks.append((x0 + sx, y0 + sy, ex - sx))
+
+        stack.append((x0 + ex, x1, y0 + ey, y1))
+        stack.append((x0, x0 + sx, y0, y0 + sy))
+
+    blocks.sort()
+    return _merge_blocks(blocks)
+
+
+def _middle_snake(
+    a: Sequence, a0: int, a1: int,
+    b: Sequence, b0: int, b1: int,
+    max_cost: Optional[int]
+) -> Tuple[int, int, int, int]:
+    """
+    Находит "средний змей" оптимального пути (координаты от начала окна).
+    Окно не пустое и не имеет общих префикса/суффикса, значит D >= 2.
+
+    Returns:
+        Tuple[int, int, int, int]: (x начала, y начала, x конца, y конца)
+    """
+    n = a1 - a0
+    m = b1 - b0
+    delta = n - m
+    odd = delta & 1
+    limit = (n + m + 1) // 2 + 1
+    offset = limit + 1
+
+    vf = [0] * (2 * offset + 1)
+    vb = [0] * (2 * offset + 1)
+
+    for d in range(limit):
+        # Прямой проход
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[offset + k - 1] < vf[offset + k + 1]):
+                x = vf[offset + k + 1]
+            else:
+                x = vf[offset + k - 1] + 1
+            y = x - k
+            sx, sy = x, y
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            vf[offset + k] = x
+
+            kr = delta - k
+            if odd and -(d - 1) <= kr <= d - 1 and x + vb[offset + kr] >= n:
+                return sx, sy, x, y
+
+        # Обратный проход (по перевернутым последовательностям)
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vb[offset + k - 1] < vb[offset + k + 1]):
+                x = vb[offset + k + 1]
+            else:
+                x = vb[offset + k - 1] + 1
+            y = x - k
+            sx, sy = x, y
+            while x < n and y < m and a[a1 - 1 - x] == b[b1 - 1 - y]:
+                x += 1
+                y += 1
+            vb[offset + k] = x
+
+            kf = delta - k
+            if not odd and -d <= kf <= d and x + vf[offset + kf] >= n:
+                return n - x, m - y, n - sx, m - sy
+
+        if max_cost is not None and d >= max_cost:
+            # Слишком дорого: делим по дальше всех продвинувшейся диагонали
+            best_k = max(range(-d, d + 1, 2), key=lambda k: 2 * vf[offset + k] - k)
+            x = min(vf[offset + best_k], n)
+            y = min(max(x - best_k, 0), m)
+            if 0 < x + y < n + m:
+                return x, y, x, y
+
+    # Недостижимо для корректного окна; вырожденный случай - замена целиком
+    return n, m, n, m
+
+
+# ---------------------------------------------------------------------------
+# Якорный режим (patience diff по строкам и словам)
+# ---------------------------------------------------------------------------
+
+def unique_anchors(a_keys: Sequence, b_keys: Sequence) -> List[Tuple[int, int]]:
+    """
+    Якоря patience diff: токены, уникальные в обеих последовательностях,
+    образующие наибольшую возрастающую подпоследовательность.
+
+    Args:
+        a_keys: Токены первой последовательности
+        b_keys: Токены второй последовательности
+
+    Returns:
+        List[Tuple[int, int]]: Пары индексов (i, j) по возрастанию
+    """
+    count_a = Counter(a_keys)
+    count_b = Counter(b_keys)
+    pos_b: Dict = {key: j for j, key in enumerate(b_keys) if count_b[key] == 1}
+
+    pairs = [
+        (i, pos_b[key])
+        for i, key in enumerate(a_keys)
+        if count_a[key] == 1 and key in pos_b
+    ]
+    if not pairs:
+        return []
+
+    # Наибольшая возрастающая подпоследовательность по j (patience sorting)
+    tails: List[int] = []
+    tail_idx: List[int] = []
+    prev = [-1] * len(pairs)
+    for idx, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_idx.append(idx)
+        else:
+            tails[pos] = j
+            tail_idx[pos] = idx
+        prev[idx] = tail_idx[pos - 1] if pos else -1
+
+    result = []
+    idx = tail_idx[-1]
+    while idx != -1:
+        result.append(pairs[idx])
+        idx = prev[idx]
+    result.reverse()
+    return result
+
+
+_LEVELS: List[re.Pattern] = [_LINE_RE, _WORD_RE]
+
+
+def _line_boundary(text: str, p: int) -> bool:
+    return p == 0 or p == len(text) or text[p - 1] == '\n'
+
+
+def _word_boundary(text: str, p: int) -> bool:
+    return p == 0 or p == len(text) or text[p - 1].isspace() or text[p].isspace()
+
+
+# Граница токена уровня в исходном тексте (а не в окне)
+_BOUNDARIES = [_line_boundary, _word_boundary]
+
+# Допустимый сдвиг якоря с диагонали окна: разница длин окон плюс
+# доля длины окна (не меньше ANCHOR_MIN_SLACK символов)
+ANCHOR_SLACK = 0.1
+ANCHOR_MIN_SLACK = 16
+
+# Сколько совпадающих символов контекста (слева и справа вместе) нужно
+# якорю-слову: одинаковое слово из разных мест документа окружено разным текстом
+ANCHOR_CONTEXT = 24
+
+
+def _context(a: str, b: str, span_a, span_b, a0: int, a1: int, b0: int, b1: int, limit: int) -> int:
+    """Совпадающие символы вокруг пары токенов в пределах окна (не больше limit)"""
+    (sa, ea), (sb, eb) = span_a, span_b
+    count = 0
+    while count < limit and sa - count > a0 and sb - count > b0 \
+            and a[sa - count - 1] == b[sb - count - 1]:
+        count += 1
+    right = 0
+    while count + right < limit and ea + right < a1 and eb + right < b1 \
+            and a[ea + right] == b[eb + right]:
+        right += 1
+    return count + right
+
+
+def _tokens(pattern: re.Pattern, boundary, text: str, start: int, end: int) -> List[Tuple[int, int]]:
+    """
+    Токены окна [start, end), целые в исходном тексте.
+
+    Общий префикс/суффикс и края якорей режут окно посреди слова или
+    строки; обрезки ("уб" от "руб") легко оказываются "уникальными" и
+    связывают далекие позиции, поэтому они якорями не бывают.
+    """
+    return [
+        (m.start(), m.end())
+        for m in pattern.finditer(text, start, end)
+        if boundary(text, m.start()) and boundary(text, m.end())
+    ]
+
+
+def anchored_blocks(a: str, b: str) -> List[Block]:
+    """
+    Совпадающие блоки якорного выравнивания.
+
+    Окно сначала делится уникальными совпадающими строками, оставшиеся
+    окна - уникальными словами, а внутри окон без якорей работает Майерс
+    с ограничением стоимости. Якорями служат только целые токены рядом с
+    диагональю окна; слово, кроме того, должно совпадать с окружением.
+
+    Args:
+        a: Референсный текст
+        b: Сравниваемый текст
+
+    Returns:
+        List[Block]: Совпадающие блоки по возрастанию
+    """
+    blocks: List[Block] = []
+    stack = [(0, len(a), 0, len(b), 0)]
+
+    while stack:
+        a0, a1, b0, b1, level = stack.pop()
+
+        # Общие префикс/суффикс не требуют поиска якорей
+        start = a0
+        while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+            a0 += 1
+            b0 += 1
+        if a0 > start:
+            blocks.append((start, b0 - (a0 - start), a0 - start))
+
+        end = a1
+        while a1 > a0 and b1 > b0 and a[a1 - 1] == b[b1 - 1]:
+            a1 -= 1
+            b1 -= 1
+        if end > a1:
+            blocks.append((a1, b1, end - a1))
+
+        if a0 == a1 or b0 == b1:
+            continue
+
+        if level >= len(_LEVELS):
+            blocks.extend(myers_blocks(a, b, a0, a1, b0, b1, max_cost=ANCHORED_MAX_COST))
+            continue
+
+        pattern, boundary = _LEVELS[level], _BOUNDARIES[level]
+        tokens_a = _tokens(pattern, boundary, a, a0, a1)
+        tokens_b = _tokens(pattern, boundary, b, b0, b1)
+
+        # Якорь далеко от диагонали окна - случайное совпадение; слово
+        # еще должно совпадать с окружением (строка уникальна сама по себе)
+        slack = abs((a1 - a0) - (b1 - b0)) + max(ANCHOR_MIN_SLACK, int(ANCHOR_SLACK * max(a1 - a0, b1 - b0)))
+        context = ANCHOR_CONTEXT if pattern is _WORD_RE else 0
+        anchors = [
+            (i, j)
+            for i, j in unique_anchors(
+                [a[s:e] for s, e in tokens_a],
+                [b[s:e] for s, e in tokens_b]
+            )
+            if abs((tokens_a[i][0] - a0) - (tokens_b[j][0] - b0)) <= slack
+            and _context(a, b, tokens_a[i], tokens_b[j], a0, a1, b0, b1, context) >= context
+        ]
+
+        if not anchors:
+            # На этом уровне якорей нет - спускаемся к более мелким токенам
+            stack.append((a0, a1, b0, b1, level + 1))
+            continue
+
+        # Окна между якорями выравниваются на том же уровне заново:
+        # уникальность внутри окна сильнее, чем во всем тексте
+        prev_a, prev_b = a0, b0
+        for i, j in anchors:
+            sa, ea = tokens_a[i]
+            sb, eb = tokens_b[j]
+            stack.append((prev_a, sa, prev_b, sb, level))
+            blocks.append((sa, sb, ea - sa))
+            prev_a, prev_b = ea, eb
+        stack.append((prev_a, a1, prev_b, b1, level))
+
+    blocks.sort()
+    return _merge_blocks(blocks)
+
+
+def patience_blocks(a: Sequence, b: Sequence) -> List[Block]:
+    """
+    Совпадающие блоки patience diff для последовательностей токенов
+    (например, строк, заранее замененных целыми идентификаторами).
+
+    Окно делится токенами, уникальными в обеих частях окна; окна между
+    якорями обрабатываются так же заново, а окна без якорей - Майерсом
+    с ограничением стоимости.
+
+    Args:
+        a: Референсная последовательность
+        b: Сравниваемая последовательность
+
+    Returns:
+        List[Block]: Совпадающие блоки по возрастанию
+    """
+    blocks: List[Block] = []
+    stack = [(0, len(a), 0, len(b))]
+
+    while stack:
+        a0, a1, b0, b1 = stack.pop()
+
+        start = a0
+        while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+            a0 += 1
+            b0 += 1
+        if a0 > start:
+            blocks.append((start, b0 - (a0 - start), a0 - start))
+
+        end = a1
+        while a1 > a0 and b1 > b0 and a[a1 - 1] == b[b1 - 1]:
+            a1 -= 1
+            b1 -= 1
+        if end > a1:
+            blocks.append((a1, b1, end - a1))
+
+        if a0 == a1 or b0 == b1:
+            continue
+
+        anchors = unique_anchors(a[a0:a1], b[b0:b1])
+        if not anchors:
+            blocks.extend(myers_blocks(a, b, a0, a1, b0, b1, max_cost=ANCHORED_MAX_COST))
+            continue
+
+        prev_a, prev_b = a0, b0
+        for i, j in anchors:
+            i += a0
+            j += b0
+            stack.append((prev_a, i, prev_b, j))
+            blocks.append((i, j, 1))
+            prev_a, prev_b = i + 1, j + 1
+        stack.append((prev_a, a1, prev_b, b1))
+
+    blocks.sort()
+    return _merge_blocks(blocks)
+
+
+def line_opcodes(a_lines: Sequence[str], b_lines: Sequence[str]) -> List[Opcode]:
+    """
+    Построчное выравнивание patience diff.
+
+    Строки сравниваются по целым идентификаторам (одна хэш-таблица
+    на обе последовательности), поэтому сравнение строки - O(1).
+
+    Args:
+        a_lines: Строки референса
+        b_lines: Строки сравниваемого текста
+
+    Returns:
+        List[Opcode]: Опкоды в формате difflib по номерам строк
+    """
+    ids: Dict[str, int] = {}
+    a_ids = [ids.setdefault(line, len(ids)) for line in a_lines]
+    b_ids = [ids.setdefault(line, len(ids)) for line in b_lines]
+    return opcodes_from_blocks(patience_blocks(a_ids, b_ids), len(a_ids), len(b_ids))
+
+
+def count_matches(opcodes: List[Opcode]) -> int:
+    """Количество совпавших элементов в опкодах"""
+    return sum(i2 - i1 for tag, i1, i2, _, _ in opcodes if tag == 'equal')
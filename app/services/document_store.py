@@ -0,0 +1,352 @@
+"""
+Хранилище загруженных документов и производных артефактов.
+
+Каждая задача получает свой каталог в шардированной раскладке:
+
+    uploads/ab/cd/<task_id>/original.pdf
+    uploads/ab/cd/<task_id>/artifacts/providers/<провайдер>.txt
+    uploads/ab/cd/<task_id>/artifacts/pages/page_0001.png
+    uploads/ab/cd/<task_id>/artifacts/html/<ключ>.html
+
+где ab и cd - первые символы task_id, поэтому в одном каталоге не
+скапливаются сотни тысяч записей. Индекс task_id -> файл хранится в
+SQLite рядом с метаданными задач (по умолчанию в том же файле), и
+поиск документа - это запрос по первичному ключу, а не обход UPLOAD_DIR.
+Фоновый janitor удаляет каталоги задач старше TTL.
+"""
+import asyncio
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Файлы старой плоской раскладки: <uuid>_<имя файла>
+_FLAT_NAME_RE = re.compile(r'^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})_(.+)$')
+
+
+@dataclass
+class DocumentRecord:
+    """Запись индекса документов"""
+    task_id: str
+    filename: str
+    path: Path
+    size: int
+    sha256: Optional[str]
+
+
+class DocumentStore:
+    """
+    Индекс и каталоги документов задач.
+
+    Методы потокобезопасны; асинхронные обертки выполняют обращения
+    к SQLite и файловой системе вне event loop.
+    """
+
+    ARTIFACTS_DIR = 'artifacts'
+
+    def __init__(
+        self,
+        root: str,
+        index_path: str,
+        ttl_seconds: float = 24 * 3600,
+        janitor_interval: float = 600.0
+    ):
+        """
+        Args:
+            root: Каталог загрузок (UPLOAD_DIR)
+            index_path: Путь к файлу SQLite с индексом
+            ttl_seconds: Время жизни документа с момента последнего обращения
+            janitor_interval: Период запуска janitor'а (секунды)
+        """
+        self.root = Path(root)
+        self.index_path = index_path
+        self.ttl_seconds = ttl_seconds
+        self.janitor_interval = janitor_interval
+        self.expired = 0
+
+        self._lock = threading.Lock()
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        Path(index_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(index_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                task_id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_updated ON documents(updated_at)")
+        self._conn.commit()
+
+        logger.info(f"Хранилище документов: {root} (индекс {index_path})")
+
+    @classmethod
+    def from_env(cls) -> "DocumentStore":
+        """Создает хранилище по переменным окружения"""
+        ttl_hours = os.getenv("UPLOAD_TTL_HOURS") or os.getenv("TASK_TTL_HOURS", "24")
+        return cls(
+            root=os.getenv("UPLOAD_DIR", "./uploads"),
+            index_path=os.getenv("UPLOAD_INDEX_PATH") or os.getenv("TASK_STORE_PATH", "./cache/tasks.sqlite3"),
+            ttl_seconds=float(ttl_hours) * 3600,
+            janitor_interval=float(os.getenv("UPLOAD_JANITOR_INTERVAL", "600"))
+        )
+
+    # --- Раскладка ---
+
+    def task_dir(self, task_id: str) -> Path:
+        """Каталог задачи: <root>/ab/cd/<task_id>"""
+        return self.root / task_id[:2] / task_id[2:4] / task_id
+
+    def original_path(self, task_id: str, filename: str) -> Path:
+        """
+        Путь для исходного документа (каталог создается).
+
+        Args:
+            task_id: ID задачи
+            filename: Исходное имя файла (берется только расширение)
+
+        Returns:
+            Path: <каталог задачи>/original<расширение>
+        """
+        task_dir = self.task_dir(task_id)
+        task_dir.mkdir(parents=True, exist_ok=True)
+        return task_dir / f"original{Path(filename).suffix.lower()}"
+
+    def artifact_path(self, task_id: str, *parts: str) -> Path:
+        """
+        Путь к артефакту задачи (родительские каталоги создаются).
+
+        Args:
+            task_id: ID задачи
+            parts: Относительный путь, например ('providers', 'Tesseract.txt')
+
+        Returns:
+            Path: Путь внутри <каталог задачи>/artifacts
+        """
+        path = self.task_dir(task_id).joinpath(self.ARTIFACTS_DIR, *parts)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def write_artifact(self, task_id: str, data: Union[str, bytes], *parts: str) -> Path:
+        """
+        Записывает артефакт задачи.
+
+        Args:
+            task_id: ID задачи
+            data: Содержимое (str пишется в UTF-8)
+            parts: Относительный путь артефакта
+
+        Returns:
+            Path: Путь к записанному файлу
+        """
+        path = self.artifact_path(task_id, *parts)
+        if isinstance(data, str):
+            path.write_text(data, encoding='utf-8')
+        else:
+            path.write_bytes(data)
+        return path
+
+    # --- Индекс ---
+
+    def register(
+        self,
+        task_id: str,
+        filename: str,
+        path: Path,
+        size: int,
+        sha256: Optional[str] = None
+    ) -> None:
+        """
+        Добавляет сохраненный документ в индекс.
+
+        Args:
+            task_id: ID задачи
+            filename: Исходное имя файла
+            path: Путь к сохраненному файлу
+            size: Размер в байтах
+            sha256: Хэш содержимого
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (task_id, filename, path, size, sha256, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (task_id, filename, str(path), size, sha256, now, now)
+            )
+            self._conn.commit()
+
+    def lookup(self, task_id: str) -> Optional[DocumentRecord]:
+        """
+        Документ задачи по индексу.
+
+        Returns:
+            Optional[DocumentRecord]: Запись или None, если документа нет
+            (в том числе если файл удален с диска)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename, path, size, sha256 FROM documents WHERE task_id = ?",
+                (task_id,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        record = DocumentRecord(task_id, row[0], Path(row[1]), row[2], row[3])
+        if not record.path.exists():
+            return None
+        return record
+
+    def touch(self, task_id: str) -> None:
+        """Продлевает жизнь документа (например, при постановке в обработку)"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE documents SET updated_at = ? WHERE task_id = ?",
+                (time.time(), task_id)
+            )
+            self._conn.commit()
+
+    def delete(self, task_id: str) -> bool:
+        """
+        Удаляет документ, его артефакты и запись индекса.
+
+        Returns:
+            bool: True, если документ был в индексе
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path FROM documents WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            self._conn.execute("DELETE FROM documents WHERE task_id = ?", (task_id,))
+            self._conn.commit()
+
+        self._remove_files(task_id, Path(row[0]) if row else None)
+        return row is not None
+
+    def _remove_files(self, task_id: str, path: Optional[Path]) -> None:
+        """Удаляет каталог задачи и опустевшие каталоги шардов"""
+        task_dir = self.task_dir(task_id)
+        shutil.rmtree(task_dir, ignore_errors=True)
+
+        # Документ вне раскладки (перенесен не полностью)
+        if path is not None and path.parent != task_dir:
+            path.unlink(missing_ok=True)
+
+        for shard in (task_dir.parent, task_dir.parent.parent):
+            try:
+                shard.rmdir()
+            except OSError:
+                break
+
+    def expire(self) -> int:
+        """
+        Удаляет документы, к которым не обращались дольше TTL.
+
+        Returns:
+            int: Количество удаленных документов
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT task_id, path FROM documents WHERE updated_at < ?",
+                (time.time() - self.ttl_seconds,)
+            ).fetchall()
+            self._conn.executemany(
+                "DELETE FROM documents WHERE task_id = ?",
+                [(task_id,) for task_id, _ in rows]
+            )
+            self._conn.commit()
+
+        for task_id, path in rows:
+            self._remove_files(task_id, Path(path))
+
+        self.expired += len(rows)
+        if rows:
+            logger.info(f"Хранилище документов: удалено {len(rows)} просроченных документов")
+        return len(rows)
+
+    def migrate_flat(self) -> int:
+        """
+        Переносит файлы старой плоской раскладки (<task_id>_<имя>) из
+        корня UPLOAD_DIR в каталоги задач. Корень читается один раз.
+
+        Returns:
+            int: Количество перенесенных документов
+        """
+        moved = 0
+        for entry in os.scandir(self.root):
+            match = _FLAT_NAME_RE.match(entry.name)
+            if match is None or not entry.is_file():
+                continue
+
+            task_id, filename = match.groups()
+            dest = self.original_path(task_id, filename)
+            os.replace(entry.path, dest)
+            self.register(task_id, filename, dest, dest.stat().st_size)
+            moved += 1
+
+        if moved:
+            logger.info(f"Хранилище документов: перенесено {moved} документов в новую раскладку")
+        return moved
+
+    async def run_janitor(self) -> None:
+        """Периодически удаляет просроченные документы (до отмены задачи)"""
+        while True:
+            try:
+                await asyncio.to_thread(self.expire)
+            except Exception as e:
+                logger.error(f"Ошибка очистки документов: {e}")
+            await asyncio.sleep(self.janitor_interval)
+
+    def stats(self) -> dict:
+        """Сведения о хранилище для /info"""
+        with self._lock:
+            documents, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents"
+            ).fetchone()
+        return {
+            'root': str(self.root),
+            'documents': documents,
+            'bytes': total,
+            'ttl_seconds': self.ttl_seconds,
+            'expired': self.expired
+        }
+
+    def close(self) -> None:
+        """Закрывает соединение с SQLite"""
+        with self._lock:
+            self._conn.close()
+
+    async def aregister(
+        self,
+        task_id: str,
+        filename: str,
+        path: Path,
+        size: int,
+        sha256: Optional[str] = None
+    ) -> None:
+        """Асинхронная версия register"""
+        await asyncio.to_thread(self.register, task_id, filename, path, size, sha256)
+
+    async def alookup(self, task_id: str) -> Optional[DocumentRecord]:
+        """Асинхронная версия lookup"""
+        return await asyncio.to_thread(self.lookup, task_id)
+
+    async def adelete(self, task_id: str) -> bool:
+        """Асинхронная версия delete"""
+        return await asyncio.to_thread(self.delete, task_id)
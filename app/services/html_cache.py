@@ -0,0 +1,160 @@
+"""
+Кэш HTML визуализации задач на диске.
+
+HTML рендерится потоково (HTMLVisualizer.iter_html) и по ходу отдачи
+клиенту пишется во временный файл рядом с артефактами задачи:
+
+    uploads/ab/cd/<task_id>/artifacts/html/<ключ>.html
+
+Ключ - хэш task_id, времени запуска обработки и версии рендерера,
+поэтому повторная обработка задачи или новая разметка дают новый файл.
+Тот же ключ служит ETag: повторный просмотр в браузере - 304 без тела.
+Файл удаляется вместе с каталогом задачи (TTL, DELETE /api/task).
+"""
+import hashlib
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from app.services.document_store import DocumentStore
+from app.utils.visualizer import HTMLVisualizer
+
+logger = logging.getLogger(__name__)
+
+# Размер порции ответа: части HTML мелкие, копим их до записи в сокет
+CHUNK_SIZE = 64 * 1024
+
+
+class HTMLCache:
+    """Готовые HTML страницы задач в каталогах DocumentStore"""
+
+    DIR = 'html'
+
+    def __init__(self, documents: DocumentStore):
+        """
+        Args:
+            documents: Хранилище документов (каталоги задач)
+        """
+        self.documents = documents
+
+    @staticmethod
+    def key(task_id: str, created_at) -> str:
+        """
+        Ключ HTML задачи.
+
+        Args:
+            task_id: ID задачи
+            created_at: Время запуска обработки (меняется при повторной обработке)
+
+        Returns:
+            str: Ключ (он же ETag без кавычек)
+        """
+        source = f"{task_id}:{created_at}:{HTMLVisualizer.RENDERER_VERSION}"
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def etag(key: str) -> str:
+        """Значение заголовка ETag"""
+        return f'"{key}"'
+
+    @staticmethod
+    def matches(if_none_match: Optional[str], key: str) -> bool:
+        """Совпадает ли If-None-Match с ключом (в том числе слабый ETag и *)"""
+        if not if_none_match:
+            return False
+
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag == '*' or tag.removeprefix('W/') == f'"{key}"':
+                return True
+        return False
+
+    def path(self, task_id: str, key: str) -> Path:
+        """Путь к HTML задачи (каталог создается)"""
+        return self.documents.artifact_path(task_id, self.DIR, f"{key}.html")
+
+    def get(self, task_id: str, key: str) -> Optional[Path]:
+        """Путь к готовому HTML или None"""
+        path = self.path(task_id, key)
+        return path if path.is_file() else None
+
+    def render(self, task_id: str, key: str, parts: Iterable[str]) -> Iterator[bytes]:
+        """
+        Отдает HTML порциями и одновременно сохраняет его на диск.
+
+        Файл появляется только после полной отдачи: при обрыве соединения
+        временный файл удаляется. Ошибка записи на диск не прерывает ответ.
+
+        Args:
+            task_id: ID задачи
+            key: Ключ HTML
+            parts: Части HTML (HTMLVisualizer.iter_html)
+
+        Yields:
+            bytes: Порции ответа в UTF-8
+        """
+        path = self.path(task_id, key)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        file = None
+        complete = False
+
+        try:
+            file = open(tmp, 'wb')
+        except OSError as e:
+            logger.warning(f"Задача {task_id}: HTML не будет сохранен: {e}")
+
+        try:
+            for chunk in _chunks(parts):
+                if file is not None:
+                    try:
+                        file.write(chunk)
+                    except OSError as e:
+                        logger.warning(f"Задача {task_id}: ошибка записи HTML: {e}")
+                        file.close()
+                        file = None
+                yield chunk
+
+            if file is not None:
+                file.close()
+                os.replace(tmp, path)
+                complete = True
+                self._remove_stale(path)
+        finally:
+            if file is not None and not file.closed:
+                file.close()
+            if not complete:
+                tmp.unlink(missing_ok=True)
+
+    def read(self, task_id: str, key: str, parts: Iterable[str]) -> str:
+        """HTML целиком: из кэша или рендер с сохранением"""
+        path = self.get(task_id, key)
+        if path is not None:
+            return path.read_text(encoding='utf-8')
+        return b''.join(self.render(task_id, key, parts)).decode('utf-8')
+
+    @staticmethod
+    def _remove_stale(path: Path) -> None:
+        """Удаляет HTML прежних ключей задачи"""
+        for other in path.parent.glob('*.html'):
+            if other != path:
+                other.unlink(missing_ok=True)
+
+
+def _chunks(parts: Iterable[str]) -> Iterator[bytes]:
+    """Склеивает мелкие части в порции по CHUNK_SIZE байт"""
+    buffer = []
+    size = 0
+
+    for part in parts:
+        data = part.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= CHUNK_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+
+    if buffer:
+        yield b''.join(buffer)
@@ -0,0 +1,303 @@
+"""
+Персистентная очередь задач OCR на SQLite.
+
+API только ставит задачи в очередь; их забирают worker-процессы
+(python -m app.worker) или встроенный в API worker. Поддерживаются:
+- приоритеты (больше - раньше), внутри приоритета - FIFO
+- аренда с таймаутом видимости: задача упавшего worker'а снова
+  становится доступной, когда истекает аренда; heartbeat, завершение и
+  ошибка принимаются только от worker'а, который держит аренду
+- повторы с экспоненциальной задержкой до max_attempts попыток
+- пакеты (batch_id): при равном приоритете первой выдается задача
+  пакета, у которого сейчас меньше всего выполняющихся задач, а число
+  одновременно выполняющихся задач одного пакета ограничено
+
+Очередь переживает перезапуск: незавершенные задачи остаются в файле.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    """Задача, выданная worker'у"""
+    job_id: str
+    payload: dict
+    priority: int
+    attempts: int
+    max_attempts: int
+    worker_id: str
+
+
+class JobQueue:
+    """
+    Очередь задач в SQLite (WAL), общая для процессов одного узла.
+
+    Выдача задачи (claim) выполняется в транзакции BEGIN IMMEDIATE,
+    поэтому одну задачу не получат два worker'а.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        visibility_timeout: float = 600.0,
+        max_attempts: int = 3,
+        retry_backoff: float = 5.0,
+        max_backoff: float = 300.0,
+        batch_max_in_flight: int = 0
+    ):
+        """
+        Args:
+            db_path: Путь к файлу SQLite
+            visibility_timeout: Срок аренды задачи без heartbeat (секунды)
+            max_attempts: Максимум попыток обработки
+            retry_backoff: Задержка перед первым повтором (удваивается)
+            max_backoff: Предельная задержка перед повтором
+            batch_max_in_flight: Предел одновременно выполняющихся задач
+                одного пакета на все worker'ы (0 - без предела)
+        """
+        self.db_path = db_path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.batch_max_in_flight = batch_max_in_flight
+
+        self._lock = threading.Lock()
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                available_at REAL NOT NULL,
+                leased_until REAL,
+                worker_id TEXT,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                batch_id TEXT
+            )
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if 'batch_id' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN batch_id TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(status, priority DESC, created_at)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_batch ON jobs(batch_id, status)")
+
+        logger.info(f"Очередь задач: {db_path}")
+
+    @classmethod
+    def from_env(cls) -> "JobQueue":
+        """Создает очередь по переменным окружения"""
+        return cls(
+            db_path=os.getenv("JOB_QUEUE_PATH", "./cache/jobs.sqlite3"),
+            visibility_timeout=float(os.getenv("JOB_VISIBILITY_TIMEOUT", "600")),
+            max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+            retry_backoff=float(os.getenv("JOB_RETRY_BACKOFF", "5")),
+            batch_max_in_flight=int(os.getenv("JOB_BATCH_MAX_IN_FLIGHT", "4"))
+        )
+
+    def enqueue(
+        self,
+        job_id: str,
+        payload: dict,
+        priority: int = 0,
+        batch_id: Optional[str] = None,
+        on_enqueue: Optional[Callable[[], None]] = None
+    ) -> bool:
+        """
+        Ставит задачу в очередь.
+
+        Args:
+            job_id: ID задачи (task_id)
+            payload: Параметры обработки (JSON-сериализуемые)
+            priority: Приоритет (больше - раньше)
+            batch_id: Пакет, к которому относится задача
+            on_enqueue: Вызывается в той же транзакции перед COMMIT (например,
+                запись задачи в хранилище): проверка, запись и постановка
+                атомарны - worker не заберет задачу раньше, а повторный запрос
+                не затрет выполняющуюся. Исключение отменяет постановку.
+
+        Returns:
+            bool: False, если задача уже в очереди или выполняется
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT status FROM jobs WHERE job_id = ?", (job_id,)
+                ).fetchone()
+                if row is not None and row[0] in ('queued', 'running'):
+                    self._conn.execute("ROLLBACK")
+                    return False
+
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO jobs "
+                    "(job_id, payload, priority, status, attempts, max_attempts, available_at, created_at, batch_id) "
+                    "VALUES (?, ?, ?, 'queued', 0, ?, ?, ?, ?)",
+                    (job_id, json.dumps(payload, ensure_ascii=False), priority, self.max_attempts, now, now, batch_id)
+                )
+                if on_enqueue is not None:
+                    on_enqueue()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        logger.info(f"Задача {job_id} поставлена в очередь (приоритет {priority})")
+        return True
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        """
+        Выдает следующую задачу worker'у и арендует ее.
+
+        Берется готовая задача с наибольшим приоритетом; задачи с истекшей
+        арендой считаются готовыми (worker, скорее всего, упал). При равном
+        приоритете раньше идут задачи вне пакетов и пакетов с меньшим числом
+        выполняющихся задач; пакеты, достигшие batch_max_in_flight, пропускаются.
+
+        Args:
+            worker_id: Идентификатор worker'а
+
+        Returns:
+            Optional[Job]: Задача или None, если очередь пуста
+        """
+        with self._lock:
+            while True:
+                now = time.time()
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = self._conn.execute(
+                        "SELECT j.job_id, j.payload, j.priority, j.attempts, j.max_attempts FROM jobs j "
+                        "LEFT JOIN ("
+                        "  SELECT batch_id, COUNT(*) AS running FROM jobs "
+                        "  WHERE status = 'running' AND leased_until >= ? AND batch_id IS NOT NULL "
+                        "  GROUP BY batch_id"
+                        ") b ON b.batch_id = j.batch_id "
+                        "WHERE ((j.status = 'queued' AND j.available_at <= ?) "
+                        "OR (j.status = 'running' AND j.leased_until < ?)) "
+                        "AND (? <= 0 OR COALESCE(b.running, 0) < ?) "
+                        "ORDER BY j.priority DESC, COALESCE(b.running, 0), j.created_at LIMIT 1",
+                        (now, now, now, self.batch_max_in_flight, self.batch_max_in_flight)
+                    ).fetchone()
+                    if row is None:
+                        self._conn.execute("COMMIT")
+                        return None
+
+                    job_id, payload, priority, attempts, max_attempts = row
+                    if attempts >= max_attempts:
+                        # Аренда истекла на последней попытке
+                        self._conn.execute(
+                            "UPDATE jobs SET status = 'failed', leased_until = NULL, "
+                            "last_error = COALESCE(last_error, 'Истек таймаут видимости') WHERE job_id = ?",
+                            (job_id,)
+                        )
+                        self._conn.execute("COMMIT")
+                        logger.warning(f"Задача {job_id}: исчерпаны попытки")
+                        continue
+
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                        "leased_until = ?, worker_id = ? WHERE job_id = ?",
+                        (now + self.visibility_timeout, worker_id, job_id)
+                    )
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+
+                return Job(job_id, json.loads(payload), priority, attempts + 1, max_attempts, worker_id)
+
+    def _update_leased(self, job: Job, assignments: str, params: tuple) -> bool:
+        """
+        Обновляет выполняющуюся задачу, если аренда все еще у worker'а job
+        (после истечения аренды задачу мог забрать другой worker).
+
+        Returns:
+            bool: Аренда была у этого worker'а
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ? AND worker_id = ? AND status = 'running'",
+                (*params, job.job_id, job.worker_id)
+            )
+        if cursor.rowcount == 0:
+            logger.warning(f"Задача {job.job_id}: аренда worker'а {job.worker_id} потеряна")
+        return cursor.rowcount > 0
+
+    def heartbeat(self, job: Job) -> bool:
+        """Продлевает аренду выполняющейся задачи; False - аренда потеряна"""
+        return self._update_leased(job, "leased_until = ?", (time.time() + self.visibility_timeout,))
+
+    def complete(self, job: Job) -> bool:
+        """Отмечает задачу выполненной; False - аренда потеряна"""
+        return self._update_leased(job, "status = 'done', leased_until = NULL, last_error = NULL", ())
+
+    def fail(self, job: Job, error: str) -> Optional[float]:
+        """
+        Отмечает неудачную попытку.
+
+        Args:
+            job: Задача
+            error: Текст ошибки
+
+        Returns:
+            Optional[float]: Задержка до повтора в секундах или None,
+            если попытки исчерпаны или аренда потеряна
+        """
+        if job.attempts >= job.max_attempts:
+            self._update_leased(job, "status = 'failed', leased_until = NULL, last_error = ?", (error,))
+            return None
+
+        delay = min(self.retry_backoff * 2 ** (job.attempts - 1), self.max_backoff)
+        if not self._update_leased(
+            job,
+            "status = 'queued', leased_until = NULL, available_at = ?, last_error = ?",
+            (time.time() + delay, error)
+        ):
+            return None
+        return delay
+
+    def release(self, job: Job) -> None:
+        """Возвращает задачу в очередь без траты попытки (остановка worker'а)"""
+        self._update_leased(
+            job,
+            "status = 'queued', attempts = attempts - 1, leased_until = NULL, available_at = ?",
+            (time.time(),)
+        )
+
+    def cancel(self, job_id: str) -> None:
+        """Удаляет задачу из очереди"""
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def stats(self) -> dict:
+        """Количество задач по статусам"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self) -> None:
+        """Закрывает соединение с SQLite"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,334 @@
+"""
+Метрики качества распознавания по опкодам выравнивания.
+
+Опкоды провайдера лежат в SegmentStore параллельными массивами (тип и
+смещения), поэтому счетчики правок считаются векторно в NumPy без обхода
+сегментов в Python:
+
+- замены/удаления/вставки: опкод replace из p символов референса в q
+  символов текста дает min(p, q) замен и |p - q| удалений или вставок.
+  С python-Levenshtein (METRICS_EXACT_DISTANCE=true) замены уточняются
+  расстоянием Левенштейна между их фрагментами (editops), что важно для
+  пословного режима, где замена - целые токены;
+- CER - расстояние правок / длина референса. В посимвольном режиме
+  расстояние с python-Levenshtein точное для текстов целиком: сумма
+  правок по опкодам - верхняя граница и передается как score_cutoff,
+  что ограничивает полосу вычисления;
+- нормированное расстояние правок - расстояние / длина большего текста;
+- WER - по выравниванию токенов (см. tokens.py);
+- ошибки по классам символов (цифры, кириллица, латиница, CJK, прочие):
+  доля символов класса в референсе, попавших в различия, плюс
+  вставленные символы класса, к числу символов класса в референсе.
+
+В пословном режиме различия в пробелах не считаются ошибками, а ошибки
+по классам символов считаются с точностью до токена.
+
+Счетчики (ErrorCounts) складываются, поэтому метрики документа можно
+собрать из метрик его страниц, выровненных по отдельности.
+"""
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.models.segments import EQUAL, INSERT, REPLACE, SegmentStore
+
+try:
+    import Levenshtein
+except ImportError:
+    # python-Levenshtein опционален: без него замены оцениваются по длинам
+    Levenshtein = None
+
+EXACT_DISTANCE = os.getenv("METRICS_EXACT_DISTANCE", "true").lower() == "true"
+
+CHAR_CLASSES = ('digits', 'cyrillic', 'latin', 'cjk', 'other')
+_SPACE = len(CHAR_CLASSES)  # Пробельные символы: в CER входят, в классы - нет
+
+# Класс каждого символа BMP; позже перечисленные диапазоны перекрывают ранние
+_CLASS_RANGES = (
+    ('cjk', [
+        (0x2E80, 0x2FDF), (0x3000, 0x303F), (0x3040, 0x30FF), (0x3100, 0x312F),
+        (0x3190, 0x31FF), (0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xAC00, 0xD7AF),
+        (0xF900, 0xFAFF), (0xFF00, 0xFFEF),
+    ]),
+    ('cyrillic', [(0x0400, 0x052F), (0x1C80, 0x1C8F), (0x2DE0, 0x2DFF), (0xA640, 0xA69F)]),
+    ('latin', [
+        (0x41, 0x5A), (0x61, 0x7A), (0xC0, 0xD6), (0xD8, 0xF6), (0xF8, 0x24F),
+        (0x1E00, 0x1EFF), (0xFF21, 0xFF3A), (0xFF41, 0xFF5A),
+    ]),
+    ('digits', [(0x30, 0x39), (0xFF10, 0xFF19)]),
+)
+_SPACE_CHARS = (0x09, 0x0A, 0x0B, 0x0C, 0x0D, 0x20, 0x85, 0xA0, 0x1680, 0x2028, 0x2029, 0x202F, 0x205F, 0x3000)
+
+
+def _class_table() -> np.ndarray:
+    table = np.full(0x10000, CHAR_CLASSES.index('other'), dtype=np.uint8)
+    for name, ranges in _CLASS_RANGES:
+        for start, end in ranges:
+            table[start:end + 1] = CHAR_CLASSES.index(name)
+    table[0x2000:0x200B] = _SPACE
+    table[list(_SPACE_CHARS)] = _SPACE
+    return table
+
+
+_CLASS_TABLE = _class_table()
+
+
+def _zeros() -> np.ndarray:
+    return np.zeros(len(CHAR_CLASSES) + 1, dtype=np.int64)
+
+
+@dataclass
+class TextMetrics:
+    """Метрики одного провайдера относительно референса"""
+    reference_chars: int
+    edit_distance: int               # Не больше substitutions + deletions + insertions
+    substitutions: int               # Счетчики правок - по выравниванию
+    deletions: int
+    insertions: int
+    cer: float                       # Процент символьных ошибок
+    normalized_edit_distance: float  # 0..1
+    wer: Optional[float] = None      # Процент пословных ошибок
+    class_error_rates: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class ErrorCounts:
+    """Счетчики ошибок провайдера; суммируются по страницам документа"""
+    reference_chars: int = 0
+    comparison_chars: int = 0
+    edit_distance: int = 0
+    substitutions: int = 0
+    deletions: int = 0
+    insertions: int = 0
+    word_errors: Optional[int] = None
+    reference_words: Optional[int] = None
+    class_errors: np.ndarray = field(default_factory=_zeros)  # По индексам CHAR_CLASSES (+ пробелы)
+    class_totals: np.ndarray = field(default_factory=_zeros)
+
+    def __add__(self, other: "ErrorCounts") -> "ErrorCounts":
+        words = self.word_errors is not None and other.word_errors is not None
+        return ErrorCounts(
+            reference_chars=self.reference_chars + other.reference_chars,
+            comparison_chars=self.comparison_chars + other.comparison_chars,
+            edit_distance=self.edit_distance + other.edit_distance,
+            substitutions=self.substitutions + other.substitutions,
+            deletions=self.deletions + other.deletions,
+            insertions=self.insertions + other.insertions,
+            word_errors=self.word_errors + other.word_errors if words else None,
+            reference_words=self.reference_words + other.reference_words if words else None,
+            class_errors=self.class_errors + other.class_errors,
+            class_totals=self.class_totals + other.class_totals
+        )
+
+    def accuracy(self, match_count: int, words: bool = False) -> float:
+        """
+        Процент точности с учетом вставок: совпадения / (референс + вставки).
+        Лишний текст провайдера снижает точность так же, как пропущенный.
+
+        Args:
+            match_count: Совпавшие символы референса (токены при words)
+            words: Точность в токенах (пословный режим)
+
+        Returns:
+            float: Процент точности
+        """
+        if words:
+            # Ошибки токенов = замены + удаления + вставки
+            total = match_count + (self.word_errors or 0)
+        else:
+            total = self.reference_chars + self.insertions
+        return (match_count / total) * 100 if total else 0.0
+
+    def metrics(self) -> TextMetrics:
+        """Метрики по накопленным счетчикам"""
+        distance = self.edit_distance
+        longest = max(self.reference_chars, self.comparison_chars)
+
+        wer = None
+        if self.word_errors is not None:
+            words = self.reference_words
+            wer = self.word_errors / words * 100 if words else (100.0 if self.word_errors else 0.0)
+
+        return TextMetrics(
+            reference_chars=self.reference_chars,
+            edit_distance=distance,
+            substitutions=self.substitutions,
+            deletions=self.deletions,
+            insertions=self.insertions,
+            cer=distance / self.reference_chars * 100 if self.reference_chars else (100.0 if distance else 0.0),
+            normalized_edit_distance=distance / longest if longest else 0.0,
+            wer=wer,
+            class_error_rates={
+                name: float(self.class_errors[k] / self.class_totals[k] * 100)
+                for k, name in enumerate(CHAR_CLASSES)
+                if self.class_totals[k]
+            }
+        )
+
+
+def char_classes(text: str) -> np.ndarray:
+    """
+    Класс каждого символа текста (индекс в CHAR_CLASSES, пробелы - _SPACE).
+
+    Args:
+        text: Текст
+
+    Returns:
+        np.ndarray: Массив uint8 длины len(text)
+    """
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype='<u4')
+    classes = _CLASS_TABLE[np.minimum(codes, 0xFFFF)]
+    # Вне BMP: CJK Extension B и далее, остальное - прочие
+    astral = codes > 0xFFFF
+    if astral.any():
+        cjk = (codes >= 0x20000) & (codes <= 0x3134F)
+        classes[astral] = np.where(cjk[astral], CHAR_CLASSES.index('cjk'), CHAR_CLASSES.index('other'))
+    return classes
+
+
+def _opcode_arrays(store: SegmentStore):
+    """Типы опкодов и смещения (i1, i2, j1, j2) как массивы NumPy"""
+    tags = np.frombuffer(store.tags, dtype=np.int8)
+    ref = np.frombuffer(store.ref_offsets, dtype=np.int64).reshape(-1, 2)
+    cmp = np.frombuffer(store.cmp_offsets, dtype=np.int64).reshape(-1, 2)
+    return tags, ref[:, 0], ref[:, 1], cmp[:, 0], cmp[:, 1]
+
+
+def _mask(length: int, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Булева маска позиций, покрытых полуинтервалами [starts, ends)"""
+    delta = np.zeros(length + 1, dtype=np.int64)
+    np.add.at(delta, starts, 1)
+    np.add.at(delta, ends, -1)
+    return np.cumsum(delta[:-1]) > 0
+
+
+def _class_counts(store: SegmentStore):
+    """
+    Ошибки и количество символов референса по классам символов.
+
+    Ошибки - символы референса в удалениях и заменах плюс вставленные
+    символы (вставки целиком и "хвост" длинных замен).
+    """
+    tags, i1, i2, j1, j2 = _opcode_arrays(store)
+    diff = tags != EQUAL
+    count = len(CHAR_CLASSES) + 1
+
+    ref_classes = char_classes(store.reference)
+    totals = np.bincount(ref_classes, minlength=count)
+    errors = np.bincount(ref_classes[_mask(len(ref_classes), i1[diff], i2[diff])], minlength=count)
+
+    start = np.where(tags == INSERT, j1, j1 + (i2 - i1))
+    inserted = diff & (start < j2)
+    if inserted.any():
+        cmp_classes = char_classes(store.comparison)
+        errors += np.bincount(
+            cmp_classes[_mask(len(cmp_classes), start[inserted], j2[inserted])],
+            minlength=count
+        )
+
+    return errors, totals
+
+
+def class_error_rates(store: SegmentStore) -> Dict[str, float]:
+    """
+    Процент ошибок по классам символов.
+
+    Args:
+        store: Сегменты провайдера
+
+    Returns:
+        Dict[str, float]: Класс -> процент ошибок (только классы,
+        встречающиеся в референсе)
+    """
+    return count_errors(store).metrics().class_error_rates
+
+
+def _refine_replaces(store: SegmentStore, tags, i1, i2, j1, j2, substitutions, deletions, insertions):
+    """
+    Уточняет счетчики правок внутри замен: оценка по длинам заменяется
+    операциями Левенштейна между фрагментами референса и текста.
+    """
+    reference = store.reference
+    comparison = store.comparison
+
+    for k in np.flatnonzero((tags == REPLACE) & (np.maximum(i2 - i1, j2 - j1) > 1)):
+        a = reference[i1[k]:i2[k]]
+        b = comparison[j1[k]:j2[k]]
+        p, q = len(a), len(b)
+        counts = Counter(op for op, _, _ in Levenshtein.editops(a, b))
+        substitutions += counts['replace'] - min(p, q)
+        deletions += counts['delete'] - max(p - q, 0)
+        insertions += counts['insert'] - max(q - p, 0)
+
+    return substitutions, deletions, insertions
+
+
+def count_errors(
+    store: SegmentStore,
+    word_errors: Optional[int] = None,
+    reference_words: Optional[int] = None,
+    whole_text: bool = True
+) -> ErrorCounts:
+    """
+    Считает ошибки провайдера по его сегментам.
+
+    Args:
+        store: Сегменты провайдера (референс, текст и опкоды)
+        word_errors: Пословные ошибки (замены + удаления + вставки токенов)
+        reference_words: Количество токенов референса
+        whole_text: Референс и текст сравнимы целиком, включая пробелы
+            (False для пословного режима: консенсус собран из токенов)
+
+    Returns:
+        ErrorCounts: Счетчики ошибок
+    """
+    tags, i1, i2, j1, j2 = _opcode_arrays(store)
+    diff = tags != EQUAL
+    ref_len = (i2 - i1)[diff]
+    cmp_len = (j2 - j1)[diff]
+
+    substitutions = int(np.minimum(ref_len, cmp_len).sum())
+    deletions = int(np.clip(ref_len - cmp_len, 0, None).sum())
+    insertions = int(np.clip(cmp_len - ref_len, 0, None).sum())
+
+    if EXACT_DISTANCE and Levenshtein is not None:
+        substitutions, deletions, insertions = _refine_replaces(
+            store, tags, i1, i2, j1, j2, substitutions, deletions, insertions
+        )
+    distance = substitutions + deletions + insertions
+
+    if whole_text and EXACT_DISTANCE and Levenshtein is not None and distance:
+        distance = min(distance, Levenshtein.distance(store.reference, store.comparison, score_cutoff=distance))
+
+    class_errors, class_totals = _class_counts(store)
+
+    return ErrorCounts(
+        reference_chars=len(store.reference),
+        comparison_chars=len(store.comparison),
+        edit_distance=distance,
+        substitutions=substitutions,
+        deletions=deletions,
+        insertions=insertions,
+        word_errors=word_errors if reference_words is not None else None,
+        reference_words=reference_words if word_errors is not None else None,
+        class_errors=class_errors,
+        class_totals=class_totals
+    )
+
+
+def compute_metrics(
+    store: SegmentStore,
+    word_errors: Optional[int] = None,
+    reference_words: Optional[int] = None,
+    whole_text: bool = True
+) -> TextMetrics:
+    """
+    Считает метрики провайдера по его сегментам (см. count_errors).
+
+    Returns:
+        TextMetrics: Метрики
+    """
+    return count_errors(store, word_errors, reference_words, whole_text).metrics()
@@ -0,0 +1,264 @@
+"""
+Множественное (N-way) выравнивание текстов OCR и консенсус голосованием.
+
+Прогрессивное выравнивание: затравка - текст медианной длины, остальные
+тексты по очереди выравниваются с профилем уже собранного выравнивания
+(по символу на колонку) движком из diff_engines. Myers/anchored работают
+в линейной памяти и просматривают только диагонали в пределах стоимости
+правок (полоса |k| <= D), поэтому стоимость шага ~ O((L + M)·D).
+
+Выравнивание хранится как N строк кодов символов одинаковой длины L
+(-1 - пропуск), т.е. O(N·L) памяти. Консенсус - символ большинства в
+каждой колонке (для серий одинаковых символов - голосование по длине
+серии); колонка, где большинство "за пропуск", в консенсус не
+попадает. Галлюцинация одного провайдера не становится эталоном.
+
+Вместо строк можно выравнивать последовательности целых кодов токенов
+(пословный режим, см. tokens.py) - тогда консенсус тоже список кодов.
+"""
+import logging
+from array import array
+from collections import Counter
+from typing import List, Optional, Sequence, Union
+
+from app.services.diff_engines import Opcode, get_opcodes
+
+logger = logging.getLogger(__name__)
+
+GAP = -1
+
+
+class MultipleAlignment:
+    """
+    Общее выравнивание N текстов и консенсус по большинству голосов.
+
+    Опкоды каждого текста относительно консенсуса (opcodes()) имеют
+    формат difflib и строятся из того же выравнивания, поэтому все
+    провайдеры сравниваются с одним эталоном согласованно.
+    """
+
+    def __init__(self, texts: List[Sequence], engine: Optional[str] = None):
+        """
+        Args:
+            texts: Тексты провайдеров (порядок сохраняется в opcodes())
+                или последовательности целых кодов токенов
+            engine: Движок попарного выравнивания (см. diff_engines.py)
+        """
+        self.texts = texts
+        self.engine = engine
+        self.is_text = all(isinstance(text, str) for text in texts)
+        self.rows: List[array] = [array('i') for _ in texts]
+        self.consensus: Union[str, List[int]]
+
+        if not texts:
+            self.seed_index = -1
+            self.consensus = "" if self.is_text else []
+            self._consensus_codes = array('i')
+            return
+
+        # Затравка - текст медианной длины: не самый "раздутый" и не самый короткий
+        by_length = sorted(range(len(texts)), key=lambda k: len(texts[k]))
+        self.seed_index = by_length[len(by_length) // 2]
+        seed_length = len(texts[self.seed_index])
+
+        self.rows[self.seed_index] = self._codes(texts[self.seed_index])
+        members = [self.seed_index]
+
+        # Сначала добавляем тексты, близкие к затравке по длине
+        for k in sorted(
+            (k for k in range(len(texts)) if k != self.seed_index),
+            key=lambda k: abs(len(texts[k]) - seed_length)
+        ):
+            self._add(members, k)
+            members.append(k)
+
+        self._consensus_codes = self._vote()
+        if self.is_text:
+            self.consensus = ''.join(chr(c) for c in self._consensus_codes if c != GAP)
+        else:
+            self.consensus = [c for c in self._consensus_codes if c != GAP]
+
+        logger.debug(
+            f"Множественное выравнивание: {len(texts)} текстов, {self.width} колонок, "
+            f"консенсус {len(self.consensus)} {'символов' if self.is_text else 'токенов'}"
+        )
+
+    @property
+    def width(self) -> int:
+        """Количество колонок выравнивания"""
+        return len(self.rows[self.seed_index]) if self.texts else 0
+
+    def _codes(self, text: Sequence) -> array:
+        """Коды элементов текста: символов или токенов"""
+        return array('i', map(ord, text)) if self.is_text else array('i', text)
+
+    def _profile(self, members: List[int]) -> Sequence:
+        """
+        Профиль текущего выравнивания: по одному символу на колонку
+        (символ затравки, а в колонках-вставках - самый частый).
+        Для токенов профиль - массив кодов.
+        """
+        seed = self.rows[self.seed_index]
+        others = [self.rows[k] for k in members if k != self.seed_index]
+        chars = []
+
+        for col, code in enumerate(seed):
+            if code == GAP:
+                votes = Counter(row[col] for row in others if row[col] != GAP)
+                code = votes.most_common(1)[0][0]
+            chars.append(code)
+
+        if self.is_text:
+            return ''.join(map(chr, chars))
+        return array('i', chars)
+
+    def _add(self, members: List[int], index: int) -> None:
+        """
+        Выравнивает новый текст с профилем и расширяет выравнивание:
+        вставки нового текста становятся новыми колонками с пропусками
+        в уже добавленных строках.
+        """
+        text = self.texts[index]
+        codes = self._codes(text)
+        profile = self._profile(members)
+        old_rows = [self.rows[k] for k in members]
+        new_rows = [array('i') for _ in members]
+        row = array('i')
+
+        def take(i1: int, i2: int) -> None:
+            for old, new in zip(old_rows, new_rows):
+                new.extend(old[i1:i2])
+
+        def gaps(count: int) -> None:
+            filler = array('i', [GAP]) * count
+            for new in new_rows:
+                new.extend(filler)
+
+        for tag, i1, i2, j1, j2 in get_opcodes(profile, text if self.is_text else codes, self.engine):
+            if tag == 'equal':
+                take(i1, i2)
+                row.extend(codes[j1:j2])
+            elif tag == 'delete':
+                take(i1, i2)
+                row.extend(array('i', [GAP]) * (i2 - i1))
+            elif tag == 'insert':
+                gaps(j2 - j1)
+                row.extend(codes[j1:j2])
+            else:
+                # Замена: попарно, остаток - пропуски/новые колонки
+                common = min(i2 - i1, j2 - j1)
+                take(i1, i1 + common)
+                row.extend(codes[j1:j1 + common])
+                if i2 - i1 > common:
+                    take(i1 + common, i2)
+                    row.extend(array('i', [GAP]) * (i2 - i1 - common))
+                if j2 - j1 > common:
+                    gaps(j2 - j1 - common)
+                    row.extend(codes[j1 + common:j2])
+
+        for k, new in zip(members, new_rows):
+            self.rows[k] = new
+        self.rows[index] = row
+
+    def _vote(self) -> array:
+        """
+        Консенсус по колонкам большинством голосов (пропуск тоже голос).
+        Ничья решается в пользу затравки.
+
+        Пропуски внутри серий одинаковых символов (пробелы таблиц, "000")
+        разные тексты ставят в разные колонки серии, и поколоночное
+        голосование теряет или добавляет символы. Поэтому серия колонок,
+        где все строки содержат только символ c или пропуск, выравнивается
+        влево во всех строках, а длина серии в консенсусе - голосованием
+        по длинам.
+        """
+        columns = list(zip(*self.rows))
+        result = array('i')
+        col = 0
+
+        while col < len(columns):
+            char = _run_char(columns[col])
+            end = col + 1
+            if char is not None:
+                while end < len(columns) and _run_char(columns[end]) == char:
+                    end += 1
+
+            if end - col == 1:
+                result.append(_majority(columns[col], self.seed_index))
+            else:
+                width = end - col
+                counts = [width - row[col:end].count(GAP) for row in self.rows]
+                for row, count in zip(self.rows, counts):
+                    row[col:end] = array('i', [char]) * count + array('i', [GAP]) * (width - count)
+
+                count = _majority(counts, self.seed_index)
+                result.extend(array('i', [char]) * count + array('i', [GAP]) * (width - count))
+
+            col = end
+
+        return result
+
+    def opcodes(self, index: int) -> List[Opcode]:
+        """
+        Опкоды текста относительно консенсуса (a - консенсус, b - текст).
+
+        Args:
+            index: Номер текста во входном списке
+
+        Returns:
+            List[Opcode]: Опкоды в формате difflib
+        """
+        opcodes: List[Opcode] = []
+        i = j = 0
+        run_equal = None
+        start_i = start_j = 0
+
+        for ref, code in zip(self._consensus_codes, self.rows[index]):
+            if ref == GAP and code == GAP:
+                continue
+
+            equal = ref == code
+            if equal != run_equal:
+                if run_equal is not None:
+                    opcodes.append(_opcode(run_equal, start_i, i, start_j, j))
+                run_equal = equal
+                start_i, start_j = i, j
+
+            if ref != GAP:
+                i += 1
+            if code != GAP:
+                j += 1
+
+        if run_equal is not None:
+            opcodes.append(_opcode(run_equal, start_i, i, start_j, j))
+
+        return opcodes
+
+
+def _run_char(column) -> Optional[int]:
+    """Символ колонки, если все непустые ячейки одинаковы, иначе None"""
+    values = set(column)
+    values.discard(GAP)
+    return values.pop() if len(values) == 1 else None
+
+
+def _majority(votes, seed_row: int):
+    """Самый частый голос; при ничьей - голос затравки"""
+    first = votes[0]
+    if votes.count(first) == len(votes):
+        return first
+
+    ranked = Counter(votes).most_common()
+    best = ranked[0][1]
+    leaders = [vote for vote, count in ranked if count == best]
+    return votes[seed_row] if votes[seed_row] in leaders else leaders[0]
+
+
+def _opcode(equal: bool, i1: int, i2: int, j1: int, j2: int) -> Opcode:
+    if equal:
+        return ('equal', i1, i2, j1, j2)
+    if i1 == i2:
+        return ('insert', i1, i2, j1, j2)
+    if j1 == j2:
+        return ('delete', i1, i2, j1, j2)
+    return ('replace', i1, i2, j1, j2)
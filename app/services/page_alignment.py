@@ -0,0 +1,398 @@
+"""
+Постраничное выравнивание в пуле процессов, параллельно с OCR.
+
+Текст документа делится на страницы по тем же границам, по которым
+провайдер склеивает его (join_pages: "\\n\\n" между страницами, у
+PaddleOCR - заголовки "## Страница N"). Кусок страницы k - прирост
+склейки первых k+1 страниц относительно первых k, поэтому куски в сумме
+дают ровно текст документа, а разделители и заголовки выравниваются
+как обычные символы.
+
+Страница уходит в пул процессов, как только готовы ее кусок у
+провайдера и кусок референса:
+- с эталоном (текстовый слой PDF) - каждая пара (провайдер, страница)
+  отдельно, сразу после распознавания страницы провайдером;
+- с консенсусом - все провайдеры страницы одним множественным
+  выравниванием, когда страницу выдали все провайдеры (упавших не ждем).
+
+Счетчики ошибок страниц (ErrorCounts) складываются, опкоды страниц
+сдвигаются на смещения страниц и склеиваются в SegmentStore документа.
+Страницы, текст которых взят из слоя PDF, а не распознан, входят в
+сегменты и референс, но не в метрики провайдера.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from array import array
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial, reduce
+from operator import add
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.models.schemas import ComparisonResult, RawOCRResult
+from app.models.segments import SegmentStore
+from app.services.alignment import ALIGNMENT_MODES, DEFAULT_MODE, TextAlignmentService
+from app.services.metrics import ErrorCounts
+
+logger = logging.getLogger(__name__)
+
+PAGE_ALIGNMENT_ENABLED = os.getenv("PAGE_ALIGNMENT_ENABLED", "true").lower() == "true"
+ALIGNMENT_WORKERS = int(os.getenv("ALIGNMENT_WORKERS", "0"))
+
+
+def create_alignment_pool(workers: int = ALIGNMENT_WORKERS) -> ProcessPoolExecutor:
+    """
+    Пул процессов выравнивания, общий для всех задач.
+
+    Args:
+        workers: Количество процессов (0 - по числу ядер)
+
+    Returns:
+        ProcessPoolExecutor: Пул процессов
+    """
+    # spawn: не наследуем event loop и загруженные модели OCR
+    context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=context)
+
+
+@dataclass
+class PageResult:
+    """Выравнивание куска текста одного провайдера с куском референса"""
+    reference: str      # Кусок референса (консенсус страницы или кусок эталона)
+    tags: array         # Опкоды в формате SegmentStore
+    ref_offsets: array
+    cmp_offsets: array
+    errors: ErrorCounts
+    match_count: int
+    diff_count: int
+
+
+def align_pieces(
+    texts: List[str],
+    reference: Optional[str],
+    engine: Optional[str],
+    mode: str
+) -> List[PageResult]:
+    """
+    Выравнивает куски текстов провайдеров (выполняется в процессе пула).
+
+    Args:
+        texts: Куски текстов провайдеров одной страницы
+        reference: Кусок эталона; None - референсом служит консенсус кусков
+        engine: Движок выравнивания
+        mode: Режим сравнения char или word
+
+    Returns:
+        List[PageResult]: Результат для каждого куска в порядке texts
+    """
+    raw_results = [
+        RawOCRResult(provider_name=str(k), text=text, processing_time=0.0)
+        for k, text in enumerate(texts)
+    ]
+    results = TextAlignmentService.create_comparison_results(raw_results, engine, reference, mode)
+
+    return [
+        PageResult(
+            reference=result.store.reference,
+            tags=result.store.tags,
+            ref_offsets=result.store.ref_offsets,
+            cmp_offsets=result.store.cmp_offsets,
+            errors=result.errors,
+            match_count=result.match_count,
+            diff_count=result.diff_count
+        )
+        for result in results
+    ]
+
+
+async def align_document(
+    pool: Executor,
+    raw_results: List[RawOCRResult],
+    engine: Optional[str] = None,
+    reference: Optional[str] = None,
+    mode: Optional[str] = None
+) -> List[ComparisonResult]:
+    """
+    Выравнивает документы целиком в пуле процессов (без деления на страницы).
+
+    Args:
+        pool: Пул процессов выравнивания
+        raw_results: Результаты провайдеров
+        engine: Движок выравнивания
+        reference: Эталонный текст; None - референсом служит консенсус
+        mode: Режим сравнения char или word
+
+    Returns:
+        List[ComparisonResult]: Результаты сравнения
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, partial(
+        TextAlignmentService.create_comparison_results,
+        raw_results,
+        engine=engine,
+        reference=reference,
+        mode=mode
+    ))
+
+
+def _shifted(offsets: array, shift: int) -> bytes:
+    return (np.frombuffer(offsets, dtype=np.int64) + shift).tobytes()
+
+
+class PageAligner:
+    """
+    Слушатель прогресса задачи (см. TaskProgress.listeners): собирает
+    страницы провайдеров и выравнивает их в пуле процессов по мере
+    готовности. finish() дожидается страниц и собирает результаты.
+    """
+
+    def __init__(
+        self,
+        pool: Executor,
+        joiners: Dict[str, Callable[[List[str]], str]],
+        page_count: int,
+        known: Optional[Dict[str, Dict[int, str]]] = None,
+        unscored: Optional[Iterable[int]] = None,
+        reference_provider: Optional[str] = None,
+        engine: Optional[str] = None,
+        mode: Optional[str] = None
+    ):
+        """
+        Args:
+            pool: Пул процессов выравнивания
+            joiners: Провайдер -> склейка страниц в текст документа (join_pages)
+            page_count: Количество страниц документа
+            known: Провайдер -> страницы, готовые заранее (текстовый слой, номера с 0)
+            unscored: Страницы, которые провайдеры не распознавали (текст из
+                слоя PDF): в метрики провайдеров не входят
+            reference_provider: Провайдер-эталон (None - референсом служит консенсус)
+            engine: Движок выравнивания
+            mode: Режим сравнения char или word (по умолчанию ALIGNMENT_MODE)
+        """
+        self.mode = mode or DEFAULT_MODE
+        if self.mode not in ALIGNMENT_MODES:
+            raise ValueError(
+                f"Неизвестный режим сравнения: {self.mode}. Доступны: {', '.join(ALIGNMENT_MODES)}"
+            )
+
+        self.pool = pool
+        self.joiners = joiners
+        self.page_count = page_count
+        self.unscored = frozenset(unscored or ())
+        self.reference_provider = reference_provider
+        self.engine = engine
+        self._loop = asyncio.get_running_loop()
+
+        self._pages: Dict[str, List[Optional[str]]] = {name: [None] * page_count for name in joiners}
+        self._tiles: Dict[str, List[str]] = {name: [] for name in joiners}
+        self._joined: Dict[str, int] = {name: 0 for name in joiners}
+        self._excluded = set()
+
+        # Ключ (страница или (провайдер, страница)) -> (провайдеры, future)
+        self._jobs: Dict[object, Tuple[Tuple[str, ...], asyncio.Future]] = {}
+
+        for name, pages in (known or {}).items():
+            for i, text in pages.items():
+                self._pages[name][i] = text
+            self._cut(name)
+        self._schedule()
+
+    def page_done(self, provider_name: str, page: Optional[int], text: str) -> None:
+        """Страница провайдера готова"""
+        if provider_name not in self._pages or page is None:
+            return
+
+        self._pages[provider_name][page] = text
+        if self._cut(provider_name):
+            self._schedule()
+
+    def provider_done(self, provider_name: str, error: Optional[str]) -> None:
+        """Провайдер закончил; упавший больше не участвует в консенсусе"""
+        if error is not None and provider_name in self._pages:
+            self._excluded.add(provider_name)
+            self._schedule()
+
+    def cancel(self) -> None:
+        """Отменяет еще не начатые задания"""
+        for _, future in self._jobs.values():
+            future.cancel()
+
+    def _cut(self, name: str) -> bool:
+        """Режет на куски готовые по порядку страницы провайдера"""
+        pages = self._pages[name]
+        tiles = self._tiles[name]
+        added = False
+
+        while len(tiles) < self.page_count and pages[len(tiles)] is not None:
+            joined = self.joiners[name](pages[:len(tiles) + 1])
+            tiles.append(joined[self._joined[name]:])
+            self._joined[name] = len(joined)
+            added = True
+
+        return added
+
+    def _schedule(self) -> None:
+        """Отправляет в пул страницы, для которых все готово"""
+        if self.reference_provider is not None:
+            reference = self._tiles[self.reference_provider]
+            for name, tiles in self._tiles.items():
+                if name in self._excluded:
+                    continue
+                for k in range(min(len(tiles), len(reference))):
+                    if (name, k) not in self._jobs:
+                        self._submit((name, k), (name,), [tiles[k]], reference[k])
+            return
+
+        voters = tuple(name for name in self._tiles if name not in self._excluded)
+        ready = min((len(self._tiles[name]) for name in voters), default=0)
+        for k in range(ready):
+            job = self._jobs.get(k)
+            if job is not None and job[0] == voters:
+                continue
+            if job is not None:
+                # Состав провайдеров изменился - консенсус страницы пересчитывается
+                job[1].cancel()
+            self._submit(k, voters, [self._tiles[name][k] for name in voters], None)
+
+    def _submit(self, key, names: Tuple[str, ...], texts: List[str], reference: Optional[str]) -> None:
+        future = self._loop.run_in_executor(
+            self.pool, align_pieces, texts, reference, self.engine, self.mode
+        )
+        self._jobs[key] = (names, future)
+
+    async def finish(self, raw_results: List[RawOCRResult]) -> List[ComparisonResult]:
+        """
+        Дожидается выравнивания страниц и собирает результаты документа.
+
+        Провайдеры, чьи куски не складываются в их итоговый текст
+        (упавшие или выдавшие не все страницы), выравниваются с
+        собранным референсом целиком.
+
+        Args:
+            raw_results: Результаты провайдеров (порядок сохраняется)
+
+        Returns:
+            List[ComparisonResult]: Результаты с сегментами и метриками
+        """
+        paged = {
+            result.provider_name
+            for result in raw_results
+            if result.error is None
+            and result.provider_name in self._tiles
+            and len(self._tiles[result.provider_name]) == self.page_count
+            and ''.join(self._tiles[result.provider_name]) == result.text
+        }
+
+        if self.reference_provider is not None and self.reference_provider not in paged:
+            logger.warning("Эталон не делится на страницы, выравнивание документа целиком")
+            return await align_document(
+                self.pool, raw_results, self.engine,
+                next(r.text for r in raw_results if r.provider_name == self.reference_provider),
+                self.mode
+            )
+
+        self._excluded |= set(self._tiles) - paged
+        self._schedule()
+
+        if not paged:
+            return await align_document(self.pool, raw_results, self.engine, None, self.mode)
+
+        pages: Dict[str, List[PageResult]] = {name: [] for name in paged}
+        pieces = []
+        for k in range(self.page_count):
+            if self.reference_provider is not None:
+                for name in paged:
+                    pages[name].append((await self._jobs[(name, k)][1])[0])
+                pieces.append(pages[self.reference_provider][k].reference)
+            else:
+                names, future = self._jobs[k]
+                results = await future
+                for name, result in zip(names, results):
+                    pages[name].append(result)
+                pieces.append(results[0].reference)
+
+        # Консенсус пословного режима - токены через пробел: страницы тоже
+        separator = ' ' if self.reference_provider is None and self.mode == 'word' else ''
+        starts = []
+        length = 0
+        for k, piece in enumerate(pieces):
+            if separator and length and piece:
+                pieces[k] = separator + piece
+                length += len(separator)
+            starts.append(length)
+            length += len(piece)
+        reference = ''.join(pieces)
+
+        # Остальные провайдеры - целиком, параллельно друг с другом
+        rest = [result for result in raw_results if result.provider_name not in paged]
+        whole = await asyncio.gather(*(
+            self._loop.run_in_executor(
+                self.pool, align_pieces, [result.text], reference, self.engine, self.mode
+            )
+            for result in rest
+        ))
+        whole = {result.provider_name: aligned[0] for result, aligned in zip(rest, whole)}
+
+        comparison_results = []
+        for result in raw_results:
+            name = result.provider_name
+            if name in paged:
+                scored = [
+                    name == self.reference_provider or k not in self.unscored
+                    for k in range(self.page_count)
+                ]
+                comparison_results.append(self._assemble(result, reference, starts, pages[name], scored))
+            else:
+                comparison_results.append(self._assemble(result, reference, [0], [whole[name]]))
+
+        logger.info(
+            f"Постраничное выравнивание: {self.page_count} страниц, "
+            f"{len(paged)} провайдеров по страницам, {len(rest)} целиком"
+        )
+
+        return comparison_results
+
+    def _assemble(
+        self,
+        result: RawOCRResult,
+        reference: str,
+        starts: List[int],
+        pieces: List[PageResult],
+        scored: Optional[List[bool]] = None
+    ) -> ComparisonResult:
+        """Склеивает выравнивания кусков в результат документа (метрики - по кускам scored)"""
+        store = SegmentStore(reference, result.text, result.provider_name)
+        ref_end = cmp_start = 0
+
+        for start, piece in zip(starts, pieces):
+            if start > ref_end:
+                # Разделитель страниц в референсе относится к предыдущему опкоду
+                store.ref_offsets[-1] = start
+            store.tags.extend(piece.tags)
+            store.ref_offsets.frombytes(_shifted(piece.ref_offsets, start))
+            store.cmp_offsets.frombytes(_shifted(piece.cmp_offsets, cmp_start))
+            ref_end = start + piece.errors.reference_chars
+            cmp_start += piece.errors.comparison_chars
+
+        if scored is not None:
+            pieces = [piece for piece, flag in zip(pieces, scored) if flag]
+        errors = reduce(add, (piece.errors for piece in pieces)) if pieces else ErrorCounts()
+        match_count = sum(piece.match_count for piece in pieces)
+        diff_count = sum(piece.diff_count for piece in pieces)
+
+        # В пословном режиме точность считается в токенах
+        accuracy = errors.accuracy(match_count, words=self.mode == 'word')
+
+        return ComparisonResult.from_store(
+            store,
+            errors=errors,
+            total_characters=len(result.text),
+            match_count=match_count,
+            diff_count=diff_count,
+            accuracy_percent=accuracy,
+            word_error_rate=errors.metrics().wer
+        )
@@ -0,0 +1,438 @@
+"""
+Предобработка страниц перед OCR: адаптивный DPI, оттенки серого,
+выравнивание наклона и бинаризация.
+
+Выполняется один раз на документ при растеризации (см. PageCache),
+результат общий для всех провайдеров. DPI выбирается для каждой
+страницы PDF так, чтобы строка текста занимала около
+PREPROCESS_TEXT_HEIGHT_PX пикселей: у цифровых страниц высота берется
+из размеров шрифтов текстового слоя, у сканов - из профиля строк
+пробного рендера низкого разрешения. Чистым счетам с обычным шрифтом
+хватает 150-200 DPI, мелкому шрифту нужно 300.
+
+Профили строк считаются средствами PIL: сжатие изображения до ширины
+в один пиксель фильтром BOX дает среднюю яркость каждой строки.
+"""
+import logging
+import os
+from pathlib import Path
+from statistics import median
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from app.models.schemas import PreprocessingStats
+from app.services.rasterizer import DEFAULT_DPI, rasterize_document
+
+logger = logging.getLogger(__name__)
+
+# Строка пикселей считается строкой текста, если чернил в ней больше 1%
+_INK_ROW_THRESHOLD = 255 * 0.01
+
+# Размер уменьшенной копии для оценки наклона
+_SKEW_THUMBNAIL = 800
+
+
+def otsu_threshold(image: Image.Image) -> int:
+    """
+    Порог бинаризации методом Оцу по гистограмме.
+
+    Args:
+        image: Изображение в оттенках серого (L)
+
+    Returns:
+        int: Порог (пиксели ярче него - фон)
+    """
+    histogram = image.histogram()[:256]
+    total = sum(histogram)
+    total_sum = sum(value * count for value, count in enumerate(histogram))
+
+    best_variance = -1.0
+    threshold = 127
+    weight = 0
+    weighted_sum = 0
+    for value, count in enumerate(histogram):
+        weight += count
+        if not weight:
+            continue
+        rest = total - weight
+        if not rest:
+            break
+        weighted_sum += value * count
+        mean_dark = weighted_sum / weight
+        mean_light = (total_sum - weighted_sum) / rest
+        variance = weight * rest * (mean_dark - mean_light) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            threshold = value
+    return threshold
+
+
+def binarize(image: Image.Image, threshold: Optional[int] = None) -> Image.Image:
+    """
+    Бинаризация: текст 0, фон 255 (режим L).
+
+    Args:
+        image: Изображение в оттенках серого
+        threshold: Порог (None - по методу Оцу)
+
+    Returns:
+        Image.Image: Черно-белое изображение
+    """
+    if threshold is None:
+        threshold = otsu_threshold(image)
+    return image.point([255 if value > threshold else 0 for value in range(256)])
+
+
+def _ink(image: Image.Image) -> Image.Image:
+    """Маска чернил: текст 255, фон 0"""
+    threshold = otsu_threshold(image)
+    return image.point([0 if value > threshold else 255 for value in range(256)])
+
+
+def _row_profile(ink: Image.Image) -> List[float]:
+    """Средняя доля чернил в каждой строке пикселей (0-255)"""
+    return list(ink.resize((1, ink.height), Image.BOX).getdata())
+
+
+def estimate_skew(image: Image.Image, max_angle: float = 5.0) -> float:
+    """
+    Оценивает наклон страницы по резкости профиля строк: при верном
+    повороте строки текста и промежутки между ними разделены четче всего.
+
+    Args:
+        image: Страница в оттенках серого
+        max_angle: Предельный проверяемый наклон (градусы)
+
+    Returns:
+        float: Угол поворота против часовой стрелки, выравнивающий страницу
+    """
+    scale = min(1.0, _SKEW_THUMBNAIL / max(image.size))
+    if scale < 1.0:
+        image = image.resize(
+            (max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+            Image.BILINEAR
+        )
+    ink = _ink(image)
+
+    def sharpness(angle: float) -> float:
+        profile = _row_profile(ink.rotate(angle, resample=Image.BILINEAR, fillcolor=0))
+        return sum((b - a) ** 2 for a, b in zip(profile, profile[1:]))
+
+    # Грубый перебор с шагом 1°, затем уточнение с шагом 0.1°
+    limit = int(max_angle)
+    scores: Dict[float, float] = {0.0: sharpness(0.0)}
+    for step in range(-limit, limit + 1):
+        scores.setdefault(float(step), sharpness(float(step)))
+    coarse = max(scores, key=scores.get)
+    for step in range(-9, 10):
+        angle = round(coarse + step / 10, 1)
+        if abs(angle) <= max_angle:
+            scores.setdefault(angle, sharpness(angle))
+
+    best = max(scores, key=scores.get)
+    # Пустая страница или текст без строк - наклон не определен
+    if scores[best] <= scores[0.0] * 1.01:
+        return 0.0
+    return best
+
+
+def estimate_text_height(image: Image.Image) -> Optional[float]:
+    """
+    Типичная высота строки текста по профилю строк.
+
+    Args:
+        image: Выровненная страница в оттенках серого
+
+    Returns:
+        Optional[float]: Медианная высота строки в пикселях или None,
+        если строк текста слишком мало
+    """
+    runs = []
+    start = None
+    for y, value in enumerate(_row_profile(_ink(image)) + [0.0]):
+        if value > _INK_ROW_THRESHOLD:
+            if start is None:
+                start = y
+        elif start is not None:
+            runs.append(y - start)
+            start = None
+
+    # Линии таблиц и рамок - одна-две строки пикселей
+    runs = [run for run in runs if run >= 2]
+    if len(runs) < 3:
+        return None
+    return float(median(runs))
+
+
+class PagePreprocessor:
+    """
+    Растеризация с выбором DPI по странице и общая предобработка.
+
+    Методы блокирующие; PageCache вызывает prepare() вне event loop.
+    """
+
+    def __init__(
+        self,
+        adaptive_dpi: bool = True,
+        base_dpi: int = DEFAULT_DPI,
+        min_dpi: int = 150,
+        max_dpi: int = 300,
+        dpi_step: int = 50,
+        text_height_px: float = 28.0,
+        probe_dpi: int = 72,
+        grayscale: bool = True,
+        deskew: bool = True,
+        max_skew: float = 5.0,
+        binarize: bool = True
+    ):
+        """
+        Args:
+            adaptive_dpi: Выбирать DPI по содержимому страницы
+            base_dpi: Фиксированный DPI (без адаптации и для сравнения экономии)
+            min_dpi: Нижняя граница DPI
+            max_dpi: Верхняя граница DPI
+            dpi_step: Шаг округления DPI
+            text_height_px: Желаемая высота строки текста в пикселях
+            probe_dpi: DPI пробного рендера сканов для оценки высоты строк
+            grayscale: Переводить страницы в оттенки серого
+            deskew: Выравнивать наклон
+            max_skew: Предельный исправляемый наклон (градусы)
+            binarize: Бинаризовать страницы (порог Оцу)
+        """
+        self.adaptive_dpi = adaptive_dpi
+        self.base_dpi = base_dpi
+        self.min_dpi = min_dpi
+        self.max_dpi = max_dpi
+        self.dpi_step = max(1, dpi_step)
+        self.text_height_px = text_height_px
+        self.probe_dpi = probe_dpi
+        self.grayscale = grayscale
+        self.deskew = deskew
+        self.max_skew = max_skew
+        self.binarize = binarize
+
+        self.documents = 0
+        self.pages = 0
+        self.pixels = 0
+        self.baseline_pixels = 0
+        self.dpi_histogram: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "PagePreprocessor":
+        """Создает препроцессор по переменным окружения"""
+        return cls(
+            adaptive_dpi=os.getenv("PREPROCESS_ADAPTIVE_DPI", "true").lower() == "true",
+            min_dpi=int(os.getenv("PREPROCESS_MIN_DPI", "150")),
+            max_dpi=int(os.getenv("PREPROCESS_MAX_DPI", "300")),
+            dpi_step=int(os.getenv("PREPROCESS_DPI_STEP", "50")),
+            text_height_px=float(os.getenv("PREPROCESS_TEXT_HEIGHT_PX", "28")),
+            probe_dpi=int(os.getenv("PREPROCESS_PROBE_DPI", "72")),
+            grayscale=os.getenv("PREPROCESS_GRAYSCALE", "true").lower() == "true",
+            deskew=os.getenv("PREPROCESS_DESKEW", "true").lower() == "true",
+            max_skew=float(os.getenv("PREPROCESS_MAX_SKEW", "5")),
+            binarize=os.getenv("PREPROCESS_BINARIZE", "true").lower() == "true"
+        )
+
+    def prepare(self, file_path: str) -> Tuple[List[Image.Image], PreprocessingStats]:
+        """
+        Растеризует документ и предобрабатывает страницы.
+
+        Args:
+            file_path: Путь к PDF или изображению
+
+        Returns:
+            Tuple[List[Image.Image], PreprocessingStats]: Страницы и отчет
+        """
+        is_pdf = Path(file_path).suffix.lower() == '.pdf'
+        dpis = self.plan_dpi(file_path) if is_pdf and self.adaptive_dpi else None
+        pages = rasterize_document(file_path, self.base_dpi, dpis)
+
+        if dpis is None:
+            dpis = [self.base_dpi if is_pdf else None] * len(pages)
+
+        processed = []
+        skews = []
+        for page in pages:
+            image, skew = self.process(page)
+            if image is not page:
+                page.close()
+            processed.append(image)
+            skews.append(skew)
+
+        report = self._report(processed, dpis, skews)
+        logger.info(
+            f"Предобработка {file_path}: DPI {dpis}, "
+            f"пикселей {report.pixels} вместо {report.baseline_pixels} "
+            f"(экономия {report.pixel_savings_percent}%)"
+        )
+        return processed, report
+
+    def process(self, image: Image.Image) -> Tuple[Image.Image, float]:
+        """
+        Оттенки серого, выравнивание наклона и бинаризация одной страницы.
+
+        Args:
+            image: Страница в RGB
+
+        Returns:
+            Tuple[Image.Image, float]: (страница, исправленный наклон в градусах)
+        """
+        if (self.grayscale or self.binarize) and image.mode != 'L':
+            image = image.convert('L')
+
+        skew = 0.0
+        if self.deskew:
+            gray = image if image.mode == 'L' else image.convert('L')
+            skew = estimate_skew(gray, self.max_skew)
+            if skew:
+                image = image.rotate(
+                    skew,
+                    resample=Image.BICUBIC,
+                    fillcolor=255 if image.mode == 'L' else (255, 255, 255)
+                )
+
+        if self.binarize:
+            image = binarize(image)
+
+        return image, skew
+
+    def choose_dpi(self, text_height_pt: Optional[float]) -> int:
+        """
+        DPI, при котором строка текста займет около text_height_px пикселей.
+
+        Args:
+            text_height_pt: Высота строки в пунктах (None - неизвестна)
+
+        Returns:
+            int: DPI, округленный до dpi_step и ограниченный [min_dpi, max_dpi]
+        """
+        if not text_height_pt:
+            return self.base_dpi
+
+        dpi = round(self.text_height_px * 72 / text_height_pt / self.dpi_step) * self.dpi_step
+        return int(min(self.max_dpi, max(self.min_dpi, dpi)))
+
+    def plan_dpi(self, file_path: str) -> Optional[List[int]]:
+        """
+        Выбирает DPI для каждой страницы PDF.
+
+        Args:
+            file_path: Путь к PDF
+
+        Returns:
+            Optional[List[int]]: DPI страниц или None, если PyMuPDF
+            не установлен или документ не читается
+        """
+        try:
+            import pymupdf
+        except ImportError:
+            try:
+                import fitz as pymupdf
+            except ImportError:
+                logger.warning("PyMuPDF не установлен, адаптивный DPI отключен")
+                return None
+
+        try:
+            with pymupdf.open(file_path) as document:
+                heights = []
+                for page in document:
+                    height = self._layer_text_height(page)
+                    if height is None:
+                        height = self._probe_text_height(page, pymupdf)
+                    heights.append(height)
+        except Exception as e:
+            logger.warning(f"Не удалось выбрать DPI для {file_path}: {e}")
+            return None
+
+        return [self.choose_dpi(height) for height in heights]
+
+    @staticmethod
+    def _layer_text_height(page) -> Optional[float]:
+        """Медианный размер шрифта текстового слоя (по символам), пункты"""
+        sizes = []
+        for block in page.get_text("dict")["blocks"]:
+            for line in block.get("lines", ()):
+                for span in line["spans"]:
+                    chars = len(span["text"].strip())
+                    if chars and span["size"] > 0:
+                        sizes.append((span["size"], chars))
+
+        total = sum(chars for _, chars in sizes)
+        if total < 20:
+            return None
+
+        # Взвешенная медиана: размер, на который приходится половина символов
+        sizes.sort()
+        seen = 0
+        for size, chars in sizes:
+            seen += chars
+            if seen * 2 >= total:
+                return size
+        return None
+
+    def _probe_text_height(self, page, pymupdf) -> Optional[float]:
+        """Высота строки скана по пробному рендеру низкого разрешения, пункты"""
+        pixmap = page.get_pixmap(dpi=self.probe_dpi, colorspace=pymupdf.csGRAY, alpha=False)
+        image = Image.frombytes('L', (pixmap.width, pixmap.height), pixmap.samples)
+
+        skew = estimate_skew(image, self.max_skew)
+        if skew:
+            image = image.rotate(skew, resample=Image.BILINEAR, fillcolor=255)
+
+        height = estimate_text_height(image)
+        return height * 72 / self.probe_dpi if height else None
+
+    def _report(
+        self,
+        pages: List[Image.Image],
+        dpis: List[Optional[int]],
+        skews: List[float]
+    ) -> PreprocessingStats:
+        """Отчет о документе и накопление общей статистики"""
+        pixels = [page.width * page.height for page in pages]
+        baseline = [
+            round(count * (self.base_dpi / dpi) ** 2) if dpi else count
+            for count, dpi in zip(pixels, dpis)
+        ]
+        total = sum(pixels)
+        baseline_total = sum(baseline)
+
+        self.documents += 1
+        self.pages += len(pages)
+        self.pixels += total
+        self.baseline_pixels += baseline_total
+        for dpi in dpis:
+            key = str(dpi) if dpi else 'image'
+            self.dpi_histogram[key] = self.dpi_histogram.get(key, 0) + 1
+
+        return PreprocessingStats(
+            dpi=dpis,
+            skew=skews,
+            pixels=total,
+            baseline_pixels=baseline_total,
+            pixel_savings_percent=_savings(total, baseline_total),
+            bytes=sum(count * len(page.mode) for count, page in zip(pixels, pages)),
+            baseline_bytes=baseline_total * 3
+        )
+
+    def stats(self) -> dict:
+        """Сведения о предобработке для /info"""
+        return {
+            'adaptive_dpi': self.adaptive_dpi,
+            'dpi_range': [self.min_dpi, self.max_dpi],
+            'grayscale': self.grayscale,
+            'deskew': self.deskew,
+            'binarize': self.binarize,
+            'documents': self.documents,
+            'pages': self.pages,
+            'pixels': self.pixels,
+            'baseline_pixels': self.baseline_pixels,
+            'pixel_savings_percent': _savings(self.pixels, self.baseline_pixels),
+            'dpi_histogram': self.dpi_histogram
+        }
+
+
+def _savings(pixels: int, baseline: int) -> float:
+    """Экономия пикселей в процентах"""
+    return round(100 * (1 - pixels / baseline), 1) if baseline else 0.0
@@ -0,0 +1,187 @@
+"""
+Прогресс обработки документа.
+
+Единица работы - страница одного провайдера (или документ целиком для
+провайдеров без постраничного режима). Каждая готовая единица пишется
+событием в журнал задачи (TaskStore.add_events) вместе с текстом, а
+процент - в метаданные задачи для /api/status. Запись идет вне event
+loop, в одном потоке: накопившиеся события уходят одной транзакцией.
+Слушатели (например, постраничное выравнивание) получают те же страницы
+сразу по готовности.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.task_store import TaskStore
+
+logger = logging.getLogger(__name__)
+
+# Доля процента на OCR; остаток - выравнивание и сохранение результата
+OCR_SHARE = 90
+
+# Один поток записи на все задачи: события задачи пишутся по порядку
+_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="progress")
+
+
+class TaskProgress:
+    """
+    Счетчик готовых страниц по провайдерам одной задачи.
+
+    События журнала:
+    - plan: {'providers': {имя: страниц}, 'pages'} - начало попытки
+    - page: {'provider', 'page' (с 1, None - документ целиком), 'text', 'cached'}
+    - provider: {'provider', 'processing_time', 'error'} - провайдер закончил
+    - stage: {'stage', 'message'} - этапы после OCR
+    """
+
+    def __init__(
+        self,
+        task_store: TaskStore,
+        task_id: str,
+        units: Dict[str, int],
+        page_count: Optional[int]
+    ):
+        """
+        Args:
+            task_store: Хранилище задач
+            task_id: ID задачи
+            units: Провайдер -> количество единиц работы (страниц)
+            page_count: Количество страниц документа (None без растеризации)
+        """
+        self.task_store = task_store
+        self.task_id = task_id
+        self.units = units
+        self.page_count = page_count
+        self.done: Dict[str, int] = {name: 0 for name in units}
+        self.total = sum(units.values())
+        
+        # Объекты с методами page_done(provider, page, text) и provider_done(provider, error)
+        self.listeners: List[Any] = []
+        
+        # Еще не записанные события и последний прогресс
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, dict]] = []
+        self._progress: Optional[dict] = None
+        self._scheduled = False
+        self._flush: Optional[Future] = None
+
+    @property
+    def percent(self) -> int:
+        finished = sum(self.done.values())
+        return int(OCR_SHARE * finished / self.total) if self.total else OCR_SHARE
+
+    def start(self) -> None:
+        """Сообщает план обработки"""
+        self._event('plan', {'providers': self.units, 'pages': self.page_count})
+        self._publish("Распознавание...")
+
+    def page_done(
+        self,
+        provider_name: str,
+        page: Optional[int],
+        text: str,
+        cached: bool = False
+    ) -> None:
+        """
+        Отмечает готовую страницу провайдера.
+
+        Args:
+            provider_name: Название провайдера
+            page: Номер страницы с 0 (None - документ целиком)
+            text: Распознанный текст
+            cached: Текст взят из кэша результатов
+        """
+        self.done[provider_name] = min(self.done[provider_name] + 1, self.units[provider_name])
+        self._event('page', {
+            'provider': provider_name,
+            'page': page + 1 if page is not None else None,
+            'text': text,
+            'cached': cached
+        })
+        self._publish(
+            f"{provider_name}: страница {self.done[provider_name]}/{self.units[provider_name]}"
+        )
+        self._notify('page_done', provider_name, page, text)
+
+    def provider_done(
+        self,
+        provider_name: str,
+        processing_time: float,
+        error: Optional[str] = None
+    ) -> None:
+        """Отмечает завершение провайдера (в том числе с ошибкой)"""
+        # Упавший провайдер больше не задерживает общий прогресс
+        self.done[provider_name] = self.units[provider_name]
+        self._event('provider', {
+            'provider': provider_name,
+            'processing_time': processing_time,
+            'error': error
+        })
+        self._publish(f"{provider_name}: {'ошибка' if error else 'готово'}")
+        self._notify('provider_done', provider_name, error)
+
+    def stage(self, stage: str, message: str, percent: int) -> None:
+        """Сообщает этап после распознавания"""
+        self._event('stage', {'stage': stage, 'message': message})
+        self._publish(message, percent)
+
+    def _notify(self, method: str, *args) -> None:
+        for listener in self.listeners:
+            try:
+                getattr(listener, method)(*args)
+            except Exception as e:
+                # Слушатель не должен ронять обработку
+                logger.warning(f"Задача {self.task_id}: ошибка слушателя прогресса: {e}")
+
+    async def drain(self) -> None:
+        """
+        Дожидается записи всех событий и прогресса. Вызывается перед
+        сменой статуса задачи: SSE дочитывает журнал после нее.
+        """
+        with self._lock:
+            flush = self._flush
+        if flush is not None:
+            await asyncio.wrap_future(flush)
+
+    def _event(self, kind: str, data: dict) -> None:
+        with self._lock:
+            self._pending.append((kind, data))
+            self._schedule()
+
+    def _publish(self, message: str, percent: Optional[int] = None) -> None:
+        with self._lock:
+            self._progress = {
+                'percent': self.percent if percent is None else percent,
+                'done': sum(self.done.values()),
+                'total': self.total,
+                'message': message
+            }
+            self._schedule()
+
+    def _schedule(self) -> None:
+        """Ставит запись в поток, если она еще не запланирована (под блокировкой)"""
+        if not self._scheduled:
+            self._scheduled = True
+            self._flush = _WRITER.submit(self._write)
+
+    def _write(self) -> None:
+        """Пишет накопившиеся события и прогресс (в потоке записи)"""
+        with self._lock:
+            events, self._pending = self._pending, []
+            progress, self._progress = self._progress, None
+            self._scheduled = False
+
+        # Прогресс не должен ронять обработку
+        if events:
+            try:
+                self.task_store.add_events(self.task_id, events)
+            except Exception as e:
+                logger.warning(f"Задача {self.task_id}: не удалось записать {len(events)} событий: {e}")
+        if progress is not None:
+            try:
+                self.task_store.set_progress(self.task_id, progress)
+            except Exception as e:
+                logger.warning(f"Задача {self.task_id}: не удалось обновить прогресс: {e}")
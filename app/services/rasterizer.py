@@ -0,0 +1,226 @@
+"""
+Растеризация документов: каждая страница рендерится один раз на документ
+и разделяется между всеми OCR провайдерами. Предобработка (DPI по
+странице, оттенки серого, наклон, бинаризация - см. preprocessing.py)
+выполняется там же, один раз.
+"""
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageSequence
+
+from app.services.result_cache import hash_image
+from app.services.shared_pages import SharedPage
+
+logger = logging.getLogger(__name__)
+
+# DPI по умолчанию (раньше был зашит в каждом провайдере)
+DEFAULT_DPI = int(os.getenv("OCR_RASTER_DPI", "250"))
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.tiff', '.tif', '.bmp'}
+
+
+def rasterize_document(
+    file_path: str,
+    dpi: int = DEFAULT_DPI,
+    dpis: Optional[List[int]] = None
+) -> List[Image.Image]:
+    """
+    Рендерит документ в список изображений страниц (блокирующая операция).
+
+    Args:
+        file_path: Путь к PDF или изображению
+        dpi: Разрешение рендеринга PDF
+        dpis: Разрешение каждой страницы PDF (вместо общего dpi);
+            подряд идущие страницы с одним DPI рендерятся одним вызовом
+
+    Returns:
+        List[Image.Image]: Страницы в RGB
+    """
+    path = Path(file_path)
+    suffix = path.suffix.lower()
+
+    if suffix == '.pdf':
+        try:
+            from pdf2image import convert_from_path
+        except ImportError:
+            logger.error("pdf2image не установлен")
+            raise ImportError("Установите pdf2image: pip install pdf2image")
+
+        if dpis is None:
+            pages = convert_from_path(str(path), dpi=dpi)
+        else:
+            pages = []
+            first = 0
+            while first < len(dpis):
+                last = first
+                while last + 1 < len(dpis) and dpis[last + 1] == dpis[first]:
+                    last += 1
+                pages.extend(convert_from_path(
+                    str(path), dpi=dpis[first], first_page=first + 1, last_page=last + 1
+                ))
+                first = last + 1
+        return [page.convert('RGB') if page.mode != 'RGB' else page for page in pages]
+
+    if suffix in IMAGE_EXTENSIONS:
+        # Многостраничный TIFF разворачиваем в отдельные страницы
+        with Image.open(path) as image:
+            return [frame.convert('RGB') for frame in ImageSequence.Iterator(image)]
+
+    raise ValueError(f"Неподдерживаемый формат: {path.suffix}")
+
+
+class _CacheEntry:
+    """Растеризованный документ с счетчиком ссылок"""
+
+    def __init__(self):
+        self.ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.refcount = 0
+        self.shared: Optional[List[SharedPage]] = None
+        self.hashes: Optional[List[str]] = None
+        self.report: Any = None
+
+
+class PageCache:
+    """
+    Общий кэш растеризованных страниц с подсчетом ссылок.
+
+    Документ рендерится при первом acquire() и освобождается,
+    когда последний пользователь вызвал release(). Одновременные
+    запросы одного и того же файла ждут один и тот же рендеринг.
+    """
+
+    def __init__(self, dpi: int = DEFAULT_DPI, preprocessor: Any = None):
+        """
+        Args:
+            dpi: Разрешение рендеринга PDF
+            preprocessor: PagePreprocessor (None - рендеринг с фиксированным
+                DPI без предобработки)
+        """
+        self.dpi = dpi
+        self.preprocessor = preprocessor
+        self._entries: Dict[Tuple[str, int], _CacheEntry] = {}
+
+    def _key(self, file_path: str) -> Tuple[str, int]:
+        # Запись живет только пока на нее есть ссылки, поэтому
+        # устаревание по mtime не отслеживаем
+        return str(Path(file_path).resolve()), self.dpi
+
+    async def acquire(self, file_path: str) -> List[Image.Image]:
+        """
+        Возвращает страницы документа, рендеря их при необходимости.
+        Каждый вызов acquire() должен быть парным к release().
+
+        Args:
+            file_path: Путь к файлу
+
+        Returns:
+            List[Image.Image]: Страницы документа
+        """
+        key = self._key(file_path)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            entry = _CacheEntry()
+            self._entries[key] = entry
+            entry.refcount += 1
+            try:
+                if self.preprocessor is not None:
+                    pages, entry.report = await asyncio.to_thread(self.preprocessor.prepare, file_path)
+                else:
+                    pages = await asyncio.to_thread(rasterize_document, file_path, self.dpi)
+            except Exception as e:
+                del self._entries[key]
+                entry.ready.set_exception(e)
+                # Исключение уже передано ожидающим, помечаем как полученное
+                entry.ready.exception()
+                raise
+            entry.ready.set_result(pages)
+            logger.info(f"Растеризовано {len(pages)} страниц: {file_path}")
+            return pages
+
+        entry.refcount += 1
+        try:
+            return await asyncio.shield(entry.ready)
+        except Exception:
+            entry.refcount -= 1
+            raise
+
+    def share(self, file_path: str) -> List[SharedPage]:
+        """
+        Возвращает страницы документа в разделяемой памяти для
+        worker-процессов. Копирование выполняется один раз на документ,
+        блоки освобождаются вместе с последней ссылкой в release().
+        Документ должен быть предварительно получен через acquire().
+
+        Args:
+            file_path: Путь к файлу
+
+        Returns:
+            List[SharedPage]: Страницы в разделяемой памяти
+        """
+        entry = self._entries[self._key(file_path)]
+
+        if entry.shared is None:
+            entry.shared = [SharedPage.from_image(page) for page in entry.ready.result()]
+
+        return entry.shared
+
+    async def page_hashes(self, file_path: str) -> List[str]:
+        """
+        SHA-256 растра каждой страницы (ключи кэша результатов OCR).
+        Считается один раз на документ. Документ должен быть
+        предварительно получен через acquire().
+
+        Args:
+            file_path: Путь к файлу
+
+        Returns:
+            List[str]: Хэши страниц
+        """
+        entry = self._entries[self._key(file_path)]
+
+        if entry.hashes is None:
+            pages = entry.ready.result()
+            entry.hashes = await asyncio.to_thread(lambda: [hash_image(page) for page in pages])
+
+        return entry.hashes
+
+    def report(self, file_path: str) -> Any:
+        """
+        Отчет предобработки документа (PreprocessingStats или None).
+        Документ должен быть предварительно получен через acquire().
+        """
+        return self._entries[self._key(file_path)].report
+
+    def release(self, file_path: str) -> None:
+        """
+        Освобождает ссылку на страницы документа.
+
+        Args:
+            file_path: Путь к файлу
+        """
+        key = self._key(file_path)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            return
+
+        entry.refcount -= 1
+        if entry.refcount > 0:
+            return
+
+        del self._entries[key]
+        if entry.shared is not None:
+            for shared_page in entry.shared:
+                shared_page.unlink()
+        if entry.ready.done() and not entry.ready.exception():
+            for page in entry.ready.result():
+                page.close()
+        logger.debug(f"Страницы освобождены: {file_path}")
+
+    def __len__(self) -> int:
+        return len(self._entries)
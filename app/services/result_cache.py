@@ -0,0 +1,263 @@
+"""
+Кэш результатов OCR с адресацией по содержимому.
+
+Ключ: SHA-256 растра страницы (или байтов файла), провайдер, версия
+движка, влияющие на результат настройки и DPI. Кэш постраничный:
+документ, совпадающий с ранее загруженным частично, распознается
+только по новым страницам.
+
+Хранение: LRU в памяти поверх SQLite на диске с вытеснением по размеру.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def hash_image(image: Image.Image) -> str:
+    """SHA-256 растра страницы (пиксели, размер и режим)"""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OCRResultCache:
+    """
+    Двухуровневый кэш текстов распознавания: LRU в памяти + SQLite.
+
+    Все методы потокобезопасны; асинхронные обертки выполняют
+    обращения к диску вне event loop.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_bytes: int = 512 * 1024 * 1024,
+        memory_items: int = 1024
+    ):
+        """
+        Args:
+            db_path: Путь к файлу SQLite
+            max_bytes: Предельный объем текстов на диске
+            memory_items: Размер LRU в памяти (записей)
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ocr_results (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ocr_results_access ON ocr_results(last_access)"
+        )
+        self._conn.commit()
+
+        row = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_results").fetchone()
+        self._disk_bytes = row[0]
+
+        logger.info(f"Кэш OCR: {db_path} ({self._disk_bytes} байт на диске)")
+
+    @classmethod
+    def from_env(cls) -> Optional["OCRResultCache"]:
+        """Создает кэш по переменным окружения (None, если отключен)"""
+        if os.getenv("OCR_CACHE_ENABLED", "true").lower() != "true":
+            return None
+
+        return cls(
+            db_path=os.getenv("OCR_CACHE_PATH", "./cache/ocr_results.sqlite3"),
+            max_bytes=int(os.getenv("OCR_CACHE_MAX_MB", "512")) * 1024 * 1024,
+            memory_items=int(os.getenv("OCR_CACHE_MEMORY_ITEMS", "1024"))
+        )
+
+    @staticmethod
+    def make_key(content_hash: str, provider, dpi: Optional[int] = None) -> str:
+        """
+        Формирует ключ кэша.
+
+        Args:
+            content_hash: SHA-256 растра страницы или файла
+            provider: OCR провайдер (имя, версия и настройки)
+            dpi: DPI растеризации (None для обработки исходного файла)
+
+        Returns:
+            str: Ключ
+        """
+        parts = {
+            'content': content_hash,
+            'provider': provider.provider_name,
+            'version': provider.get_version(),
+            'config': provider.get_cache_config(),
+            'dpi': dpi
+        }
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        """
+        Возвращает тексты по ключам (None для промахов).
+
+        Args:
+            keys: Ключи кэша
+
+        Returns:
+            List[Optional[str]]: Тексты в порядке ключей
+        """
+        results: Dict[str, str] = {}
+        disk_keys = []
+
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    results[key] = self._memory[key]
+                    self.memory_hits += 1
+                else:
+                    disk_keys.append(key)
+
+            if disk_keys:
+                placeholders = ','.join('?' * len(disk_keys))
+                rows = self._conn.execute(
+                    f"SELECT key, text FROM ocr_results WHERE key IN ({placeholders})",
+                    disk_keys
+                ).fetchall()
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE ocr_results SET last_access = ? WHERE key = ?",
+                    [(now, key) for key, _ in rows]
+                )
+                self._conn.commit()
+
+                for key, text in rows:
+                    results[key] = text
+                    self._remember(key, text)
+                self.disk_hits += len(rows)
+                self.misses += len(disk_keys) - len(rows)
+
+        return [results.get(key) for key in keys]
+
+    def put_many(self, items: Dict[str, str]) -> None:
+        """
+        Сохраняет тексты.
+
+        Args:
+            items: Ключ -> текст
+        """
+        if not items:
+            return
+
+        now = time.time()
+        with self._lock:
+            for key, text in items.items():
+                size = len(text.encode('utf-8'))
+                old = self._conn.execute(
+                    "SELECT size FROM ocr_results WHERE key = ?", (key,)
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO ocr_results (key, text, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, text, size, now)
+                )
+                self._disk_bytes += size - (old[0] if old else 0)
+                self._remember(key, text)
+
+            self._evict()
+            self._conn.commit()
+
+    async def aget_many(self, keys: List[str]) -> List[Optional[str]]:
+        """Асинхронная версия get_many"""
+        return await asyncio.to_thread(self.get_many, keys)
+
+    async def aput_many(self, items: Dict[str, str]) -> None:
+        """Асинхронная версия put_many"""
+        await asyncio.to_thread(self.put_many, items)
+
+    def _remember(self, key: str, text: str) -> None:
+        """Кладет запись в LRU в памяти"""
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self) -> None:
+        """Вытесняет давно не использованные записи до 90% лимита"""
+        if self._disk_bytes <= self.max_bytes:
+            return
+
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT key, size FROM ocr_results ORDER BY last_access"
+        )
+        evicted = []
+        for key, size in rows:
+            if self._disk_bytes <= target:
+                break
+            evicted.append(key)
+            self._disk_bytes -= size
+
+        self._conn.executemany("DELETE FROM ocr_results WHERE key = ?", [(key,) for key in evicted])
+        for key in evicted:
+            self._memory.pop(key, None)
+        self.evictions += len(evicted)
+
+        logger.info(f"Кэш OCR: вытеснено {len(evicted)} записей")
+
+    def stats(self) -> dict:
+        """Счетчики попаданий/промахов и объем"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'hits': hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'memory_items': len(self._memory),
+                'disk_bytes': self._disk_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def close(self) -> None:
+        """Закрывает соединение с SQLite"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,154 @@
+"""
+Справедливое распределение страниц между документами.
+
+У каждого провайдера общий на процесс пул слотов (страниц, которые
+распознаются одновременно). Когда документов в работе несколько, слоты
+выдаются по кругу: сначала между пакетами (батчами), внутри пакета -
+между его документами. Поэтому страницы разных документов чередуются,
+каждый движок остается загруженным, а большой пакет не вытесняет
+одиночные документы и другие пакеты. Число слотов одного пакета
+можно ограничить.
+"""
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (пакет, документ); для документа вне пакета оба элемента - его task_id
+GroupKey = Tuple[str, str]
+
+
+class FairScheduler:
+    """
+    Слоты распознавания страниц одного провайдера.
+
+    Работает в пределах одного event loop; ожидающие страницы хранятся
+    как futures в очередях по (пакет, документ).
+    """
+
+    def __init__(self, name: str, slots: int, group_cap: int = 0):
+        """
+        Args:
+            name: Название провайдера (для логов и статистики)
+            slots: Сколько страниц распознается одновременно
+            group_cap: Предел одновременных страниц одного пакета (0 - без предела)
+        """
+        self.name = name
+        self.slots = max(1, slots)
+        self.group_cap = group_cap
+        self.granted = 0
+
+        self._running = 0
+        self._group_running: Dict[str, int] = {}
+        # Пакет -> документ -> ожидающие страницы; порядок словарей - очередь обхода
+        self._waiting: "OrderedDict[str, OrderedDict[str, Deque[asyncio.Future]]]" = OrderedDict()
+
+    @asynccontextmanager
+    async def slot(self, key: Optional[GroupKey]) -> AsyncIterator[None]:
+        """
+        Занимает слот на время распознавания одной страницы.
+
+        Args:
+            key: (пакет, документ); None - отдельная группа без пакета
+        """
+        key = key or ('', '')
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    async def acquire(self, key: GroupKey) -> None:
+        """Ждет своей очереди на слот"""
+        group, member = key
+
+        if not self._waiting and self._can_run(group):
+            self._grant(group)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(group, OrderedDict()).setdefault(member, deque()).append(future)
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот выдан, но ожидающий уже отменен
+                self.release(key)
+            else:
+                self._discard(group, member, future)
+            raise
+
+    def release(self, key: GroupKey) -> None:
+        """Освобождает слот и передает его следующей группе по кругу"""
+        group = key[0]
+        self._running -= 1
+        self._group_running[group] -= 1
+        if not self._group_running[group]:
+            del self._group_running[group]
+        self._dispatch()
+
+    def _can_run(self, group: str) -> bool:
+        if self._running >= self.slots:
+            return False
+        return not self.group_cap or self._group_running.get(group, 0) < self.group_cap
+
+    def _grant(self, group: str) -> None:
+        self._running += 1
+        self._group_running[group] = self._group_running.get(group, 0) + 1
+        self.granted += 1
+
+    def _dispatch(self) -> None:
+        """Раздает свободные слоты ожидающим по кругу пакетов и документов"""
+        while self._running < self.slots:
+            for group in list(self._waiting):
+                if self._can_run(group):
+                    break
+            else:
+                return
+
+            members = self._waiting[group]
+            member, queue = next(iter(members.items()))
+            future = queue.popleft()
+
+            # Следующий раз начинаем с других пакетов и документов
+            if queue:
+                members.move_to_end(member)
+            else:
+                del members[member]
+            if members:
+                self._waiting.move_to_end(group)
+            else:
+                del self._waiting[group]
+
+            if future.done():
+                continue
+            self._grant(group)
+            future.set_result(None)
+
+    def _discard(self, group: str, member: str, future: asyncio.Future) -> None:
+        """Убирает отмененное ожидание из очереди"""
+        members = self._waiting.get(group)
+        queue = members.get(member) if members else None
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        if not queue:
+            del members[member]
+        if not members:
+            del self._waiting[group]
+
+    def stats(self) -> dict:
+        """Сведения о загрузке для /info"""
+        return {
+            'slots': self.slots,
+            'group_cap': self.group_cap,
+            'running': self._running,
+            'waiting': sum(len(queue) for members in self._waiting.values() for queue in members.values()),
+            'groups': len(self._group_running.keys() | self._waiting.keys()),
+            'granted': self.granted
+        }
@@ -0,0 +1,113 @@
+"""
+Страницы документа в разделяемой памяти для передачи в worker-процессы.
+
+Пиксели страницы копируются в SharedMemory один раз; между процессами
+сериализуется только дескриптор (имя блока, размер, режим), а не
+PIL-изображение целиком.
+"""
+import logging
+import sys
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def _attach(name: str) -> SharedMemory:
+    """Подключается к существующему блоку, созданному процессом API"""
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+
+    # До 3.13 подключение повторно регистрирует блок в resource_tracker.
+    # Worker-процессы (spawn) используют трекер процесса API, где блок уже
+    # зарегистрирован, поэтому повторная регистрация ничего не меняет,
+    # а unlink() владельца снимает ее
+    return SharedMemory(name=name)
+
+
+class SharedPage:
+    """
+    Растровая страница в разделяемой памяти.
+
+    Создается владельцем (процесс API) через from_image() и удаляется
+    им же через unlink(). В worker-процессах восстанавливается из
+    дескриптора при распаковке pickle.
+    """
+
+    def __init__(self, shm: SharedMemory, size: Tuple[int, int], mode: str, owner: bool):
+        self._shm: Optional[SharedMemory] = shm
+        self.size = size
+        self.mode = mode
+        self.nbytes = size[0] * size[1] * len(mode)
+        self.owner = owner
+
+    @classmethod
+    def from_image(cls, image: Image.Image) -> "SharedPage":
+        """
+        Копирует пиксели изображения в новый блок разделяемой памяти.
+
+        Args:
+            image: Страница (L или RGB)
+
+        Returns:
+            SharedPage: Страница в разделяемой памяти
+        """
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+
+        data = image.tobytes()
+        shm = SharedMemory(create=True, size=max(len(data), 1))
+        shm.buf[:len(data)] = data
+        return cls(shm, image.size, image.mode, owner=True)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def to_image(self) -> Image.Image:
+        """Копия страницы как PIL-изображение (не держит ссылку на буфер)"""
+        return Image.frombytes(self.mode, self.size, bytes(self._shm.buf[:self.nbytes]))
+
+    def to_array(self, copy: bool = True):
+        """
+        Пиксели страницы как numpy-массив (H×W или H×W×C, uint8) без
+        кодирования и PIL.
+
+        Args:
+            copy: False - представление поверх разделяемой памяти без копии;
+                его нужно освободить до close()
+
+        Returns:
+            np.ndarray: Массив пикселей
+        """
+        import numpy as np
+
+        width, height = self.size
+        shape = (height, width) if len(self.mode) == 1 else (height, width, len(self.mode))
+        view = np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf[:self.nbytes])
+        return view.copy() if copy else view
+
+    def close(self) -> None:
+        """Отключается от блока в текущем процессе"""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+    def unlink(self) -> None:
+        """Освобождает блок (только владелец)"""
+        if self._shm is None:
+            return
+        if self.owner:
+            self._shm.unlink()
+        self.close()
+
+    def __getstate__(self) -> dict:
+        return {'name': self._shm.name, 'size': self.size, 'mode': self.mode}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(_attach(state['name']), tuple(state['size']), state['mode'], owner=False)
+
+    def __repr__(self) -> str:
+        return f"<SharedPage(name='{self._shm.name if self._shm else None}', size={self.size}, mode='{self.mode}')>"
@@ -0,0 +1,804 @@
+"""
+Хранилище задач и результатов сравнения.
+
+Метаданные задачи (статус, прогресс, имя файла, ошибка) и большие блобы
+(сырые тексты, сегменты, HTML) хранятся раздельно: блобы сжаты zlib и
+читаются только при запросе результатов. Сегменты хранятся массивами
+опкодов SegmentStore и тексты, на которые они ссылаются; DiffSegment
+создаются из них только при сериализации ответа. События обработки (готовые
+страницы провайдеров) пишутся в журнал задачи, который читает
+SSE-endpoint - в том числе из другого процесса. Пакеты документов
+хранятся списком своих task_id. Записи живут не дольше TTL,
+а при превышении лимита объема вытесняются самые старые.
+
+Бэкенды:
+- sqlite (по умолчанию): один файл в режиме WAL, общий для нескольких
+  процессов uvicorn
+- redis: любой Redis-совместимый сервер (Valkey, KeyDB, Dragonfly) или
+  локальная замена с методами get/set/delete/exists/hset/hget/hgetall/
+  rpush/llen/lrange/expire; TTL задается EXPIRE,
+  вытеснение по объему - политикой maxmemory сервера
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import TypeAdapter
+
+from app.models.schemas import (
+    ComparisonResponse,
+    ComparisonResult,
+    OCRStatistics,
+    PreprocessingStats,
+    RawOCRResult
+)
+from app.models.segments import SegmentStore
+
+logger = logging.getLogger(__name__)
+
+_RAW_RESULTS = TypeAdapter(List[RawOCRResult])
+_COMPARISON = TypeAdapter(List[ComparisonResult])
+_STATISTICS = TypeAdapter(List[OCRStatistics])
+
+# Блобы результата; HTML визуализация кэшируется на диске (см. html_cache.py),
+# блоб html остался только у старых результатов и удаляется вместе с задачей.
+# segments - опкоды SegmentStore; у старых результатов его нет, а comparison
+# в них - список сегментов в JSON
+RESULT_BLOBS = ('raw_results', 'comparison', 'statistics')
+OPTIONAL_BLOBS = ('segments', 'html', 'preprocessing')
+
+
+def _compress(data: bytes) -> bytes:
+    return zlib.compress(data, 6)
+
+
+def _decompress(data: bytes) -> bytes:
+    return zlib.decompress(data)
+
+
+def _decode(value):
+    """Строка из ответа Redis (клиент без decode_responses возвращает bytes)"""
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def _dump_comparison(results: List[ComparisonResult]):
+    """
+    Результаты сравнения без DiffSegment: поля результатов и тексты - в JSON,
+    опкоды всех SegmentStore подряд - в отдельном блоке байт.
+
+    Returns:
+        Tuple[bytes, bytes]: (JSON, опкоды)
+    """
+    texts: Dict[str, int] = {}
+    entries = []
+    chunks = []
+
+    for result in results:
+        store = result.store
+        entry = result.model_dump(mode='json', exclude={'segments', 'provider_name'})
+        entry.update(
+            provider_name=store.provider_name,
+            reference=texts.setdefault(store.reference, len(texts)),
+            comparison=texts.setdefault(store.comparison, len(texts)),
+            segment_count=len(store)
+        )
+        entries.append(entry)
+        chunks.append(store.to_bytes())
+
+    data = json.dumps({'texts': list(texts), 'results': entries}, ensure_ascii=False)
+    return data.encode('utf-8'), b''.join(chunks)
+
+
+def _load_comparison(data: bytes, segments: Optional[bytes]) -> List[ComparisonResult]:
+    """Результаты сравнения поверх восстановленных SegmentStore (см. _dump_comparison)"""
+    if segments is None:
+        # Старый формат: сегменты списком в JSON
+        return _COMPARISON.validate_json(data)
+
+    payload = json.loads(data)
+    texts = payload['texts']
+    view = memoryview(segments)
+    offset = 0
+    results = []
+
+    for entry in payload['results']:
+        count = entry.pop('segment_count')
+        store = SegmentStore.from_bytes(
+            texts[entry.pop('reference')],
+            texts[entry.pop('comparison')],
+            entry.pop('provider_name'),
+            view[offset:],
+            count
+        )
+        offset += SegmentStore.byte_size(count)
+        results.append(ComparisonResult.from_store(store, **entry))
+
+    return results
+
+
+class TaskStore(ABC):
+    """
+    Базовый класс хранилища задач.
+
+    Синхронные методы потокобезопасны; асинхронные обертки выполняют
+    сжатие и обращения к хранилищу вне event loop.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        """
+        Args:
+            ttl_seconds: Время жизни задачи с момента последнего обновления
+        """
+        self.ttl_seconds = ttl_seconds
+
+    @classmethod
+    def from_env(cls) -> "TaskStore":
+        """Создает хранилище по переменным окружения"""
+        backend = os.getenv("TASK_STORE", "sqlite").lower()
+        ttl_seconds = float(os.getenv("TASK_TTL_HOURS", "24")) * 3600
+
+        if backend == 'sqlite':
+            return SQLiteTaskStore(
+                db_path=os.getenv("TASK_STORE_PATH", "./cache/tasks.sqlite3"),
+                ttl_seconds=ttl_seconds,
+                max_bytes=int(os.getenv("TASK_STORE_MAX_MB", "1024")) * 1024 * 1024
+            )
+        if backend == 'redis':
+            return RedisTaskStore.from_url(
+                os.getenv("TASK_STORE_URL", "redis://localhost:6379/0"),
+                ttl_seconds=ttl_seconds
+            )
+
+        raise ValueError(f"Неизвестный бэкенд хранилища задач: {backend}. Доступны: sqlite, redis")
+
+    # --- Операции бэкенда ---
+
+    @abstractmethod
+    def create(
+        self,
+        task_id: str,
+        filename: str,
+        created_at: Optional[datetime] = None,
+        status: str = 'processing'
+    ) -> None:
+        """Регистрирует задачу (без результатов и событий) в указанном статусе"""
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[dict]:
+        """Метаданные задачи (без блобов) или None"""
+
+    @abstractmethod
+    def set_status(self, task_id: str, status: str, error: Optional[str] = None) -> None:
+        """Обновляет статус задачи"""
+
+    @abstractmethod
+    def put_blobs(self, task_id: str, blobs: Dict[str, bytes]) -> None:
+        """Сохраняет сжатые блобы задачи"""
+
+    @abstractmethod
+    def get_blobs(self, task_id: str, names: List[str]) -> Dict[str, bytes]:
+        """Загружает сжатые блобы задачи (отсутствующие пропускаются)"""
+
+    @abstractmethod
+    def set_progress(self, task_id: str, progress: dict) -> None:
+        """
+        Обновляет прогресс задачи.
+
+        Args:
+            task_id: ID задачи
+            progress: {'percent', 'done', 'total', 'message'}
+        """
+
+    @abstractmethod
+    def add_events(self, task_id: str, events: List[Tuple[str, dict]]) -> None:
+        """Добавляет события (kind, data) в журнал задачи одной записью"""
+
+    def add_event(self, task_id: str, kind: str, data: dict) -> None:
+        """Добавляет событие в журнал задачи"""
+        self.add_events(task_id, [(kind, data)])
+
+    @abstractmethod
+    def get_events(self, task_id: str, after: int = 0, limit: int = 100) -> List[dict]:
+        """
+        События задачи с номером больше after.
+
+        Returns:
+            List[dict]: [{'seq', 'kind', 'data'}] по возрастанию seq
+        """
+
+    @abstractmethod
+    def delete(self, task_id: str) -> None:
+        """Удаляет задачу, ее блобы и события"""
+
+    @abstractmethod
+    def create_batch(self, batch_id: str, task_ids: List[str], created_at: Optional[datetime] = None) -> None:
+        """Регистрирует пакет документов"""
+
+    @abstractmethod
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        """
+        Пакет документов.
+
+        Returns:
+            Optional[dict]: {'batch_id', 'task_ids', 'created_at'} или None
+        """
+
+    def evict(self) -> int:
+        """Удаляет просроченные задачи; возвращает их количество"""
+        return 0
+
+    def stats(self) -> dict:
+        """Сведения о хранилище для /info"""
+        return {'backend': type(self).__name__, 'ttl_seconds': self.ttl_seconds}
+
+    def close(self) -> None:
+        """Освобождает соединения"""
+
+    # --- Результаты ---
+
+    def put_result(self, response: ComparisonResponse) -> None:
+        """
+        Сохраняет результат сравнения и переводит задачу в completed.
+
+        Args:
+            response: Результат обработки
+        """
+        comparison, segments = _dump_comparison(response.comparison)
+        blobs = {
+            'raw_results': _compress(_RAW_RESULTS.dump_json(response.raw_results)),
+            'comparison': _compress(comparison),
+            'segments': _compress(segments),
+            'statistics': _compress(_STATISTICS.dump_json(response.statistics))
+        }
+        if response.preprocessing is not None:
+            blobs['preprocessing'] = _compress(response.preprocessing.model_dump_json().encode('utf-8'))
+
+        self.put_blobs(response.task_id, blobs)
+        self.set_status(response.task_id, 'completed')
+
+    def get_result(self, task_id: str) -> Optional[ComparisonResponse]:
+        """
+        Загружает результат сравнения.
+
+        Args:
+            task_id: ID задачи
+
+        Returns:
+            Optional[ComparisonResponse]: Результат или None
+        """
+        task = self.get(task_id)
+        if task is None or task['status'] != 'completed':
+            return None
+
+        names = list(RESULT_BLOBS) + ['segments', 'preprocessing']
+        blobs = self.get_blobs(task_id, names)
+        if any(name not in blobs for name in RESULT_BLOBS):
+            return None
+
+        segments = blobs.get('segments')
+        preprocessing = blobs.get('preprocessing')
+        return ComparisonResponse(
+            task_id=task_id,
+            filename=task['filename'],
+            status='completed',
+            created_at=task['created_at'],
+            raw_results=_RAW_RESULTS.validate_json(_decompress(blobs['raw_results'])),
+            comparison=_load_comparison(
+                _decompress(blobs['comparison']),
+                _decompress(segments) if segments else None
+            ),
+            statistics=_STATISTICS.validate_json(_decompress(blobs['statistics'])),
+            preprocessing=PreprocessingStats.model_validate_json(_decompress(preprocessing)) if preprocessing else None
+        )
+
+    def get_statistics(self, task_id: str) -> Optional[List[OCRStatistics]]:
+        """Статистика готовой задачи без загрузки текстов и сегментов"""
+        data = self.get_blobs(task_id, ['statistics']).get('statistics')
+        return _STATISTICS.validate_json(_decompress(data)) if data else None
+
+    async def aput_result(self, response: ComparisonResponse) -> None:
+        """Асинхронная версия put_result"""
+        await asyncio.to_thread(self.put_result, response)
+
+    async def aget_result(self, task_id: str) -> Optional[ComparisonResponse]:
+        """Асинхронная версия get_result"""
+        return await asyncio.to_thread(self.get_result, task_id)
+
+    async def aget_statistics(self, task_id: str) -> Optional[List[OCRStatistics]]:
+        """Асинхронная версия get_statistics"""
+        return await asyncio.to_thread(self.get_statistics, task_id)
+
+
+class SQLiteTaskStore(TaskStore):
+    """Хранилище задач в SQLite (WAL) с TTL и вытеснением по объему"""
+
+    # Как часто (в секундах) удалять просроченные задачи при записи
+    EVICT_INTERVAL = 60.0
+
+    def __init__(
+        self,
+        db_path: str,
+        ttl_seconds: float = 24 * 3600,
+        max_bytes: int = 1024 * 1024 * 1024
+    ):
+        """
+        Args:
+            db_path: Путь к файлу SQLite
+            ttl_seconds: Время жизни задачи с момента последнего обновления
+            max_bytes: Предельный объем блобов и журналов событий
+        """
+        super().__init__(ttl_seconds)
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._last_evict = 0.0
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # События прогресса пишутся на каждую страницу: в WAL достаточно
+        # синхронизации на контрольных точках
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                filename TEXT,
+                error TEXT,
+                progress TEXT,
+                created_at TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(tasks)")}
+        if 'progress' not in columns:
+            self._conn.execute("ALTER TABLE tasks ADD COLUMN progress TEXT")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS task_blobs (
+                task_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (task_id, name)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS task_events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                data TEXT NOT NULL,
+                size INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(task_events)")}
+        if 'size' not in columns:
+            self._conn.execute("ALTER TABLE task_events ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS batches (
+                batch_id TEXT PRIMARY KEY,
+                task_ids TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tasks_updated ON tasks(updated_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS task_events_task ON task_events(task_id, seq)")
+        self._conn.commit()
+
+        logger.info(f"Хранилище задач: {db_path}")
+
+    def create(
+        self,
+        task_id: str,
+        filename: str,
+        created_at: Optional[datetime] = None,
+        status: str = 'processing'
+    ) -> None:
+        created_at = created_at or datetime.now()
+        with self._lock:
+            # Повторная обработка начинается с чистого журнала
+            self._conn.execute("DELETE FROM task_blobs WHERE task_id = ?", (task_id,))
+            self._conn.execute("DELETE FROM task_events WHERE task_id = ?", (task_id,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tasks (task_id, status, filename, error, progress, created_at, updated_at) "
+                "VALUES (?, ?, ?, NULL, NULL, ?, ?)",
+                (task_id, status, filename, created_at.isoformat(), time.time())
+            )
+            self._conn.commit()
+        self._maybe_evict()
+        self._evict_by_size()
+
+    def get(self, task_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, filename, error, progress, created_at, updated_at FROM tasks WHERE task_id = ?",
+                (task_id,)
+            ).fetchone()
+
+        if row is None or row[5] < time.time() - self.ttl_seconds:
+            return None
+
+        return {
+            'task_id': task_id,
+            'status': row[0],
+            'filename': row[1],
+            'error': row[2],
+            'progress': json.loads(row[3]) if row[3] else {},
+            'created_at': datetime.fromisoformat(row[4])
+        }
+
+    def set_status(self, task_id: str, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, error = ?, updated_at = ? WHERE task_id = ?",
+                (status, error, time.time(), task_id)
+            )
+            self._conn.commit()
+
+    def set_progress(self, task_id: str, progress: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET progress = ?, updated_at = ? WHERE task_id = ?",
+                (json.dumps(progress, ensure_ascii=False), time.time(), task_id)
+            )
+            self._conn.commit()
+
+    def add_events(self, task_id: str, events: List[Tuple[str, dict]]) -> None:
+        rows = []
+        for kind, data in events:
+            data = json.dumps(data, ensure_ascii=False)
+            rows.append((task_id, kind, data, len(data.encode('utf-8'))))
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO task_events (task_id, kind, data, size) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def get_events(self, task_id: str, after: int = 0, limit: int = 100) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, kind, data FROM task_events WHERE task_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (task_id, after, limit)
+            ).fetchall()
+        return [{'seq': seq, 'kind': kind, 'data': json.loads(data)} for seq, kind, data in rows]
+
+    def put_blobs(self, task_id: str, blobs: Dict[str, bytes]) -> None:
+        with self._lock:
+            # Задача могла быть удалена, пока шла обработка
+            if self._conn.execute("SELECT 1 FROM tasks WHERE task_id = ?", (task_id,)).fetchone() is None:
+                return
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO task_blobs (task_id, name, data, size) VALUES (?, ?, ?, ?)",
+                [(task_id, name, data, len(data)) for name, data in blobs.items()]
+            )
+            self._conn.commit()
+        self._evict_by_size()
+
+    def get_blobs(self, task_id: str, names: List[str]) -> Dict[str, bytes]:
+        placeholders = ','.join('?' * len(names))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT name, data FROM task_blobs WHERE task_id = ? AND name IN ({placeholders})",
+                [task_id, *names]
+            ).fetchall()
+        return {name: data for name, data in rows}
+
+    def delete(self, task_id: str) -> None:
+        with self._lock:
+            self._delete_many([task_id])
+            self._conn.commit()
+
+    def create_batch(self, batch_id: str, task_ids: List[str], created_at: Optional[datetime] = None) -> None:
+        created_at = created_at or datetime.now()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO batches (batch_id, task_ids, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (batch_id, json.dumps(task_ids), created_at.isoformat(), time.time())
+            )
+            self._conn.commit()
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT task_ids, created_at, updated_at FROM batches WHERE batch_id = ?",
+                (batch_id,)
+            ).fetchone()
+
+        if row is None or row[2] < time.time() - self.ttl_seconds:
+            return None
+
+        return {
+            'batch_id': batch_id,
+            'task_ids': json.loads(row[0]),
+            'created_at': datetime.fromisoformat(row[1])
+        }
+
+    def _delete_many(self, task_ids: List[str]) -> None:
+        """Удаляет задачи (вызывается под блокировкой)"""
+        params = [(task_id,) for task_id in task_ids]
+        self._conn.executemany("DELETE FROM task_blobs WHERE task_id = ?", params)
+        self._conn.executemany("DELETE FROM task_events WHERE task_id = ?", params)
+        self._conn.executemany("DELETE FROM tasks WHERE task_id = ?", params)
+
+    def evict(self) -> int:
+        """Удаляет задачи старше TTL"""
+        with self._lock:
+            expired = [
+                row[0] for row in self._conn.execute(
+                    "SELECT task_id FROM tasks WHERE updated_at < ?",
+                    (time.time() - self.ttl_seconds,)
+                )
+            ]
+            self._delete_many(expired)
+            self._conn.execute(
+                "DELETE FROM batches WHERE updated_at < ?",
+                (time.time() - self.ttl_seconds,)
+            )
+            self._conn.commit()
+            self.evictions += len(expired)
+
+        if expired:
+            logger.info(f"Хранилище задач: удалено {len(expired)} просроченных задач")
+        return len(expired)
+
+    def _maybe_evict(self) -> None:
+        """Удаляет просроченные задачи не чаще EVICT_INTERVAL"""
+        now = time.time()
+        if now - self._last_evict >= self.EVICT_INTERVAL:
+            self._last_evict = now
+            self.evict()
+
+    def _total_bytes(self) -> int:
+        """Объем блобов и журналов событий (вызывается под блокировкой)"""
+        return self._conn.execute(
+            "SELECT (SELECT COALESCE(SUM(size), 0) FROM task_blobs) + "
+            "(SELECT COALESCE(SUM(size), 0) FROM task_events)"
+        ).fetchone()[0]
+
+    def _evict_by_size(self) -> None:
+        """Вытесняет самые старые завершенные задачи до 90% лимита"""
+        with self._lock:
+            total = self._total_bytes()
+            if total <= self.max_bytes:
+                return
+
+            # Блобы и события задачи; выполняемые задачи не вытесняются
+            target = int(self.max_bytes * 0.9)
+            rows = self._conn.execute(
+                "SELECT t.task_id, "
+                "(SELECT COALESCE(SUM(size), 0) FROM task_blobs b WHERE b.task_id = t.task_id) + "
+                "(SELECT COALESCE(SUM(size), 0) FROM task_events e WHERE e.task_id = t.task_id) "
+                "FROM tasks t WHERE t.status NOT IN ('pending', 'processing') ORDER BY t.updated_at"
+            ).fetchall()
+            evicted = []
+            for task_id, size in rows:
+                if total <= target:
+                    break
+                evicted.append(task_id)
+                total -= size
+
+            self._delete_many(evicted)
+            self._conn.commit()
+            self.evictions += len(evicted)
+
+        logger.info(f"Хранилище задач: вытеснено {len(evicted)} задач по объему")
+
+    def stats(self) -> dict:
+        with self._lock:
+            tasks = self._conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+            blobs = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM task_blobs").fetchone()[0]
+            events = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM task_events").fetchone()[0]
+        return {
+            **super().stats(),
+            'tasks': tasks,
+            'blob_bytes': blobs,
+            'event_bytes': events,
+            'max_bytes': self.max_bytes,
+            'evictions': self.evictions
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisTaskStore(TaskStore):
+    """
+    Хранилище задач в Redis-совместимом сервере.
+
+    Метаданные задачи - хэш: статус и прогресс обновляются одной командой
+    HSET, без чтения и перезаписи всей записи. Блобы - GET/SET EX, журнал
+    событий - RPUSH/LRANGE; подходит любой клиент с такими методами.
+    """
+
+    def __init__(self, client, ttl_seconds: float = 24 * 3600, prefix: str = "ocr:task:"):
+        """
+        Args:
+            client: Клиент Redis (redis.Redis или совместимая замена)
+            ttl_seconds: Время жизни задачи с момента последнего обновления
+            prefix: Префикс ключей
+        """
+        super().__init__(ttl_seconds)
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, ttl_seconds: float = 24 * 3600) -> "RedisTaskStore":
+        """Подключается к серверу по URL (требуется пакет redis)"""
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("Для TASK_STORE=redis установите пакет: pip install redis")
+
+        logger.info(f"Хранилище задач: {url}")
+        return cls(redis.Redis.from_url(url), ttl_seconds)
+
+    @property
+    def _ttl(self) -> int:
+        return max(1, int(self.ttl_seconds))
+
+    def _meta_key(self, task_id: str) -> str:
+        return f"{self.prefix}{task_id}:meta"
+
+    def _blob_key(self, task_id: str, name: str) -> str:
+        return f"{self.prefix}{task_id}:{name}"
+
+    def _events_key(self, task_id: str) -> str:
+        return f"{self.prefix}{task_id}:events"
+
+    def _batch_key(self, batch_id: str) -> str:
+        return f"{self.prefix}batch:{batch_id}"
+
+    def _update_meta(self, task_id: str, fields: Dict[str, str]) -> None:
+        """Обновляет поля метаданных существующей задачи"""
+        key = self._meta_key(task_id)
+        if not self.client.exists(key):
+            return
+        self.client.hset(key, mapping=fields)
+        self.client.expire(key, self._ttl)
+
+    def _events_base(self, task_id: str) -> int:
+        """Номер последнего события предыдущих обработок задачи"""
+        base = self.client.hget(self._meta_key(task_id), 'events_base')
+        return int(base) if base is not None else 0
+
+    def create(
+        self,
+        task_id: str,
+        filename: str,
+        created_at: Optional[datetime] = None,
+        status: str = 'processing'
+    ) -> None:
+        created_at = created_at or datetime.now()
+        key = self._meta_key(task_id)
+        events_key = self._events_key(task_id)
+        
+        # Номера событий продолжаются: SSE-клиент с Last-Event-ID
+        # прошлой обработки получит события новой
+        events_base = self._events_base(task_id) + self.client.llen(events_key)
+        self.client.delete(
+            key,
+            events_key,
+            *[self._blob_key(task_id, name) for name in (*RESULT_BLOBS, *OPTIONAL_BLOBS)]
+        )
+        self.client.hset(key, mapping={
+            'status': status,
+            'filename': filename,
+            'error': '',
+            'progress': '{}',
+            'created_at': created_at.isoformat(),
+            'events_base': events_base
+        })
+        self.client.expire(key, self._ttl)
+
+    def get(self, task_id: str) -> Optional[dict]:
+        meta = {
+            _decode(name): _decode(value)
+            for name, value in self.client.hgetall(self._meta_key(task_id)).items()
+        }
+        if 'created_at' not in meta:
+            return None
+
+        return {
+            'task_id': task_id,
+            'status': meta['status'],
+            'filename': meta.get('filename'),
+            'error': meta.get('error') or None,
+            'progress': json.loads(meta.get('progress') or '{}'),
+            'created_at': datetime.fromisoformat(meta['created_at'])
+        }
+
+    def set_status(self, task_id: str, status: str, error: Optional[str] = None) -> None:
+        self._update_meta(task_id, {'status': status, 'error': error or ''})
+
+    def set_progress(self, task_id: str, progress: dict) -> None:
+        self._update_meta(task_id, {'progress': json.dumps(progress, ensure_ascii=False)})
+
+    def add_events(self, task_id: str, events: List[Tuple[str, dict]]) -> None:
+        key = self._events_key(task_id)
+        self.client.rpush(key, *[
+            json.dumps({'kind': kind, 'data': data}, ensure_ascii=False)
+            for kind, data in events
+        ])
+        self.client.expire(key, self._ttl)
+
+    def get_events(self, task_id: str, after: int = 0, limit: int = 100) -> List[dict]:
+        # Номер события - позиция в списке, начиная с 1, после событий
+        # предыдущих обработок задачи
+        base = self._events_base(task_id)
+        start = max(after - base, 0)
+        items = self.client.lrange(self._events_key(task_id), start, start + limit - 1)
+        events = []
+        for seq, item in enumerate(items, base + start + 1):
+            event = json.loads(item)
+            events.append({'seq': seq, 'kind': event['kind'], 'data': event['data']})
+        return events
+
+    def put_blobs(self, task_id: str, blobs: Dict[str, bytes]) -> None:
+        for name, data in blobs.items():
+            self.client.set(self._blob_key(task_id, name), data, ex=self._ttl)
+
+    def get_blobs(self, task_id: str, names: List[str]) -> Dict[str, bytes]:
+        blobs = {}
+        for name in names:
+            data = self.client.get(self._blob_key(task_id, name))
+            if data is not None:
+                blobs[name] = data
+        return blobs
+
+    def delete(self, task_id: str) -> None:
+        self.client.delete(
+            self._meta_key(task_id),
+            self._events_key(task_id),
+            *[self._blob_key(task_id, name) for name in (*RESULT_BLOBS, *OPTIONAL_BLOBS)]
+        )
+
+    def create_batch(self, batch_id: str, task_ids: List[str], created_at: Optional[datetime] = None) -> None:
+        created_at = created_at or datetime.now()
+        self.client.set(
+            self._batch_key(batch_id),
+            json.dumps({'task_ids': task_ids, 'created_at': created_at.isoformat()}),
+            ex=self._ttl
+        )
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        raw = self.client.get(self._batch_key(batch_id))
+        if raw is None:
+            return None
+
+        batch = json.loads(raw)
+        return {
+            'batch_id': batch_id,
+            'task_ids': batch['task_ids'],
+            'created_at': datetime.fromisoformat(batch['created_at'])
+        }
+
+    def stats(self) -> dict:
+        return {**super().stats(), 'prefix': self.prefix}
+
+    def close(self) -> None:
+        close = getattr(self.client, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,205 @@
+"""
+Текстовый слой PDF: быстрый путь для программно сформированных документов.
+
+Счета и акты из учетных систем приходят как PDF со встроенным текстом;
+растеризовать и распознавать такие страницы незачем. Классификатор
+читает текстовый слой каждой страницы через PyMuPDF и признает его
+пригодным, если текста достаточно, он не состоит из мусора битых
+шрифтов (U+FFFD, Private Use Area) и страница не является сканом с
+невидимым слоем чужого OCR (одно изображение почти на всю страницу).
+Остальные страницы считаются сканами и уходят OCR движкам.
+"""
+import logging
+import os
+import time
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Имя "провайдера" с текстом слоя в результатах сравнения
+TEXT_LAYER_PROVIDER = "PDF text layer"
+
+
+@dataclass
+class TextLayer:
+    """Текстовый слой документа по страницам"""
+    pages: List[Optional[str]]  # Текст страницы или None, если страница - скан
+    extraction_time: float
+
+    @property
+    def digital(self) -> List[int]:
+        """Номера страниц (с 0) с пригодным текстовым слоем"""
+        return [i for i, text in enumerate(self.pages) if text is not None]
+
+    @property
+    def scanned(self) -> List[int]:
+        """Номера страниц (с 0), которые нужно распознавать"""
+        return [i for i, text in enumerate(self.pages) if text is None]
+
+    @property
+    def complete(self) -> bool:
+        """Текстовый слой есть у всех страниц"""
+        return bool(self.pages) and all(text is not None for text in self.pages)
+
+    @property
+    def text(self) -> str:
+        """Текст страниц со слоем (склейка как у провайдеров)"""
+        return self.join(self.pages)
+
+    @staticmethod
+    def join(pages: List[Optional[str]]) -> str:
+        """Склеивает тексты страниц (None и пустые пропускаются)"""
+        return '\n\n'.join(text.strip() for text in pages if text and text.strip())
+
+
+class TextLayerClassifier:
+    """
+    Определяет страницы PDF с пригодным текстовым слоем и извлекает текст.
+
+    Обращения к PyMuPDF блокирующие; вызывающий код выполняет extract()
+    вне event loop.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        skip_ocr: bool = True,
+        min_chars: int = 20,
+        max_garbage: float = 0.05,
+        max_image_coverage: float = 0.9
+    ):
+        """
+        Args:
+            enabled: Проверять текстовый слой PDF
+            skip_ocr: Не распознавать страницы с текстовым слоем
+                (False - распознавать все, слой только для сравнения)
+            min_chars: Минимум непробельных символов на странице
+            max_garbage: Допустимая доля нечитаемых символов
+            max_image_coverage: Доля площади страницы под одним изображением,
+                начиная с которой страница считается сканом
+        """
+        self.enabled = enabled
+        self.skip_ocr = skip_ocr
+        self.min_chars = min_chars
+        self.max_garbage = max_garbage
+        self.max_image_coverage = max_image_coverage
+
+        self.documents = 0
+        self.digital_pages = 0
+        self.scanned_pages = 0
+
+    @classmethod
+    def from_env(cls) -> "TextLayerClassifier":
+        """Создает классификатор по переменным окружения"""
+        return cls(
+            enabled=os.getenv("TEXT_LAYER_ENABLED", "true").lower() == "true",
+            skip_ocr=os.getenv("TEXT_LAYER_SKIP_OCR", "true").lower() == "true",
+            min_chars=int(os.getenv("TEXT_LAYER_MIN_CHARS", "20")),
+            max_garbage=float(os.getenv("TEXT_LAYER_MAX_GARBAGE", "0.05")),
+            max_image_coverage=float(os.getenv("TEXT_LAYER_MAX_IMAGE_COVERAGE", "0.9"))
+        )
+
+    def extract(self, file_path: str) -> Optional[TextLayer]:
+        """
+        Извлекает текстовый слой PDF постранично.
+
+        Args:
+            file_path: Путь к документу
+
+        Returns:
+            Optional[TextLayer]: Слой или None, если документ не PDF, проверка
+            отключена, PyMuPDF не установлен или ни у одной страницы нет
+            пригодного слоя
+        """
+        if not self.enabled or Path(file_path).suffix.lower() != '.pdf':
+            return None
+
+        try:
+            import pymupdf
+        except ImportError:
+            try:
+                import fitz as pymupdf
+            except ImportError:
+                logger.warning("PyMuPDF не установлен, текстовый слой PDF не проверяется")
+                return None
+
+        start_time = time.time()
+        try:
+            with pymupdf.open(file_path) as document:
+                pages = [self._page_text(page) for page in document]
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать текстовый слой {file_path}: {e}")
+            return None
+
+        layer = TextLayer(pages, time.time() - start_time)
+        digital = len(layer.digital)
+
+        self.documents += 1
+        self.digital_pages += digital
+        self.scanned_pages += len(pages) - digital
+
+        logger.info(
+            f"Текстовый слой {file_path}: {digital}/{len(pages)} страниц "
+            f"({layer.extraction_time:.3f}с)"
+        )
+        return layer if digital else None
+
+    def _page_text(self, page) -> Optional[str]:
+        """Текст страницы или None, если слой непригоден"""
+        text = page.get_text("text", sort=True)
+        if not self.usable(text):
+            return None
+        if self._image_coverage(page) >= self.max_image_coverage:
+            # Скан с невидимым слоем чужого OCR - не эталон
+            return None
+        return text
+
+    def usable(self, text: str) -> bool:
+        """
+        Проверяет, что текст слоя похож на читаемый текст.
+
+        Args:
+            text: Текст страницы
+
+        Returns:
+            bool: Символов не меньше min_chars, доля нечитаемых - не больше
+            max_garbage, буквы и цифры составляют хотя бы половину
+        """
+        chars = [char for char in text if not char.isspace()]
+        if len(chars) < self.min_chars:
+            return False
+
+        garbage = sum(
+            char == '\ufffd' or unicodedata.category(char) in ('Co', 'Cc', 'Cn')
+            for char in chars
+        )
+        if garbage > self.max_garbage * len(chars):
+            return False
+
+        return sum(char.isalnum() for char in chars) * 2 >= len(chars)
+
+    @staticmethod
+    def _image_coverage(page) -> float:
+        """Доля площади страницы под самым большим изображением"""
+        area = abs(page.rect)
+        if not area:
+            return 0.0
+
+        coverage = 0.0
+        for info in page.get_image_info():
+            bbox = page.rect & info['bbox']
+            coverage = max(coverage, abs(bbox) / area)
+        return coverage
+
+    def stats(self) -> dict:
+        """Сведения о быстром пути для /info"""
+        return {
+            'enabled': self.enabled,
+            'skip_ocr': self.skip_ocr,
+            'documents': self.documents,
+            'digital_pages': self.digital_pages,
+            'scanned_pages': self.scanned_pages
+        }
@@ -0,0 +1,232 @@
+"""
+Токенизация текстов OCR для пословного режима сравнения.
+
+Токены - слова (кириллица, латиница и другие алфавиты; дефис и апостроф
+внутри слова не разрывают его), числа вместе с разделителями ("1234,56",
+"20.10.2025", "12:30"), отдельные иероглифы/кана/хангыль (в CJK нет
+пробелов между словами, поэтому единица сравнения - символ) и отдельные
+знаки препинания. Пробелы токенами не являются: пословное сравнение
+нечувствительно к разнице в пробелах и переводах строк.
+
+Токены интернируются в общий для документа словарь и хранятся как
+массивы NumPy int32: выравнивание сравнивает целые числа, а общий
+префикс/суффикс отсекается векторно.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.services.diff_engines import Opcode, get_opcodes, opcodes_from_blocks
+
+# Иероглифы, кана, хангыль и CJK-пунктуация - каждый символ отдельный токен
+_CJK = (
+    '\u2e80-\u2fdf\u3000-\u303f\u3040-\u30ff\u3100-\u312f\u3190-\u31ff'
+    '\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef'
+    '\U00020000-\U0003134f'
+)
+_LETTER = rf'[^\W\d_{_CJK}]'
+
+TOKEN_RE = re.compile(
+    rf'[{_CJK}]'
+    rf'|\d+(?:[.,:/\-]\d+)*'
+    rf'|{_LETTER}+(?:[\-\'’]{_LETTER}+)*'
+    rf'|[^\s]'
+)
+
+# Токены, перед которыми не ставится пробел при сборке текста
+_NO_SPACE_BEFORE = set('.,;:!?)]}»%')
+_NO_SPACE_AFTER = set('([{«')
+_CJK_RE = re.compile(rf'[{_CJK}]')
+
+
+@dataclass
+class TokenizedText:
+    """Текст, разбитый на токены"""
+    text: str
+    ids: np.ndarray     # int32 идентификаторы токенов в словаре
+    starts: np.ndarray  # int32 позиции начала токенов в тексте
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def boundary(self, k: int) -> int:
+        """
+        Позиция в тексте, соответствующая границе перед токеном k.
+        Пробелы после токена относятся к нему, начало текста - к первому.
+        """
+        if k >= len(self.ids):
+            return len(self.text)
+        if k <= 0:
+            return 0
+        return int(self.starts[k])
+
+
+class Vocabulary:
+    """
+    Словарь токенов документа: строка токена <-> целый идентификатор.
+
+    Один словарь используется для всех текстов документа, поэтому
+    одинаковые токены разных провайдеров получают один идентификатор.
+    """
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.tokens: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def tokenize(self, text: str) -> TokenizedText:
+        """
+        Разбивает текст на токены и интернирует их.
+
+        Args:
+            text: Текст
+
+        Returns:
+            TokenizedText: Идентификаторы и позиции токенов
+        """
+        ids = self.ids
+        tokens = self.tokens
+        codes = []
+        starts = []
+
+        for match in TOKEN_RE.finditer(text):
+            token = match.group()
+            code = ids.get(token)
+            if code is None:
+                code = ids[token] = len(tokens)
+                tokens.append(token)
+            codes.append(code)
+            starts.append(match.start())
+
+        return TokenizedText(
+            text,
+            np.array(codes, dtype=np.int32),
+            np.array(starts, dtype=np.int32)
+        )
+
+    def detokenize(self, ids: Sequence[int]) -> TokenizedText:
+        """
+        Собирает текст из токенов: через пробел, кроме соседних CJK
+        символов и знаков, которые пишутся слитно.
+
+        Args:
+            ids: Идентификаторы токенов
+
+        Returns:
+            TokenizedText: Текст с позициями токенов
+        """
+        parts = []
+        starts = []
+        position = 0
+        previous: Optional[str] = None
+
+        for code in ids:
+            token = self.tokens[code]
+            if previous is not None and not (
+                token in _NO_SPACE_BEFORE
+                or previous in _NO_SPACE_AFTER
+                or (_CJK_RE.match(token) and _CJK_RE.match(previous))
+            ):
+                parts.append(' ')
+                position += 1
+            starts.append(position)
+            parts.append(token)
+            position += len(token)
+            previous = token
+
+        return TokenizedText(
+            ''.join(parts),
+            np.asarray(ids, dtype=np.int32),
+            np.array(starts, dtype=np.int32)
+        )
+
+
+def _common_prefix(a: np.ndarray, b: np.ndarray) -> int:
+    """Длина общего префикса двух массивов (векторно)"""
+    size = min(len(a), len(b))
+    mismatch = np.flatnonzero(a[:size] != b[:size])
+    return int(mismatch[0]) if len(mismatch) else size
+
+
+def token_opcodes(a: np.ndarray, b: np.ndarray, engine: Optional[str] = None) -> List[Opcode]:
+    """
+    Выравнивает две последовательности идентификаторов токенов.
+
+    Общие префикс и суффикс отсекаются сравнением массивов NumPy,
+    середина выравнивается движком из diff_engines (anchored для
+    токенов - patience diff по уникальным токенам).
+
+    Args:
+        a: Токены референса
+        b: Токены сравниваемого текста
+        engine: Движок выравнивания
+
+    Returns:
+        List[Opcode]: Опкоды в формате difflib по номерам токенов
+    """
+    n, m = len(a), len(b)
+    prefix = _common_prefix(a, b)
+    suffix = _common_prefix(a[prefix:][::-1], b[prefix:][::-1])
+
+    middle = get_opcodes(a[prefix:n - suffix].tolist(), b[prefix:m - suffix].tolist(), engine)
+
+    blocks = [(0, 0, prefix)]
+    blocks.extend(
+        (i1 + prefix, j1 + prefix, i2 - i1)
+        for tag, i1, i2, j1, _ in middle
+        if tag == 'equal'
+    )
+    blocks.append((n - suffix, m - suffix, suffix))
+    return opcodes_from_blocks(blocks, n, m)
+
+
+def char_opcodes(
+    opcodes: List[Opcode],
+    reference: TokenizedText,
+    comparison: TokenizedText
+) -> List[Opcode]:
+    """
+    Переводит опкоды по токенам в опкоды по символам исходных текстов.
+
+    Пробелы после токена относятся к нему (см. TokenizedText.boundary),
+    поэтому символьные спаны 'equal' совпадают по токенам, но могут
+    различаться пробелами и переводами строк: пословный режим пробелы
+    не сравнивает (у консенсуса они и не настоящие - токены через пробел),
+    и такие спаны остаются совпадением (match), а не minor_diff.
+
+    Args:
+        opcodes: Опкоды по номерам токенов
+        reference: Токены референса
+        comparison: Токены сравниваемого текста
+
+    Returns:
+        List[Opcode]: Опкоды по позициям символов (покрывают тексты целиком)
+    """
+    result = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        result.append((
+            tag,
+            reference.boundary(i1), reference.boundary(i2),
+            comparison.boundary(j1), comparison.boundary(j2)
+        ))
+
+    if not result and (reference.text or comparison.text):
+        # Текст из одних пробелов: токенов нет, различие только в пробелах
+        result.append(('equal', 0, len(reference.text), 0, len(comparison.text)))
+    return result
+
+
+def word_errors(opcodes: List[Opcode]) -> int:
+    """
+    Число пословных ошибок (замены + удаления + вставки) по опкодам.
+    Замена блока из p токенов на q токенов - max(p, q) ошибок.
+    """
+    return sum(
+        max(i2 - i1, j2 - j1)
+        for tag, i1, i2, j1, j2 in opcodes
+        if tag != 'equal'
+    )
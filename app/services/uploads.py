@@ -0,0 +1,248 @@
+"""
+Потоковое сохранение загружаемых документов.
+
+Файл пишется на диск частями через aiofiles; размер проверяется по
+мере чтения (загрузка прерывается, как только превышен лимит), а
+SHA-256 содержимого считается на лету - без повторного чтения файла.
+ZIP-архивы пакетной загрузки распаковываются в потоке с теми же
+ограничениями на каждый документ. Документы сохраняются в каталоги задач
+DocumentStore и сразу регистрируются в его индексе.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import uuid
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import aiofiles
+from fastapi import UploadFile
+
+from app.services.document_store import DocumentStore
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_EXTENSIONS = {'.pdf', '.png', '.jpg', '.jpeg', '.tiff'}
+
+CHUNK_SIZE = 1024 * 1024
+
+_SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)?\s*$', re.IGNORECASE)
+_SIZE_UNITS = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2, 'G': 1024 ** 3, 'GB': 1024 ** 3}
+
+
+class UploadTooLarge(Exception):
+    """Файл превышает допустимый размер"""
+
+
+def parse_size(value: str) -> int:
+    """
+    Разбирает размер из конфигурации: "10485760", "10MB", "512K".
+
+    Args:
+        value: Строка размера
+
+    Returns:
+        int: Размер в байтах
+    """
+    match = _SIZE_RE.match(value)
+    if not match:
+        raise ValueError(f"Некорректный размер: {value}")
+    number, unit = match.groups()
+    return int(float(number) * _SIZE_UNITS[(unit or '').upper()])
+
+
+def max_file_size() -> int:
+    """Лимит размера одного документа (MAX_FILE_SIZE)"""
+    return parse_size(os.getenv("MAX_FILE_SIZE", "10MB"))
+
+
+def max_batch_size() -> int:
+    """Лимит размера всего пакета или ZIP-архива (MAX_BATCH_SIZE)"""
+    return parse_size(os.getenv("MAX_BATCH_SIZE", "100MB"))
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """Имя файла без каталогов (защита от ../ в имени)"""
+    name = Path((filename or '').replace('\\', '/')).name
+    return name or 'document'
+
+
+@dataclass
+class SavedUpload:
+    """Сохраненный документ"""
+    task_id: str
+    filename: str
+    path: Path
+    size: int
+    sha256: str
+
+
+async def save_stream(upload: UploadFile, dest: Path, max_bytes: int) -> SavedUpload:
+    """
+    Сохраняет загружаемый файл частями, проверяя размер и считая SHA-256.
+
+    Args:
+        upload: Загружаемый файл
+        dest: Путь назначения
+        max_bytes: Предельный размер
+
+    Returns:
+        SavedUpload: Сведения о файле (task_id и filename не заполнены)
+
+    Raises:
+        UploadTooLarge: Файл больше max_bytes (частичный файл удаляется)
+    """
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(dest, 'wb') as out:
+            while chunk := await upload.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(
+                        f"Файл {upload.filename} больше допустимых {max_bytes} байт"
+                    )
+                digest.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        dest.unlink(missing_ok=True)
+        raise
+
+    return SavedUpload('', upload.filename or '', dest, size, digest.hexdigest())
+
+
+async def save_document(upload: UploadFile, documents: DocumentStore, max_bytes: int) -> SavedUpload:
+    """
+    Сохраняет один документ под новым task_id.
+
+    Args:
+        upload: Загружаемый файл
+        documents: Хранилище документов
+        max_bytes: Предельный размер документа
+
+    Returns:
+        SavedUpload: Сохраненный документ
+    """
+    task_id = str(uuid.uuid4())
+    filename = safe_filename(upload.filename)
+    try:
+        saved = await save_stream(upload, documents.original_path(task_id, filename), max_bytes)
+    except BaseException:
+        await asyncio.to_thread(documents.delete, task_id)
+        raise
+    saved.task_id = task_id
+    saved.filename = filename
+    await documents.aregister(task_id, filename, saved.path, saved.size, saved.sha256)
+
+    logger.info(f"Файл {filename} загружен как {saved.path} ({saved.size} байт)")
+    return saved
+
+
+def _extract_member(
+    archive: zipfile.ZipFile,
+    info: zipfile.ZipInfo,
+    documents: DocumentStore,
+    max_bytes: int
+) -> SavedUpload:
+    """Распаковывает один документ архива частями (размер в заголовке не доверяем)"""
+    task_id = str(uuid.uuid4())
+    filename = safe_filename(info.filename)
+    dest = documents.original_path(task_id, filename)
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with archive.open(info) as src, dest.open('wb') as out:
+            while chunk := src.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Файл {filename} больше допустимых {max_bytes} байт")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        documents.delete(task_id)
+        raise
+
+    documents.register(task_id, filename, dest, size, digest.hexdigest())
+    return SavedUpload(task_id, filename, dest, size, digest.hexdigest())
+
+
+def extract_zip(
+    archive_path: Path,
+    documents: DocumentStore,
+    max_bytes: int,
+    max_total: int,
+    max_files: int
+) -> tuple:
+    """
+    Распаковывает документы из ZIP-архива.
+
+    Args:
+        archive_path: Путь к архиву
+        documents: Хранилище документов
+        max_bytes: Предельный размер одного документа
+        max_total: Предельный суммарный размер распакованных документов
+        max_files: Предельное количество документов
+
+    Returns:
+        tuple: (сохраненные документы, [(имя, причина отказа)])
+    """
+    saved: List[SavedUpload] = []
+    rejected = []
+    total = 0
+
+    with zipfile.ZipFile(archive_path) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+
+            name = safe_filename(info.filename)
+            if Path(name).suffix.lower() not in ALLOWED_EXTENSIONS:
+                rejected.append((info.filename, "Неподдерживаемый формат файла"))
+                continue
+            if len(saved) >= max_files:
+                rejected.append((info.filename, f"Превышено количество файлов в пакете ({max_files})"))
+                continue
+
+            try:
+                document = _extract_member(archive, info, documents, min(max_bytes, max_total - total))
+            except UploadTooLarge as e:
+                rejected.append((info.filename, str(e)))
+                continue
+
+            total += document.size
+            saved.append(document)
+
+    return saved, rejected
+
+
+async def save_archive(
+    upload: UploadFile,
+    documents: DocumentStore,
+    max_bytes: int,
+    max_total: int,
+    max_files: int
+) -> tuple:
+    """
+    Сохраняет ZIP-архив во временный файл и распаковывает документы
+    в отдельном потоке.
+
+    Returns:
+        tuple: (сохраненные документы, [(имя, причина отказа)])
+    """
+    archive_path = documents.root / f".batch_{uuid.uuid4().hex}.zip"
+    await save_stream(upload, archive_path, max_total)
+
+    try:
+        return await asyncio.to_thread(
+            extract_zip, archive_path, documents, max_bytes, max_total, max_files
+        )
+    except zipfile.BadZipFile:
+        return [], [(upload.filename, "Поврежденный ZIP-архив")]
+    finally:
+        archive_path.unlink(missing_ok=True)
@@ -0,0 +1,236 @@
+"""
+Пул долгоживущих worker-процессов для тяжелых OCR моделей.
+
+Каждый процесс один раз создает свой экземпляр провайдера и загружает
+модели в initialize(); далее он только обрабатывает задачи. Процесс API
+при этом не импортирует torch/paddle. Страницы передаются через
+разделяемую память (SharedPage).
+
+Пул - ProcessPoolExecutor: если процесс умирает (OOM, segfault в модели),
+задачи пула завершаются BrokenProcessPool, а пул перезапускается с
+загрузкой моделей заново. Загрузка ограничена WORKER_START_TIMEOUT.
+"""
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.services.shared_pages import SharedPage
+
+logger = logging.getLogger(__name__)
+
+WORKER_START_TIMEOUT = float(os.getenv("WORKER_START_TIMEOUT", "600"))
+
+# Экземпляр провайдера и event loop внутри worker-процесса
+_worker_provider = None
+_worker_loop = None
+
+
+def _init_worker(module_name: str, class_name: str, ready_queue) -> None:
+    """Инициализатор worker-процесса: создает провайдер и загружает модели"""
+    global _worker_provider, _worker_loop
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    _worker_loop = asyncio.new_event_loop()
+
+    try:
+        provider_cls = getattr(importlib.import_module(module_name), class_name)
+        provider = provider_cls()
+        provider.in_worker = True
+
+        _worker_loop.run_until_complete(provider.initialize())
+        provider.is_initialized = True
+    except Exception as e:
+        logger.error(f"{class_name}: Ошибка инициализации worker-процесса: {e}", exc_info=True)
+        ready_queue.put(f"{type(e).__name__}: {e}")
+        return
+
+    _worker_provider = provider
+    ready_queue.put(None)
+    logger.info(f"{provider.provider_name}: worker-процесс готов")
+
+
+def _worker_ping() -> None:
+    """Пустая задача: заставляет пул запустить все процессы сразу"""
+
+
+def _worker_extract(file_path: str) -> str:
+    """Распознает документ целиком в worker-процессе"""
+    if _worker_provider is None:
+        raise RuntimeError("Провайдер в worker-процессе не инициализирован")
+
+    return _worker_loop.run_until_complete(_worker_provider.extract(file_path))
+
+
+def _worker_recognize_batch(pages: list) -> list:
+    """Распознает пакет страниц одним вызовом модели в worker-процессе"""
+    if _worker_provider is None:
+        raise RuntimeError("Провайдер в worker-процессе не инициализирован")
+
+    # Провайдер читает пиксели прямо из разделяемой памяти (page_array)
+    try:
+        return _worker_provider.recognize_batch(pages)
+    finally:
+        for page in pages:
+            page.close()
+
+
+def _worker_recognize_page(page: SharedPage) -> str:
+    """Распознает одну страницу в worker-процессе"""
+    if _worker_provider is None:
+        raise RuntimeError("Провайдер в worker-процессе не инициализирован")
+
+    try:
+        texts = _worker_loop.run_until_complete(_worker_provider.recognize_pages([page]))
+    finally:
+        page.close()
+    return texts[0] if texts else ""
+
+
+class ProviderWorkerPool:
+    """
+    Пул worker-процессов одного провайдера.
+    Все процессы стартуют сразу и держат модели загруженными.
+    """
+
+    def __init__(self, provider, size: int, start_timeout: float = WORKER_START_TIMEOUT):
+        """
+        Args:
+            provider: Провайдер в процессе API (используется только его класс)
+            size: Количество worker-процессов
+            start_timeout: Предельное время загрузки моделей (секунды)
+        """
+        self.provider_name = provider.provider_name
+        self.size = max(1, size)
+        self.start_timeout = start_timeout
+        self._provider_cls = type(provider)
+        self._context = multiprocessing.get_context("spawn")
+        self._pool = None
+        self._start_lock = None
+
+    async def start(self) -> None:
+        """Запускает процессы и ждет загрузки моделей во всех"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+
+        async with self._start_lock:
+            if self._pool is None:
+                await self._spawn()
+
+    async def _spawn(self) -> None:
+        """Создает пул и дожидается готовности каждого процесса"""
+        ready_queue = self._context.Queue()
+        pool = ProcessPoolExecutor(
+            max_workers=self.size,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self._provider_cls.__module__, self._provider_cls.__qualname__, ready_queue)
+        )
+        # Процессы создаются по мере поступления задач
+        pings = [pool.submit(_worker_ping) for _ in range(self.size)]
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.start_timeout
+        try:
+            for _ in range(self.size):
+                while True:
+                    try:
+                        error = await asyncio.to_thread(ready_queue.get, True, 1.0)
+                        break
+                    except queue.Empty:
+                        pass
+                    if any(ping.done() and ping.exception() is not None for ping in pings):
+                        raise RuntimeError("worker-процесс завершился при загрузке моделей")
+                    if loop.time() > deadline:
+                        raise RuntimeError(f"модели не загрузились за {self.start_timeout:.0f} с")
+                if error is not None:
+                    raise RuntimeError(error)
+        except Exception as e:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise RuntimeError(f"{self.provider_name}: {e}") from e
+
+        self._pool = pool
+        logger.info(f"{self.provider_name}: запущено {self.size} worker-процессов")
+
+    async def _restart(self, broken: ProcessPoolExecutor) -> None:
+        """Перезапускает сломанный пул (один раз на все ожидавшие его задачи)"""
+        async with self._start_lock:
+            if self._pool is not broken:
+                return
+            logger.error(f"{self.provider_name}: worker-процесс завершился аварийно, перезапуск пула")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            await self._spawn()
+
+    async def run(self, file_path: str) -> str:
+        """
+        Отправляет документ целиком свободному worker-процессу
+        (для провайдеров, работающих с исходным файлом).
+
+        Args:
+            file_path: Путь к файлу
+
+        Returns:
+            str: Распознанный текст
+        """
+        return await self._submit(_worker_extract, file_path)
+
+    async def recognize_page(self, page: SharedPage) -> str:
+        """
+        Отправляет одну страницу свободному worker-процессу.
+        Страницы одного документа расходятся по всем процессам пула.
+
+        Args:
+            page: Страница в разделяемой памяти
+
+        Returns:
+            str: Текст страницы
+        """
+        return await self._submit(_worker_recognize_page, page)
+
+    async def recognize_batch(self, pages: list) -> list:
+        """
+        Отправляет пакет страниц (возможно, разных документов) одному
+        worker-процессу для пакетного инференса.
+
+        Args:
+            pages: Страницы в разделяемой памяти
+
+        Returns:
+            list: Текст каждой страницы
+        """
+        return await self._submit(_worker_recognize_batch, pages)
+
+    async def _submit(self, func, *args):
+        """
+        Выполняет функцию в пуле, не блокируя event loop. Если процесс
+        умер, задача завершается ошибкой, а пул перезапускается.
+        """
+        pool = self._pool
+        if pool is None:
+            raise RuntimeError(f"{self.provider_name}: пул worker-процессов не запущен")
+
+        try:
+            return await asyncio.wrap_future(pool.submit(func, *args))
+        except BrokenProcessPool as e:
+            await self._restart(pool)
+            raise RuntimeError(f"{self.provider_name}: worker-процесс завершился аварийно") from e
+
+    def shutdown(self) -> None:
+        """Останавливает worker-процессы, не дожидаясь текущих задач"""
+        if self._pool is not None:
+            # У ProcessPoolExecutor нет terminate: процессы останавливаются
+            # напрямую, иначе shutdown ждал бы распознавания до конца
+            processes = list((self._pool._processes or {}).values())
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.terminate()
+            self._pool = None
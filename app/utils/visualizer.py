@@ -1,8 +1,9 @@
 """
 Утилита для генерации HTML визуализации с подсветкой расхождений
 """
-from typing import List
-from app.models.schemas import DiffSegment, ComparisonResult
+from typing import Iterator, List
+from app.models.schemas import DiffSegment, ComparisonResult, RawOCRResult
+from app.services.alignment import TextAlignmentService
 import html
 import re
 
@@ -12,6 +13,9 @@ class HTMLVisualizer:
     Генератор HTML разметки для визуализации расхождений между OCR моделями.
     """
     
+    # Версия разметки: меняется вместе с выводом, сбрасывает кэш HTML на диске
+    RENDERER_VERSION = 2
+    
     # CSS стили для подсветки
     CSS_STYLES = """
     <style>
@@ -84,6 +88,11 @@ class HTMLVisualizer:
         .table-block th, .table-block td { border: 1px solid #ddd; padding: 6px 8px; font-family: system-ui, sans-serif; }
         .table-block thead th { background: #f0f0f0; font-weight: 600; }
         .table-caption { font-size: 13px; color: #333; margin: 6px 0; font-weight: 600; }
+        /* Построчное сравнение */
+        .line-table { border-collapse: collapse; width: 100%; background: #fff; font-size: 13px; }
+        .line-table th, .line-table td { border: 1px solid #ddd; padding: 4px 6px; vertical-align: top; white-space: pre-wrap; }
+        .line-table thead th { background: #f0f0f0; }
+        .line-table td.line-number { color: #999; white-space: nowrap; }
     </style>
     """
     
@@ -103,7 +112,26 @@ class HTMLVisualizer:
         Returns:
             str: HTML разметка
         """
-        html_parts = [
+        return "".join(cls.iter_html(comparison_results, filename))
+    
+    @classmethod
+    def iter_html(
+        cls,
+        comparison_results: List[ComparisonResult],
+        filename: str
+    ) -> Iterator[str]:
+        """
+        Генерирует HTML страницу по частям: заголовок, затем сегменты
+        провайдеров по одному. В памяти одновременно только одна часть.
+        
+        Args:
+            comparison_results: Результаты сравнения от всех провайдеров
+            filename: Имя обработанного файла
+            
+        Yields:
+            str: Очередная часть HTML разметки
+        """
+        yield "\n".join([
             "<!DOCTYPE html>",
             "<html lang='ru'>",
             "<head>",
@@ -117,19 +145,17 @@ class HTMLVisualizer:
             f"<h1>Сравнение OCR моделей</h1>",
             f"<p><strong>Документ:</strong> {html.escape(filename)}</p>",
             cls._generate_legend(),
-        ]
+        ])
         
-        # Добавляем секции для каждого провайдера
+        # Секции провайдеров, сегмент за сегментом
         for result in comparison_results:
-            html_parts.append(cls._generate_provider_section(result))
+            for part in cls._iter_provider_section(result):
+                yield "\n" + part
         
-        html_parts.extend([
-            "</div>",
-            "</body>",
-            "</html>"
-        ])
+        for part in cls._iter_line_section(comparison_results):
+            yield "\n" + part
         
-        return "\n".join(html_parts)
+        yield "\n</div>\n</body>\n</html>"
     
     @classmethod
     def _generate_legend(cls) -> str:
@@ -153,32 +179,30 @@ class HTMLVisualizer:
         """
     
     @classmethod
-    def _generate_provider_section(cls, result: ComparisonResult) -> str:
+    def _iter_provider_section(cls, result: ComparisonResult) -> Iterator[str]:
         """
-        Генерирует секцию для одного провайдера.
+        Генерирует секцию для одного провайдера по частям.
         
         Args:
             result: Результат сравнения провайдера
             
-        Returns:
-            str: HTML разметка секции
+        Yields:
+            str: Заголовок, сегменты по одному, статистика
         """
         # Заголовок секции
-        html_parts = [
-            "<div class='provider-section'>",
-            f"<div class='provider-name'>{html.escape(result.provider_name)}</div>",
-        ]
+        yield "<div class='provider-section'>"
+        yield f"<div class='provider-name'>{html.escape(result.provider_name)}</div>"
         
         # Текст с подсветкой
-        html_parts.append("<div class='text-content'>")
+        yield "<div class='text-content'>"
         
-        for segment in result.segments:
+        for segment in result.iter_segments():
             cls_name = segment.segment_type.replace('_', '-')
 
             # Разбиваем текст на обычные части и HTML-таблицы, чтобы таблицы отрендерить, а текст экранировать
-            html_parts.append(cls._render_segment_with_tables(segment, cls_name))
+            yield cls._render_segment_with_tables(segment, cls_name)
         
-        html_parts.append("</div>")
+        yield "</div>"
         
         # Статистика
         stats_html = f"""
@@ -189,12 +213,64 @@ class HTMLVisualizer:
             Точность: {result.accuracy_percent:.2f}%
         </div>
         """
-        html_parts.append(stats_html)
-        
-        html_parts.append("</div>")
+        yield stats_html
         
-        return "\n".join(html_parts)
+        yield "</div>"
 
+    @classmethod
+    def _iter_line_section(cls, comparison_results: List[ComparisonResult]) -> Iterator[str]:
+        """
+        Построчное сравнение: группы строк референса, в которых провайдеры
+        расходятся, рядом с соответствующими строками каждого провайдера
+        (TextAlignmentService.merge_multiple_alignments). Строки,
+        вставленные провайдером, идут отдельной группой с пустым референсом.
+        
+        Args:
+            comparison_results: Результаты сравнения от всех провайдеров
+            
+        Yields:
+            str: Заголовок таблицы, строки таблицы по одной
+        """
+        stores = [result.store for result in comparison_results if result.store is not None]
+        # Консенсус пословного режима - одна строка, построчно сравнивать нечего
+        if not stores or '\n' not in stores[0].reference:
+            return
+        
+        results = [
+            RawOCRResult(provider_name=store.provider_name, text=store.comparison, processing_time=0.0)
+            for store in stores
+        ]
+        segments = TextAlignmentService.merge_multiple_alignments(stores[0].reference, results)
+        
+        yield "<div class='provider-section'>"
+        yield "<div class='provider-name'>Построчное сравнение (строки с расхождениями)</div>"
+        yield "<table class='line-table'><thead><tr><th>Строки</th><th>Референс</th>" + "".join(
+            f"<th>{html.escape(store.provider_name)}</th>" for store in stores
+        ) + "</tr></thead><tbody>"
+        
+        for segment in segments:
+            if segment.segment_type == 'match':
+                continue
+            start, end = segment.start_position, segment.end_position
+            if end == start:
+                lines = f"+{start}"  # Вставка провайдера после строки start
+            elif end == start + 1:
+                lines = str(end)
+            else:
+                lines = f"{start + 1}-{end}"
+            cells = "".join(
+                f"<td>{html.escape(segment.providers_data[store.provider_name])}</td>"
+                for store in stores
+            )
+            yield (
+                f"<tr class='{segment.segment_type.replace('_', '-')}'>"
+                f"<td class='line-number'>{lines}</td>"
+                f"<td>{html.escape(segment.text)}</td>{cells}</tr>"
+            )
+        
+        yield "</tbody></table>"
+        yield "</div>"
+    
     @classmethod
     def _sanitize_table_html(cls, table_html: str) -> str:
         """Минимальная санитизация HTML таблицы: удаляем script/iframe и on* обработчики.
@@ -0,0 +1,179 @@
+"""
+Worker очереди задач OCR.
+
+Забирает задачи из JobQueue и выполняет конвейер OCRComparisonService;
+результаты пишет в хранилище задач, откуда их читает API.
+
+Запуск отдельным процессом:
+    python -m app.worker
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+import uuid
+from typing import Dict, Optional
+
+from app.services.comparison import OCRComparisonService
+from app.services.job_queue import Job, JobQueue
+
+logger = logging.getLogger(__name__)
+
+
+class QueueWorker:
+    """
+    Цикл обработки очереди: не больше max_in_flight задач одновременно,
+    аренда задач продлевается heartbeat'ом, ошибки уходят на повтор.
+    """
+
+    def __init__(
+        self,
+        service: OCRComparisonService,
+        queue: JobQueue,
+        max_in_flight: int = 2,
+        poll_interval: float = 1.0,
+        worker_id: Optional[str] = None
+    ):
+        """
+        Args:
+            service: Сервис сравнения (провайдеры должны быть инициализированы)
+            queue: Очередь задач
+            max_in_flight: Максимум одновременно обрабатываемых документов
+            poll_interval: Пауза между опросами пустой очереди (секунды)
+            worker_id: Идентификатор worker'а (по умолчанию host:pid:uuid)
+        """
+        self.service = service
+        self.queue = queue
+        self.max_in_flight = max(1, max_in_flight)
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stopping: Optional[asyncio.Event] = None
+
+    @classmethod
+    def from_env(cls, service: OCRComparisonService, queue: JobQueue) -> "QueueWorker":
+        """Создает worker по переменным окружения"""
+        return cls(
+            service,
+            queue,
+            max_in_flight=int(os.getenv("JOB_MAX_IN_FLIGHT", "2")),
+            poll_interval=float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+        )
+
+    async def run(self) -> None:
+        """Обрабатывает очередь до вызова stop()"""
+        self._stopping = asyncio.Event()
+        running: Dict[asyncio.Task, Job] = {}
+        stop_waiter = asyncio.create_task(self._stopping.wait())
+
+        logger.info(f"Worker {self.worker_id} запущен (до {self.max_in_flight} задач одновременно)")
+
+        try:
+            while not self._stopping.is_set():
+                while len(running) < self.max_in_flight:
+                    job = await asyncio.to_thread(self.queue.claim, self.worker_id)
+                    if job is None:
+                        break
+                    running[asyncio.create_task(self._process(job))] = job
+
+                # Ждем завершения задачи, остановки или следующего опроса
+                done, _ = await asyncio.wait(
+                    [*running, stop_waiter],
+                    timeout=self.poll_interval,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    running.pop(task, None)
+        finally:
+            stop_waiter.cancel()
+            # Незавершенные задачи возвращаются в очередь (см. _process)
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+        logger.info(f"Worker {self.worker_id} остановлен")
+
+    def stop(self) -> None:
+        """Просит цикл завершиться"""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _process(self, job: Job) -> None:
+        """Выполняет одну задачу с heartbeat'ом аренды"""
+        payload = job.payload
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+
+        logger.info(f"Worker {self.worker_id}: задача {job.job_id}, попытка {job.attempts}/{job.max_attempts}")
+
+        try:
+            await self.service.process_document(
+                payload['file_path'],
+                payload['filename'],
+                job.job_id,
+                alignment_engine=payload.get('alignment_engine'),
+                batch_id=payload.get('batch_id'),
+                alignment_mode=payload.get('alignment_mode')
+            )
+            await asyncio.to_thread(self.queue.complete, job)
+
+        except asyncio.CancelledError:
+            self.queue.release(job)
+            self.service.task_store.set_status(job.job_id, 'pending', error="Возвращена в очередь")
+            raise
+
+        except Exception as e:
+            delay = await asyncio.to_thread(self.queue.fail, job, str(e))
+            if delay is not None:
+                logger.warning(f"Задача {job.job_id}: ошибка, повтор через {delay:.0f} с: {e}")
+                self.service.task_store.set_status(
+                    job.job_id,
+                    'pending',
+                    error=f"Повтор через {delay:.0f} с после ошибки: {e}"
+                )
+            else:
+                logger.error(f"Задача {job.job_id}: повтора не будет: {e}")
+
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job: Job) -> None:
+        """Продлевает аренду, пока задача выполняется и аренда не потеряна"""
+        interval = max(1.0, self.queue.visibility_timeout / 3)
+        while True:
+            await asyncio.sleep(interval)
+            if not await asyncio.to_thread(self.queue.heartbeat, job):
+                return
+
+
+async def _run() -> None:
+    from app.bootstrap import create_service
+
+    service = create_service()
+    queue = JobQueue.from_env()
+    worker = QueueWorker.from_env(service, queue)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await service.initialize_providers()
+        await worker.run()
+    finally:
+        service.shutdown()
+        queue.close()
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO"),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(_run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк движков выравнивания (difflib / myers / anchored).
+
+Генерирует текст, похожий на многостраничный инвойс (таблицы из цифр и
+пробелов), вносит в копию OCR-подобные ошибки и сравнивает время и
+качество выравнивания (число совпавших символов: больше - лучше).
+
+Запуск:
+    python benchmarks/bench_alignment.py --pages 30
+    python benchmarks/bench_alignment.py --check   # anchored не хуже myers, консенсус
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.diff_engines import ENGINES, count_matches, get_opcodes  # noqa: E402
+from app.services.msa import MultipleAlignment  # noqa: E402
+
+WORDS = [
+    "Счет", "на", "оплату", "Поставщик", "ИНН", "КПП", "Покупатель", "Итого",
+    "НДС", "Всего", "шт", "кг", "Наименование", "товара", "Количество", "Цена",
+    "Сумма", "Invoice", "Total", "Qty", "Price", "发票", "金额", "合计",
+]
+
+# Типичные для OCR замены похожих символов
+CONFUSIONS = {'0': 'O', 'O': '0', '1': 'l', 'l': '1', '5': 'S', 'З': '3', 'б': '6', ' ': '  '}
+
+
+def make_invoice(pages: int, seed: int = 0) -> str:
+    """Синтетический текст инвойса: шапка + таблица позиций на каждой странице"""
+    rng = random.Random(seed)
+    lines = []
+    for page in range(1, pages + 1):
+        lines.append(f"## Страница {page}")
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(8)))
+        lines.append(f"ИНН {rng.randint(10**9, 10**10 - 1)}  КПП {rng.randint(10**8, 10**9 - 1)}")
+        for row in range(1, 26):
+            qty = rng.randint(1, 500)
+            price = rng.randint(10, 99999) / 100
+            lines.append(
+                f"{row:>3}  {rng.choice(WORDS):<14} {qty:>6} {price:>10.2f} {qty * price:>12.2f}"
+            )
+        lines.append(f"Итого: {rng.randint(1000, 10**7) / 100:.2f}")
+    return "\n".join(lines)
+
+
+def add_ocr_noise(text: str, rate: float, seed: int = 1) -> str:
+    """Замены похожих символов, пропуски и вставки с заданной частотой"""
+    rng = random.Random(seed)
+    out = []
+    for ch in text:
+        r = rng.random()
+        if r < rate * 0.6:
+            out.append(CONFUSIONS.get(ch, ch))
+        elif r < rate * 0.8:
+            continue
+        elif r < rate:
+            out.append(ch + rng.choice(".,' "))
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def make_prose(lines: int, seed: int = 0) -> str:
+    """Текст из коротких повторяющихся слов: якоря-слова здесь редки и ненадежны"""
+    rng = random.Random(seed)
+    words = WORDS[:12] + ["ООО", "О", "0", "№", "руб."]
+    return "\n".join(
+        " ".join(rng.choice(words) for _ in range(rng.randint(3, 10))) for _ in range(lines)
+    )
+
+
+def add_lookalike_noise(text: str, rate: float, seed: int = 1) -> str:
+    """Пропуски, вставки похожих на буквы символов и разрывы слов"""
+    rng = random.Random(seed)
+    out = []
+    for ch in text:
+        r = rng.random()
+        if r < rate / 3:
+            continue
+        elif r < rate * 2 / 3:
+            out.append(rng.choice("оОo0 ,."))
+        elif r < rate:
+            out.append(ch + rng.choice(" ."))
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def bench(reference: str, comparison: str, engines, repeat: int) -> None:
+    print(f"Референс: {len(reference)} символов, сравнение: {len(comparison)} символов")
+    print(f"{'движок':<10} {'время, с':>10} {'совпало':>10} {'опкодов':>9}")
+    for engine in engines:
+        best = float('inf')
+        opcodes = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            opcodes = get_opcodes(reference, comparison, engine)
+            best = min(best, time.perf_counter() - start)
+        print(f"{engine:<10} {best:>10.3f} {count_matches(opcodes):>10} {len(opcodes):>9}")
+
+
+# Окна, которые общий префикс/суффикс режет посреди слова
+CHECK_CASES = [
+    ('123 ООО итого ООО', '123 О О итого  ОО'),
+    ('Итого 1 200 руб. НДС 200 руб.', 'Итого 1 20O руб НДС 2O0 руб.'),
+]
+
+
+def check(seeds: int) -> bool:
+    """
+    Проверка качества anchored: на каждом примере совпадает не меньше
+    символов, чем у точного myers (обрезки слов на краях окон и
+    повторяющиеся слова не должны становиться якорями).
+    """
+    cases = list(CHECK_CASES)
+    for seed in range(seeds):
+        for rate in (0.01, 0.03, 0.1, 0.2):
+            reference = make_invoice(2, seed)
+            cases.append((add_ocr_noise(reference, rate, seed), add_ocr_noise(reference, rate, seed + 1000)))
+
+    failed = 0
+    for reference, comparison in cases:
+        anchored = count_matches(get_opcodes(reference, comparison, 'anchored'))
+        myers = count_matches(get_opcodes(reference, comparison, 'myers'))
+        if anchored < myers:
+            failed += 1
+            print(f"anchored {anchored} < myers {myers}: {reference[:40]!r}")
+
+    print(f"Проверено {len(cases)} пар, anchored хуже myers: {failed}")
+    return failed == 0
+
+
+def _covers(opcodes, n: int, m: int) -> bool:
+    """Опкоды идут подряд и покрывают обе последовательности целиком"""
+    i = j = 0
+    for _, i1, i2, j1, j2 in opcodes:
+        if (i1, j1) != (i, j):
+            return False
+        i, j = i2, j2
+    return (i, j) == (n, m)
+
+
+def check_consensus(seeds: int, copies: int = 3) -> bool:
+    """
+    Проверка консенсуса: из нескольких зашумленных копий восстанавливается
+    исходный текст - с anchored не хуже, чем с myers (допуск 0.5%), а опкоды
+    каждой копии покрывают консенсус и копию целиком. Текст из повторяющихся
+    слов с вставками "о", "0" ловит якоря на обрывках слов.
+    """
+    failed = 0
+    for seed in range(seeds):
+        corpora = (
+            ("инвойс", make_invoice(2, seed), add_ocr_noise, 0.1),
+            ("текст", make_prose(20, seed), add_lookalike_noise, 0.06),
+        )
+        for name, reference, noise, rate in corpora:
+            texts = [noise(reference, rate, seed * copies + k) for k in range(copies)]
+
+            recovered = {}
+            for engine in ('anchored', 'myers'):
+                alignment = MultipleAlignment(texts, engine)
+                consensus = alignment.consensus
+                recovered[engine] = count_matches(get_opcodes(reference, consensus, 'myers')) / len(reference)
+                if not all(
+                    _covers(alignment.opcodes(k), len(consensus), len(text))
+                    for k, text in enumerate(texts)
+                ):
+                    failed += 1
+                    print(f"{name}, seed {seed}, {engine}: опкоды не покрывают тексты")
+
+            if recovered['anchored'] < recovered['myers'] - 0.005:
+                failed += 1
+                print(
+                    f"{name}, seed {seed}: anchored восстановил {recovered['anchored']:.2%}, "
+                    f"myers {recovered['myers']:.2%}"
+                )
+
+    print(f"Проверено {2 * seeds} консенсусов, ошибок: {failed}")
+    return failed == 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--noise", type=float, default=0.03)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--engines", default=",".join(ENGINES))
+    parser.add_argument("--check", action="store_true", help="проверить, что anchored не хуже myers")
+    args = parser.parse_args()
+
+    if args.check:
+        ok = check(seeds=20)
+        ok = check_consensus(seeds=10) and ok
+        sys.exit(0 if ok else 1)
+
+    reference = make_invoice(args.pages)
+    comparison = add_ocr_noise(reference, args.noise)
+    bench(reference, comparison, args.engines.split(","), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
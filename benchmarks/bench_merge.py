@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк построчного объединения выравниваний (merge_multiple_alignments).
+
+Референс - синтетический инвойс (см. bench_alignment.py); тексты
+провайдеров - его копии с OCR-подобными ошибками, пропущенными и
+вставленными строками. Для каждого размера печатается время и время
+на 1000 строк: при линейном масштабировании оно не растет. Прежняя
+реализация (сопоставление строк по номеру с разбиением всего текста
+на каждой строке) для сравнения запускается на небольших размерах.
+
+Запуск:
+    python benchmarks/bench_merge.py --lines 1000,2500,5000,10000
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app.models.schemas import RawOCRResult  # noqa: E402
+from app.services.alignment import TextAlignmentService  # noqa: E402
+from bench_alignment import add_ocr_noise, make_invoice  # noqa: E402
+
+# Строк на страницу в make_invoice
+LINES_PER_PAGE = 29
+
+
+def make_reference(lines: int) -> str:
+    """Референс ровно из lines строк"""
+    pages = lines // LINES_PER_PAGE + 1
+    return "\n".join(make_invoice(pages).split("\n")[:lines])
+
+
+def make_provider(reference: str, noise: float, line_edits: float, seed: int) -> str:
+    """Текст провайдера: шум в символах плюс пропуски и вставки строк"""
+    rng = random.Random(seed)
+    out = []
+    for line in add_ocr_noise(reference, noise, seed).split("\n"):
+        r = rng.random()
+        if r < line_edits / 2:
+            continue
+        out.append(line)
+        if r > 1 - line_edits / 2:
+            out.append("~" * rng.randint(1, 20))
+    return "\n".join(out)
+
+
+def legacy_merge(reference: str, all_results) -> int:
+    """Прежний алгоритм: строки по номеру, split() каждого текста на каждой строке"""
+    segments = 0
+    for line_idx, ref_line in enumerate(reference.split('\n')):
+        versions = {ref_line}
+        for result in all_results:
+            text_lines = result.text.split('\n')
+            versions.add(text_lines[line_idx] if line_idx < len(text_lines) else '')
+        segments += 1
+    return segments
+
+
+def timed(func, *args) -> tuple:
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", default="1000,2500,5000,10000")
+    parser.add_argument("--providers", type=int, default=3)
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--line-edits", type=float, default=0.02)
+    parser.add_argument("--legacy-max", type=int, default=2500,
+                        help="Прежний алгоритм запускается до этого числа строк")
+    args = parser.parse_args()
+
+    print(f"{'строк':>7} {'сегментов':>10} {'время, с':>9} {'с/1000 строк':>13} {'прежний, с':>11}")
+    for lines in (int(value) for value in args.lines.split(",")):
+        reference = make_reference(lines)
+        results = [
+            RawOCRResult(
+                provider_name=f"OCR{k}",
+                text=make_provider(reference, args.noise, args.line_edits, seed=k + 1),
+                processing_time=0.0
+            )
+            for k in range(args.providers)
+        ]
+
+        elapsed, segments = timed(TextAlignmentService.merge_multiple_alignments, reference, results)
+        legacy = "-"
+        if lines <= args.legacy_max:
+            legacy = f"{timed(legacy_merge, reference, results)[0]:.3f}"
+
+        print(
+            f"{lines:>7} {len(segments):>10} {elapsed:>9.3f} "
+            f"{elapsed * 1000 / lines:>13.4f} {legacy:>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
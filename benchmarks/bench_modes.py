@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк режимов сравнения: посимвольного (char) и пословного (word).
+
+Для синтетического инвойса (см. bench_alignment.py) и его копий с
+OCR-подобными ошибками выполняется полное сравнение всех провайдеров
+(множественное выравнивание, консенсус, сегменты). Печатается время
+обоих режимов, ускорение пословного и WER провайдеров.
+
+Запуск:
+    python benchmarks/bench_modes.py --pages 10,50,100 --engine anchored
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app.models.schemas import RawOCRResult  # noqa: E402
+from app.services.alignment import TextAlignmentService  # noqa: E402
+from bench_alignment import add_ocr_noise, make_invoice  # noqa: E402
+
+
+def timed(mode: str, results, engine: str) -> tuple:
+    start = time.perf_counter()
+    comparison = TextAlignmentService.create_comparison_results(results, engine=engine, mode=mode)
+    return time.perf_counter() - start, comparison
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="10,50,100")
+    parser.add_argument("--providers", type=int, default=3)
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--engine", default="anchored")
+    args = parser.parse_args()
+
+    print(f"{'страниц':>7} {'символов':>9} {'char, с':>8} {'word, с':>8} {'ускорение':>10}  WER, %")
+    for pages in (int(value) for value in args.pages.split(",")):
+        reference = make_invoice(pages)
+        results = [
+            RawOCRResult(
+                provider_name=f"OCR{k}",
+                text=add_ocr_noise(reference, args.noise, seed=k + 1),
+                processing_time=0.0
+            )
+            for k in range(args.providers)
+        ]
+
+        char_time, _ = timed('char', results, args.engine)
+        word_time, comparison = timed('word', results, args.engine)
+        wer = ", ".join(f"{result.word_error_rate:.1f}" for result in comparison)
+
+        print(
+            f"{pages:>7} {len(reference):>9} {char_time:>8.3f} {word_time:>8.3f} "
+            f"{char_time / word_time:>9.1f}x  {wer}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 import os
 from pathlib import Path
@@ -21,15 +22,15 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Импорты приложения
-from app.api.routes import router as api_router, set_ocr_service
-from app.services.comparison import OCRComparisonService
-from app.models.paddle_ocr import PaddleOCRProvider
-from app.models.marker_ocr import TesseractOCRProvider  # Изменено: Tesseract вместо Marker
-from app.models.mineru_ocr import EasyOCRProvider  # Изменено: EasyOCR вместо MinerU
+from app.api.routes import router as api_router, set_ocr_service, set_job_queue
+from app.bootstrap import create_service
+from app.services.job_queue import JobQueue
+from app.worker import QueueWorker
 
 
 # Глобальный сервис
 ocr_service = None
+job_queue = None
 
 
 @asynccontextmanager
@@ -38,55 +39,37 @@ async def lifespan(app: FastAPI):
     Управление жизненным циклом приложения.
     Инициализация при старте, очистка при остановке.
     """
-    global ocr_service
+    global ocr_service, job_queue
     
     logger.info("🚀 Запуск OCR Comparison Service...")
     
-    # Создаем директории если не существуют
-    upload_dir = Path(os.getenv("UPLOAD_DIR", "./uploads"))
-    upload_dir.mkdir(exist_ok=True)
+    # Создаем сервис сравнения с OCR провайдерами и очередь задач
+    ocr_service = create_service()
+    job_queue = JobQueue.from_env()
     
-    # Инициализация OCR провайдеров
-    providers = []
+    # Файлы старой плоской раскладки переносим в каталоги задач,
+    # просроченные документы удаляет janitor
+    await asyncio.to_thread(ocr_service.documents.migrate_flat)
+    janitor_task = asyncio.create_task(ocr_service.documents.run_janitor())
     
-    # Проверяем какие провайдеры включены
-    if os.getenv("ENABLE_PADDLE", "true").lower() == "true":
-        try:
-            providers.append(PaddleOCRProvider())
-            logger.info("✓ PaddleOCR включен")
-        except Exception as e:
-            logger.warning(f"✗ PaddleOCR не доступен: {e}")
+    # Встроенный worker: API сам обрабатывает очередь (удобно для одного узла).
+    # Иначе модели в API не загружаются, очередь обрабатывает python -m app.worker
+    worker = None
+    worker_task = None
     
-    if os.getenv("ENABLE_TESSERACT", "true").lower() == "true":
+    if os.getenv("JOB_EMBEDDED_WORKER", "true").lower() == "true":
         try:
-            providers.append(TesseractOCRProvider())
-            logger.info("✓ Tesseract OCR включен")
+            await ocr_service.initialize_providers()
+            logger.info(f"✓ Инициализировано {len(ocr_service.providers)} OCR провайдеров")
         except Exception as e:
-            logger.warning(f"✗ Tesseract OCR не доступен: {e}")
-    
-    if os.getenv("ENABLE_EASYOCR", "true").lower() == "true":
-        try:
-            providers.append(EasyOCRProvider())
-            logger.info("✓ EasyOCR включен")
-        except Exception as e:
-            logger.warning(f"✗ EasyOCR не доступен: {e}")
-    
-    if not providers:
-        logger.error("❌ Ни один OCR провайдер не доступен!")
-        raise RuntimeError("Требуется хотя бы один OCR провайдер")
+            logger.error(f"Ошибка инициализации провайдеров: {e}")
+        
+        worker = QueueWorker.from_env(ocr_service, job_queue)
+        worker_task = asyncio.create_task(worker.run())
     
-    # Создаем сервис сравнения
-    ocr_service = OCRComparisonService(providers)
-    
-    # Инициализируем провайдеры
-    try:
-        await ocr_service.initialize_providers()
-        logger.info(f"✓ Инициализировано {len(providers)} OCR провайдеров")
-    except Exception as e:
-        logger.error(f"Ошибка инициализации провайдеров: {e}")
-    
-    # Устанавливаем глобальный сервис для роутов
+    # Устанавливаем глобальный сервис и очередь для роутов
     set_ocr_service(ocr_service)
+    set_job_queue(job_queue)
     
     logger.info("✓ Сервис готов к работе!")
     
@@ -95,11 +78,14 @@ async def lifespan(app: FastAPI):
     # Очистка при остановке
     logger.info("Остановка сервиса...")
     
-    for provider in providers:
-        try:
-            provider.cleanup()
-        except Exception as e:
-            logger.error(f"Ошибка очистки {provider.provider_name}: {e}")
+    if worker is not None:
+        worker.stop()
+        await worker_task
+    
+    janitor_task.cancel()
+    
+    ocr_service.shutdown()
+    job_queue.close()
     
     logger.info("👋 Сервис остановлен")
 
@@ -155,8 +141,13 @@ async def root():
         "docs": "/docs",
         "endpoints": {
             "upload": "POST /api/upload",
+            "upload_batch": "POST /api/upload/batch",
+            "batch": "POST /api/batch",
+            "batch_status": "GET /api/batch/{batch_id}",
+            "batch_results": "GET /api/batch/{batch_id}/results",
             "process": "POST /api/process/{task_id}",
             "status": "GET /api/status/{task_id}",
+            "events": "GET /api/events/{task_id} (SSE)",
             "results": "GET /api/results/{task_id}",
             "html": "GET /api/compare/{task_id}/html",
             "health": "GET /api/health"
@@ -177,7 +168,10 @@ async def info():
         providers_info.append({
             "name": provider.provider_name,
             "initialized": provider.is_initialized,
-            "supported_formats": provider.get_supported_formats()
+            "execution_policy": provider.execution_policy.value,
+            "workers": provider.max_workers,
+            "supported_formats": provider.get_supported_formats(),
+            "batching": provider.batcher.stats() if provider.batching_enabled else None
         })
     
     return {
@@ -185,7 +179,16 @@ async def info():
         "version": "1.0.0",
         "providers": providers_info,
         "total_providers": len(ocr_service.providers),
-        "upload_dir": os.getenv("UPLOAD_DIR", "./uploads"),
+        "result_cache": ocr_service.result_cache.stats() if ocr_service.result_cache else None,
+        "task_store": ocr_service.task_store.stats(),
+        "job_queue": job_queue.stats() if job_queue else None,
+        "page_scheduler": {
+            name: scheduler.stats()
+            for name, scheduler in ocr_service.schedulers.items()
+        },
+        "documents": ocr_service.documents.stats(),
+        "text_layer": ocr_service.text_layer.stats(),
+        "preprocessing": ocr_service.preprocessor.stats(),
         "max_file_size": os.getenv("MAX_FILE_SIZE", "10MB"),
         "supported_formats": os.getenv("SUPPORTED_FORMATS", "pdf,png,jpg,jpeg,tiff")
     }
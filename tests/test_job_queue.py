@@ -0,0 +1,181 @@
+"""
+Тесты очереди задач (app/services/job_queue.py).
+
+Запуск: python -m pytest tests
+"""
+import sqlite3
+
+import pytest
+
+from app.services import job_queue
+from app.services.job_queue import JobQueue
+
+
+class FakeClock:
+    """Подменяет модуль time в job_queue: время двигается вручную"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(job_queue, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = JobQueue(
+        str(tmp_path / 'jobs.sqlite3'),
+        visibility_timeout=60.0,
+        max_attempts=3,
+        retry_backoff=5.0,
+        max_backoff=300.0,
+        batch_max_in_flight=1
+    )
+    yield queue
+    queue.close()
+
+
+def test_claim_by_priority_then_fifo(queue, clock):
+    """Больший приоритет - раньше, внутри приоритета - по времени постановки"""
+    for job_id, priority in (('low', 0), ('first', 5), ('second', 5)):
+        queue.enqueue(job_id, {}, priority)
+        clock.now += 1
+
+    claimed = [queue.claim('w').job_id for _ in range(3)]
+
+    assert claimed == ['first', 'second', 'low']
+    assert queue.claim('w') is None
+
+
+def test_batch_in_flight_limit(queue, clock):
+    """Пакет, достигший batch_max_in_flight, пропускается до завершения своей задачи"""
+    queue.enqueue('a1', {}, batch_id='a')
+    clock.now += 1
+    queue.enqueue('a2', {}, batch_id='a')
+    clock.now += 1
+    queue.enqueue('b1', {}, batch_id='b')
+
+    first = queue.claim('w')
+    assert first.job_id == 'a1'
+    assert queue.claim('w').job_id == 'b1'
+    assert queue.claim('w') is None
+
+    assert queue.complete(first)
+    assert queue.claim('w').job_id == 'a2'
+
+
+def test_expired_lease_goes_to_another_worker(queue, clock):
+    """Истекшая аренда: задачу забирает другой worker, старый теряет права на нее"""
+    queue.enqueue('job', {})
+    stale = queue.claim('w1')
+
+    clock.now += 30
+    assert queue.heartbeat(stale)
+    clock.now += 59
+    assert queue.claim('w2') is None  # heartbeat продлил аренду
+
+    clock.now += 2
+    fresh = queue.claim('w2')
+    assert fresh.job_id == 'job'
+    assert fresh.attempts == 2
+
+    assert not queue.heartbeat(stale)
+    assert not queue.complete(stale)
+    assert queue.fail(stale, 'поздно') is None
+    assert queue.stats() == {'running': 1}
+
+    assert queue.complete(fresh)
+    assert queue.stats() == {'done': 1}
+
+
+def test_lease_expired_on_last_attempt_fails_job(queue, clock):
+    """Аренда, истекшая на последней попытке, переводит задачу в failed"""
+    queue.enqueue('job', {})
+    for _ in range(3):
+        assert queue.claim('w') is not None
+        clock.now += 61
+
+    assert queue.claim('w') is None
+    assert queue.stats() == {'failed': 1}
+
+
+def test_retry_backoff(queue, clock):
+    """Задержка повтора удваивается, после max_attempts задача - failed"""
+    queue.enqueue('job', {})
+    delays = []
+
+    for attempt in range(1, 4):
+        job = queue.claim('w')
+        assert job.attempts == attempt
+        delay = queue.fail(job, f'ошибка {attempt}')
+        delays.append(delay)
+        if delay is None:
+            break
+
+        clock.now += delay - 0.5
+        assert queue.claim('w') is None  # задержка еще не истекла
+        clock.now += 0.5
+
+    assert delays == [5.0, 10.0, None]
+    assert queue.stats() == {'failed': 1}
+
+
+def test_retry_backoff_is_capped(tmp_path, clock):
+    """Задержка не превышает max_backoff"""
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), max_attempts=10, retry_backoff=100.0, max_backoff=150.0)
+    queue.enqueue('job', {})
+
+    assert queue.fail(queue.claim('w'), 'ошибка') == 100.0
+    clock.now += 100
+    assert queue.fail(queue.claim('w'), 'ошибка') == 150.0
+    queue.close()
+
+
+def test_release_keeps_attempt(queue):
+    """Остановка worker'а возвращает задачу без траты попытки"""
+    queue.enqueue('job', {})
+    queue.release(queue.claim('w'))
+
+    assert queue.claim('w').attempts == 1
+
+
+def test_enqueue_conflict(queue):
+    """Задачу в очереди или выполняющуюся повторно не поставить; завершенную - можно"""
+    created = []
+
+    assert queue.enqueue('job', {}, on_enqueue=lambda: created.append('job'))
+    assert not queue.enqueue('job', {}, on_enqueue=lambda: created.append('again'))
+
+    job = queue.claim('w')
+    assert not queue.enqueue('job', {})
+
+    queue.complete(job)
+    assert queue.enqueue('job', {}, on_enqueue=lambda: created.append('job'))
+    assert created == ['job', 'job']
+
+
+def test_on_enqueue_runs_inside_transaction(queue):
+    """До COMMIT задачу не видят другие соединения; исключение отменяет постановку"""
+    seen = []
+
+    def check_other_connection():
+        with sqlite3.connect(queue.db_path) as other:
+            seen.append(other.execute("SELECT COUNT(*) FROM jobs").fetchone()[0])
+
+    assert queue.enqueue('job', {}, on_enqueue=check_other_connection)
+    assert seen == [0]
+
+    def fail():
+        raise RuntimeError("хранилище недоступно")
+
+    with pytest.raises(RuntimeError):
+        queue.enqueue('other', {}, on_enqueue=fail)
+    assert queue.stats() == {'queued': 1}
+    assert queue.enqueue('other', {})